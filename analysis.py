@@ -0,0 +1,178 @@
+import json
+import time
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+from storage import page_after
+
+# Analisis butir soal per (mapel, paket) dari koleksi results. Hasil baru dimuat per halaman menjadi
+# matriks siswa x soal (benar/salah) lalu dijumlahkan ke statistik cukup (sufficient statistics)
+# yang disimpan di dokumen item_analysis/{mapel}__{paket}. Semua turunan dihitung vektor dari
+# jumlah-jumlah itu, jadi pembaruan hanya membaca hasil yang masuk sejak cursor ts terakhir:
+#   - tingkat kesukaran p        = proporsi benar
+#   - daya beda (point-biserial) = korelasi benar/salah dengan skor sisa (total tanpa soal itu)
+#   - sebaran pilihan PG tunggal (distraktor; huruf opsi A, B, ... untuk hasil format ringkas)
+#   - reliabilitas KR-20
+
+COLL = 'item_analysis'
+PAGE = 5000
+LAG = 120          # detik; hasil yang baru di-commit belum dihitung agar cursor ts tidak melompatinya
+BLANK = '(kosong)'
+SUMS = ['n', 'sx', 'st', 'st2', 'sxt']  # per soal
+
+
+def doc_id(mapel, paket):
+    return f"{mapel}__{paket}"
+
+
+def empty(mapel, paket):
+    return {'mapel': mapel, 'paket': paket, 'cursor': None, 'cursor_ids': [], 'updated_at': 0.0,
+            'attempts': 0, 'sum_t': 0.0, 'sum_t2': 0.0,
+            'items': [], 'single': [], **{k: [] for k in SUMS}, 'options': {}}
+
+
+def _legacy(rows):
+    """Hasil format lama: details JSON per hasil."""
+    dets = [json.loads(r.get('details') or '[]') for r in rows]
+    flat = list(chain.from_iterable(dets))
+    lens = np.fromiter(map(len, dets), int, len(dets))
+    # Hasil sangat lama belum menyimpan qid: pakai teks soal sebagai kunci butir
+    qid = np.array([d.get('qid') or d.get('tanya', '') for d in flat], dtype=object)
+    benar = np.fromiter(map(itemgetter('benar'), flat), bool, len(flat))
+    single = np.fromiter(map(type, map(itemgetter('kunci'), flat)), object, len(flat)) == str
+    ans = np.fromiter(map(itemgetter('jawab'), flat), object, len(flat))
+    ans[np.fromiter(map(type, ans), object, len(ans)) != str] = BLANK
+    return lens, qid, benar, single, ans
+
+
+def _compact(rows):
+    """Hasil format ringkas: qid, kode jawaban, tipe, dan bitmap benar dibaca tanpa parsing JSON."""
+    lens = np.fromiter((len(r['q_ids']) for r in rows), int, len(rows))
+    qid = np.fromiter(chain.from_iterable(r['q_ids'] for r in rows), object, int(lens.sum()))
+    code = np.fromiter(chain.from_iterable(r['codes'] for r in rows), int, int(lens.sum()))
+    single = np.frombuffer(''.join(r['tipe'] for r in rows).encode(), 'S1') == b's'
+    # Bitmap tiap hasil dipadatkan per byte: buka sekaligus lalu ambil bit sesuai posisi
+    nbytes = (lens + 7) // 8
+    bits = np.unpackbits(np.frombuffer(bytes.fromhex(''.join(r['bits'] for r in rows)), np.uint8), bitorder='little')
+    start = np.repeat(np.cumsum(nbytes * 8) - nbytes * 8, lens)
+    pos = np.arange(int(lens.sum())) - np.repeat(np.cumsum(lens) - lens, lens)
+    benar = bits[start + pos].astype(bool)
+    # Pilihan PG tunggal sebagai huruf opsi
+    letters = np.array([BLANK] + [chr(65 + i) for i in range(26)] + ['?'], dtype=object)
+    ans = letters[np.where((code >= 0) & (code <= 26), code, 27)]
+    return lens, qid, benar, single, ans
+
+
+def _columns(rows):
+    """Ratakan sekumpulan hasil menjadi kolom sejajar: (jumlah hasil, baris, qid, benar, PG tunggal?, pilihan)."""
+    parts = [f(g) for f, g in ((_compact, [r for r in rows if 'q_ids' in r]),
+                               (_legacy, [r for r in rows if 'q_ids' not in r])) if g]
+    lens = np.concatenate([p[0] for p in parts])
+    row = np.repeat(np.arange(len(lens)), lens)
+    return (len(lens), row, *(np.concatenate([p[i] for p in parts]) for i in range(1, 5)))
+
+
+def _absorb(state, rows):
+    n_rows, row, qid, benar, is_single, ans = _columns(rows)
+    if not n_rows: return
+
+    # Petakan qid ke kolom matriks; butir baru ditambahkan di ujung
+    uniq, inv = np.unique(qid.astype(str), return_inverse=True)
+    pos = {q: i for i, q in enumerate(state['items'])}
+    for q in uniq:
+        if q not in pos:
+            pos[q] = len(state['items']); state['items'].append(q); state['single'].append(False)
+            for k in SUMS: state[k].append(0.0)
+    col = np.array([pos[q] for q in uniq], dtype=int)[inv]
+    n_items = len(state['items'])
+
+    # Jumlah langsung dari triple (baris, kolom, benar): O(jawaban), bukan matriks baris x seluruh butir paket
+    # (ujian kisi-kisi hanya memakai sebagian bank soal). Butir yang muncul dua kali dalam satu hasil
+    # (hasil lama berkunci teks soal) dihitung sekali, putusan terakhir yang dipakai.
+    key = row * n_items + col
+    _, last = np.unique(key[::-1], return_index=True)
+    keep = len(key) - 1 - last
+    r, c, b = row[keep], col[keep], benar[keep].astype(float)
+    t = np.bincount(r, weights=b, minlength=n_rows)
+    tr = t[r]
+    state['attempts'] += n_rows
+    state['sum_t'] += float(t.sum())
+    state['sum_t2'] += float((t ** 2).sum())
+    add = {'n': np.bincount(c, minlength=n_items), 'sx': np.bincount(c, weights=b, minlength=n_items),
+           'st': np.bincount(c, weights=tr, minlength=n_items), 'st2': np.bincount(c, weights=tr ** 2, minlength=n_items),
+           'sxt': np.bincount(c, weights=b * tr, minlength=n_items)}
+    for k in SUMS: state[k] = (np.asarray(state[k]) + add[k]).tolist()
+
+    single = np.asarray(state['single'], bool); single[col[is_single]] = True
+    state['single'] = single.tolist()
+
+    # Sebaran pilihan PG tunggal: hitung pasangan (kolom, pilihan) sekaligus dengan np.unique
+    mask = single[col]
+    opts, code = np.unique(ans[mask].astype(str), return_inverse=True)
+    pairs, counts = np.unique(col[mask] * len(opts) + code, return_counts=True)
+    for p, c in zip(pairs.tolist(), counts.tolist()):
+        per = state['options'].setdefault(state['items'][p // len(opts)], {})
+        opt = str(opts[p % len(opts)])
+        per[opt] = per.get(opt, 0) + c
+
+
+def refresh(db, mapel, paket, state=None, now=None):
+    """Tambahkan hasil baru sejak cursor ke state (dibaca dari storage bila tidak diberikan) lalu simpan."""
+    state = state or db.get(COLL, doc_id(mapel, paket)) or empty(mapel, paket)
+    until = (now or time.time()) - LAG
+    where = [('mapel', '==', mapel), ('paket', '==', paket)]
+    # ts bisa kembar (hasil lama per menit): cursor = ts terakhir + ID yang sudah dihitung pada ts itu.
+    # State lama hanya menyimpan ts (start_after): semua hasil pada ts itu dianggap sudah terlewati.
+    if state['cursor'] is not None and 'cursor_ids' not in state:
+        state['cursor_ids'] = [r['id'] for r in db.query('results', where + [('ts', '==', state['cursor'])], fields=[])]
+    cursor = (state['cursor'], state.get('cursor_ids', []))
+    changed = False
+    while True:
+        rows, cursor, done = page_after(db, 'results', where + [('ts', '<=', until)], 'ts', cursor, PAGE,
+                                        fields=['ts', 'details', 'q_ids', 'codes', 'tipe', 'bits'])
+        if rows:
+            _absorb(state, rows)
+            state['cursor'], state['cursor_ids'] = cursor[0], list(cursor[1]); changed = True
+        if done: break
+    if changed:
+        state['updated_at'] = time.time()
+        db.set(COLL, doc_id(mapel, paket), state)
+    return state
+
+
+def rebuild(db, mapel, paket):
+    return refresh(db, mapel, paket, state=empty(mapel, paket))
+
+
+def report(state):
+    """Statistik per butir (array numpy sejajar dengan state['items']) dan KR-20 paket."""
+    n = np.asarray(state['n']); sx = np.asarray(state['sx'])
+    st, st2, sxt = np.asarray(state['st']), np.asarray(state['st2']), np.asarray(state['sxt'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = sx / n
+        # Skor sisa r = t - x (x biner, jadi x^2 = x)
+        sr, sr2, sxr = st - sx, st2 - 2 * sxt + sx, sxt - sx
+        cov = sxr / n - p * sr / n
+        var_r = sr2 / n - (sr / n) ** 2
+        rpb = cov / np.sqrt(p * (1 - p) * var_r)
+    rpb = np.where(np.isfinite(rpb), rpb, np.nan)
+
+    k = int((n > 0).sum())
+    m = state['attempts']
+    var_t = state['sum_t2'] / m - (state['sum_t'] / m) ** 2 if m else 0.0
+    pq = np.nansum(p * (1 - p))
+    kr20 = k / (k - 1) * (1 - pq / var_t) if k > 1 and var_t > 0 else float('nan')
+    return {'items': state['items'], 'n': n, 'p': p, 'rpb': rpb,
+            'options': state['options'], 'kr20': kr20, 'attempts': m}
+
+
+def difficulty_label(p):
+    if np.isnan(p): return '-'
+    return 'Sukar' if p < 0.3 else 'Mudah' if p > 0.7 else 'Sedang'
+
+
+def discrimination_label(r):
+    if np.isnan(r): return '-'
+    return 'Baik' if r >= 0.3 else 'Cukup' if r >= 0.2 else 'Perlu revisi'
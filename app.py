@@ -1,14 +1,29 @@
 import streamlit as st
-import pandas as pd
 import time
 import json
-import base64
+import os
 import io
-import random
+import tempfile
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
-import altair as alt
+from storage import new_id, open_storage, page_after
+from bank import QuestionBank
+from cache import open_cache
+import autosave
+from autosave import AnswerBuffer
+from images import DbImageStore, InvalidImage, LocalImageStore, is_ref
+import stats as class_stats
+import qindex
+import analysis
+import blueprint
+import export
+import metrics
+import profiles
+from importer import import_questions, validate
+from auth import hash_password, make_token, verify_password, verify_token
+from finalizer import (INTERVAL, build_result, commit_results, paket_keys, paket_plan, paket_policy, paket_version,
+                       rescore, result_id, score_sessions, start_worker)
+from compact import decode, migrate
+from scoring import POLICIES, policy_of
 
 # --- 1. KONFIGURASI HALAMAN ---
 st.set_page_config(
@@ -18,26 +33,25 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Init Font
-if 'font_size' not in st.session_state: st.session_state['font_size'] = 18
-
 # --- 2. CSS CUSTOM (PREMIUM & CLEAN UI) ---
-st.markdown(f"""
+# CSS statis dibuat sekali per proses; tiap rerun hanya mengirim string yang sama (tanpa format ulang).
+# Ukuran huruf soal diatur lewat variabel CSS --font-size yang di-override per sesi.
+CSS = """
 <style>
     /* VARIABEL WARNA */
-    :root {{
+    :root {
         --primary: #4F46E5;
         --secondary: #EC4899;
         --bg: #F3F4F6;
-    }}
+    }
     
     /* HILANGKAN HEADER BAWAAN */
-    [data-testid="stHeader"] {{ display: none; }}
-    footer {{ visibility: hidden; }}
-    .stDeployButton {{ display: none; }}
+    [data-testid="stHeader"] { display: none; }
+    footer { visibility: hidden; }
+    .stDeployButton { display: none; }
 
     /* HEADER GRADASI */
-    .header-bar {{
+    .header-bar {
         background: linear-gradient(135deg, #4F46E5 0%, #7C3AED 100%);
         padding: 20px 30px;
         color: white;
@@ -45,32 +59,32 @@ st.markdown(f"""
         box-shadow: 0 4px 15px rgba(0,0,0,0.1);
         margin-bottom: 30px;
         display: flex; justify-content: space-between; align-items: center;
-    }}
+    }
 
     /* KARTU SOAL */
-    .soal-box {{
+    .soal-box {
         background: white;
         padding: 30px;
         border-radius: 15px;
         border: 1px solid #e5e7eb;
         box-shadow: 0 4px 6px rgba(0,0,0,0.05);
-        font-size: {st.session_state['font_size']}px;
+        font-size: var(--font-size, 18px);
         line-height: 1.8;
         min-height: 300px;
         margin-bottom: 20px;
-    }}
+    }
 
     /* NAVIGASI NOMOR (GRID) */
-    .grid-container {{
+    .grid-container {
         background: white;
         padding: 20px;
         border-radius: 15px;
         border: 1px solid #e5e7eb;
         margin-top: 20px;
-    }}
+    }
 
     /* TIMER STICKY */
-    .timer-badge {{
+    .timer-badge {
         background-color: #DBEAFE;
         color: #1E40AF;
         padding: 8px 16px;
@@ -82,166 +96,302 @@ st.markdown(f"""
         text-align: center;
         width: fit-content;
         margin-left: auto;
-    }}
+    }
 
     /* SCORE CARD (LINGKARAN NILAI) */
-    .score-card {{
+    .score-card {
         background: white;
         padding: 40px;
         border-radius: 20px;
         text-align: center;
         box-shadow: 0 10px 25px rgba(0,0,0,0.1);
         margin-bottom: 20px;
-    }}
-    .score-big {{
+    }
+    .score-big {
         font-size: 4rem;
         font-weight: 900;
         color: #4F46E5;
         margin: 0;
-    }}
+    }
     
     /* ANALISIS BOX */
-    .analysis-box {{
+    .analysis-box {
         padding: 15px; border-radius: 10px; margin-bottom: 10px;
-    }}
-    .box-good {{ background: #DCFCE7; color: #166534; border: 1px solid #86EFAC; }}
-    .box-bad {{ background: #FEE2E2; color: #991B1B; border: 1px solid #FCA5A5; }}
+    }
+    .box-good { background: #DCFCE7; color: #166534; border: 1px solid #86EFAC; }
+    .box-bad { background: #FEE2E2; color: #991B1B; border: 1px solid #FCA5A5; }
 
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Init Font
+if 'font_size' not in st.session_state: st.session_state['font_size'] = 18
+# Isi hanya <style>: Streamlit menaruhnya di event container, tidak memakan ruang layout
+st.html(CSS)
+st.html(f"<style>:root {{ --font-size: {st.session_state['font_size']}px; }}</style>")
 
 # --- 3. KONEKSI DATABASE ---
 @st.cache_resource
 def get_db():
-    try:
-        if not firebase_admin._apps:
-            key_dict = json.loads(json.dumps(dict(st.secrets["firebase"])))
-            cred = credentials.Certificate(key_dict)
-            firebase_admin.initialize_app(cred)
-        return firestore.client()
+    # Backend dipilih lewat secrets [storage] backend = "firestore" (default) | "sqlite".
+    # Semua operasi dihitung per halaman/fungsi (tab Performa); secrets [metrics] enabled = false mematikannya.
+    try: conf, mconf = dict(st.secrets.get("storage", {})), dict(st.secrets.get("metrics", {}))
+    except: conf, mconf = {}, {}
+    try: raw = open_storage(conf, lambda: json.loads(json.dumps(dict(st.secrets["firebase"]))))
     except: return None
+    return metrics.MeteredStorage(raw) if mconf.get("enabled", True) else raw
 
 db = get_db()
 if not db: st.error("Database Error. Cek Secrets."); st.stop()
 
+@st.cache_resource
+def get_cache():
+    # Tier cache bersama antar replika: secrets [cache] backend = "local" | "redis" (tanpa backend: per proses saja)
+    try: conf = dict(st.secrets.get("cache", {}))
+    except: conf = {}
+    return open_cache(conf)
+
+shared = get_cache()
+
+@st.cache_resource
+def get_bank():
+    return QuestionBank(shared=shared)
+
+bank = get_bank()
+
+@st.cache_resource
+def start_finalizer():
+    # Satu worker per proses: sesi kedaluwarsa yang ditinggal siswa (tab ditutup) dinilai otomatis.
+    # secrets [finalizer] interval = 0 mematikannya, mis. bila finalizer.py dijalankan terpisah.
+    try: interval = st.secrets.get("finalizer", {}).get("interval", INTERVAL)
+    except: interval = INTERVAL
+    return start_worker(db, bank, interval) if interval else None
+
+start_finalizer()
+
+def answer_buffer(answers=None, ragu=None):
+    # secrets [autosave] interval (detik) / max_dirty (soal); interval = inf: flush hanya karena max_dirty / eksplisit
+    try: conf = dict(st.secrets.get("autosave", {}))
+    except: conf = {}
+    return AnswerBuffer(answers, ragu, float(conf.get('interval', autosave.INTERVAL)), int(conf.get('max_dirty', autosave.MAX_DIRTY)))
+
+@st.cache_resource
+def get_image_store():
+    try: conf = dict(st.secrets.get("images", {}))
+    except: conf = {}
+    if conf.get("backend") == "local": return LocalImageStore(conf.get("path", "data/images"))
+    return DbImageStore(db)
+
+images = get_image_store()
+
+@st.cache_resource
+def get_auth_secret():
+    # secrets [auth] secret / CAT_AUTH_SECRET; kalau tidak diset, dibuat sekali dan disimpan di
+    # storage agar semua proses (dan restart) memakai kunci yang sama
+    try: secret = st.secrets.get("auth", {}).get("secret")
+    except: secret = None
+    secret = secret or os.environ.get("CAT_AUTH_SECRET")
+    if secret: return secret
+    def run(tx):
+        doc = tx.get('meta', 'auth')
+        if doc: return doc['secret']
+        new = os.urandom(32).hex(); tx.set('meta', 'auth', {'secret': new}); return new
+    return db.transaction(run)
+
+auth_secret = get_auth_secret()
+
+@st.cache_resource
+def backfill_results():
+    # Migrasi sekali jalan: hasil lama tanpa ts mendapat ts dari tanggal agar muncul di riwayat siswa
+    return class_stats.backfill_ts(db)
+
+backfill_results()
+
 # --- 4. LOGIC ---
+def login_as(username, nama, role):
+    st.session_state.update({'logged_in':True, 'role':role, 'nama':nama, 'username':username})
+    st.query_params["token"] = make_token(auth_secret, username, nama, role)
+
 def auto_login():
-    try:
-        qp = st.query_params
-        token = qp.get("token", None)
-        if token and not st.session_state.get('logged_in'):
-            if token == 'admin':
-                st.session_state.update({'logged_in':True, 'role':'admin', 'nama':'Guru Admin', 'username':'admin'})
-            else:
-                doc = db.collection('users').document(token).get()
-                if doc.exists:
-                    d = doc.to_dict()
-                    st.session_state.update({'logged_in':True, 'role':'siswa', 'nama':d['nama_lengkap'], 'username':d['username']})
-    except: pass
+    # Token ditandatangani server: sambung ulang tidak perlu membaca database
+    token = st.query_params.get("token", None)
+    if token and not st.session_state.get('logged_in'):
+        claims = verify_token(auth_secret, token)
+        if claims: st.session_state.update({'logged_in':True, **claims})
+        else: del st.query_params["token"]
 
 auto_login()
 
 def process_image(uploaded_file):
-    if uploaded_file:
-        bytes_data = uploaded_file.getvalue()
-        base64_str = base64.b64encode(bytes_data).decode()
-        return f"data:image/png;base64,{base64_str}"
-    return None
+    # None = tanpa gambar; False = file bukan gambar yang valid (pesan error sudah ditampilkan)
+    if not uploaded_file: return None
+    try: return images.put(uploaded_file.getvalue())
+    except InvalidImage:
+        st.error(f"{uploaded_file.name} bukan gambar PNG/JPG yang valid"); return False
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def load_image(ref, size='md'):
+    # Referensi 'img:<hash>' tidak pernah berubah isinya, jadi aman di-cache lintas sesi
+    data = images.get(ref, size)
+    if data is None: raise KeyError(ref)
+    return data
+
+def image_src(gambar, size='md'):
+    # Soal lama masih menyimpan data URI base64 langsung di field 'gambar'
+    if not is_ref(gambar): return gambar
+    try: return load_image(gambar, size)
+    except KeyError: return None
 
+def load_paket(mapel, paket):
+    return db.query('questions', [('mapel', '==', mapel), ('paket', '==', paket)])
+
+def get_question(qid):
+    data = st.session_state['exam_data']
+    return bank.get(data['mapel'], data['paket'], qid, load_paket)
+
+@metrics.track()
 def init_exam(mapel, paket):
     session_id = f"{st.session_state['username']}_{mapel}_{paket}"
-    doc_ref = db.collection('exam_sessions').document(session_id)
-    doc = doc_ref.get()
+    data = db.get('exam_sessions', session_id)
     
     start_new = True
-    if doc.exists:
-        data = doc.to_dict()
+    if data:
         if data.get('status') == 'ongoing':
             now = datetime.now().timestamp()
             if now < data.get('end_time', 0):
+                answers, ragu = data.get('answers', {}), data.get('ragu', [])
+                if isinstance(answers, str) or isinstance(ragu, str):
+                    # Sesi format lama (JSON string): ubah sekali ke map agar bisa di-update per soal
+                    answers = json.loads(answers) if isinstance(answers, str) else answers
+                    ragu = json.loads(ragu) if isinstance(ragu, str) else ragu
+                    db.update('exam_sessions', session_id, {'answers': answers, 'ragu': ragu})
                 st.session_state.update({
                     'exam_data': data, 'q_order': json.loads(data['q_order']),
-                    'answers': json.loads(data['answers']), 'ragu': json.loads(data.get('ragu', '[]')),
+                    'answers': answers, 'ragu': ragu, 'autosave': answer_buffer(answers, ragu),
                     'curr_idx': 0, 'exam_mode': True
                 })
                 start_new = False
                 st.toast("Melanjutkan sesi...", icon="🔄")
+            else:
+                # Waktu habis tapi worker belum menilainya: nilai dulu lewat transaksi yang sama dengan finalizer
+                # (dilewati bila sudah dinilai pihak lain) sebelum ID sesi dipakai untuk percobaan baru
+                if commit_results(db, score_sessions(db, bank, [{**data, 'id': session_id}])):
+                    st.session_state.pop('hist', None); st.session_state.pop('profile', None)
     
     if start_new:
-        q_ref = db.collection('questions').where('mapel', '==', mapel).where('paket', '==', paket).stream()
-        q_list = [{'id': q.id, **q.to_dict()} for q in q_ref]
+        if not bank.get_paket(mapel, paket, load_paket): st.error("Soal tidak ditemukan."); return False
         
-        if not q_list: st.error("Soal tidak ditemukan."); return False
-        
-        random.shuffle(q_list)
-        q_order = [q['id'] for q in q_list]
+        # Soal dirakit dari indeks strata paket sesuai kisi-kisi; seed disimpan agar bisa dirakit ulang
         start_ts = datetime.now().timestamp()
+        seed = f"{st.session_state['username']}:{mapel}:{paket}:{int(start_ts)}"
+        plan = paket_plan(db, bank, mapel, paket)
+        try: q_order = blueprint.assemble(bank.get_derived(mapel, paket, 'strata', blueprint.strata_index, load_paket), plan, seed)
+        except ValueError as e: st.error(str(e)); return False
         
         new_data = {
-            'username': st.session_state['username'], 'mapel': mapel, 'paket': paket,
-            'start_time': start_ts, 'end_time': start_ts + (75*60),
-            'q_order': json.dumps(q_order), 'answers': "{}", 'ragu': "[]",
+            'username': st.session_state['username'], 'nama': st.session_state['nama'], 'mapel': mapel, 'paket': paket,
+            'start_time': start_ts, 'end_time': start_ts + (plan or {}).get('durasi', blueprint.DURASI)*60,
+            'q_order': json.dumps(q_order), 'seed': seed, 'answers': {}, 'ragu': [],
             'status': 'ongoing', 'score': 0
         }
-        doc_ref.set(new_data)
+        db.set('exam_sessions', session_id, new_data)
         st.session_state.update({
-            'exam_data': new_data, 'q_order': q_order, 'answers': {}, 'ragu': [], 'curr_idx': 0, 'exam_mode': True
+            'exam_data': new_data, 'q_order': q_order, 'answers': {}, 'ragu': [], 'autosave': answer_buffer(),
+            'curr_idx': 0, 'exam_mode': True
         })
     return True
 
-def save_realtime():
-    sid = f"{st.session_state['username']}_{st.session_state['exam_data']['mapel']}_{st.session_state['exam_data']['paket']}"
-    db.collection('exam_sessions').document(sid).update({
-        'answers': json.dumps(st.session_state['answers']),
-        'ragu': json.dumps(st.session_state['ragu'])
-    })
+def session_id():
+    data = st.session_state['exam_data']
+    return f"{st.session_state['username']}_{data['mapel']}_{data['paket']}"
+
+def set_answer(qid, value):
+    cur = st.session_state['answers'].get(qid)
+    if value == cur or (not value and not cur): return
+    st.session_state['answers'][qid] = value
+    st.session_state['autosave'].mark(qid)
+
+def toggle_ragu(qid):
+    if qid in st.session_state['ragu']: st.session_state['ragu'].remove(qid)
+    else: st.session_state['ragu'].append(qid)
+    st.session_state['autosave'].mark_ragu()
 
+def pending_updates():
+    # Hanya field yang berubah: answers.<qid> dan (jika berubah) ragu
+    ans, ragu = st.session_state['autosave'].changes(st.session_state['answers'], st.session_state['ragu'])
+    upd = {('answers', qid): v for qid, v in ans.items()}
+    if ragu is not None: upd['ragu'] = ragu
+    return upd
+
+@metrics.track()
+def save_realtime(force=False):
+    buf = st.session_state['autosave']
+    if not (force or buf.due()): return
+    upd = pending_updates()
+    if upd: db.update('exam_sessions', session_id(), upd)
+    buf.committed(st.session_state['answers'], st.session_state['ragu'])
+
+@metrics.track()
 def calculate_score():
-    q_ids = st.session_state['q_order']
-    ans = st.session_state['answers']
-    score = 0
-    topic_stats = {} # {topik: {correct:0, total:0}}
-    details = []
+    data = st.session_state['exam_data']; sid = session_id()
+    keys = paket_keys(db, bank, data['mapel'], data['paket'], st.session_state['q_order'])
+    result, _, topic_stats = build_result(data, st.session_state['answers'], keys, st.session_state['nama'],
+                                          version=paket_version(db, bank, data['mapel'], data['paket']),
+                                          policy=paket_policy(db, bank, data['mapel'], data['paket']))
     
-    for qid in q_ids:
-        q_doc = db.collection('questions').document(qid).get()
-        if not q_doc.exists: continue
-        q = q_doc.to_dict()
-        user_ans = ans.get(qid)
-        try: key = json.loads(q['kunci_jawaban'])
-        except: key = q['kunci_jawaban']
-        
-        is_correct = False
-        if q['tipe'] == 'single' and user_ans == key: is_correct = True
-        elif q['tipe'] == 'complex' and user_ans and set(user_ans) == set(key): is_correct = True
-        elif q['tipe'] == 'category' and user_ans == key: is_correct = True
-        
-        if is_correct: score += 1
-        
-        # Analisis Topik
-        topik = q.get('topik', 'Umum')
-        if topik not in topic_stats: topic_stats[topik] = {'correct':0, 'total':0}
-        topic_stats[topik]['total'] += 1
-        if is_correct: topic_stats[topik]['correct'] += 1
-        
-        details.append({'tanya': q['pertanyaan'], 'jawab': user_ans, 'kunci': key, 'benar': is_correct, 'topik': topik})
-        
-    final = (score / len(q_ids)) * 100
-    
-    sid = f"{st.session_state['username']}_{st.session_state['exam_data']['mapel']}_{st.session_state['exam_data']['paket']}"
-    db.collection('exam_sessions').document(sid).update({'status': 'completed', 'score': final})
-    
-    db.collection('results').add({
-        'username': st.session_state['username'], 'nama': st.session_state['nama'],
-        'mapel': st.session_state['exam_data']['mapel'], 'paket': st.session_state['exam_data']['paket'],
-        'skor': final, 'tanggal': datetime.now().strftime("%Y-%m-%d %H:%M"),
-        'details': json.dumps(details, default=str),
-        'topic_analysis': json.dumps(topic_stats)
-    })
-    return final, details, topic_stats
+    # Sisa jawaban yang belum di-flush, status sesi, dokumen hasil, dan statistik kelas
+    # ditulis dalam satu transaksi atomik (jalur yang sama dengan finalizer)
+    rid = result_id(sid, data)
+    if not commit_results(db, [(sid, rid, {**pending_updates(), 'status': 'completed', 'score': result['skor']}, result)]):
+        # Waktu habis dan finalizer sudah menilai sesi ini lebih dulu: pakai hasil yang tersimpan
+        result = db.get('results', rid) or result
+        topic_stats = json.loads(result['topic_analysis'])
+    st.session_state['autosave'].committed(st.session_state['answers'], st.session_state['ragu'])
+    st.session_state.pop('hist', None); st.session_state.pop('profile', None)
+    return result, topic_stats
+
+@metrics.track()
+def result_details(res):
+    # Pembahasan dari hasil ringkas: teks soal, opsi & kunci diambil dari bank soal (format lama: details)
+    if 'details' in res: return json.loads(res['details'])
+    if res.get('paket_version') not in (None, paket_version(db, bank, res['mapel'], res['paket'])):
+        st.caption("ℹ️ Soal paket ini sudah diubah sejak ujian; yang tampil adalah versi terbaru.")
+    return decode(res, paket_keys(db, bank, res['mapel'], res['paket'], res['q_ids']))
+
+@metrics.track()
+def progress_profile():
+    # Profil kemajuan ikut diperbarui di transaksi hasil: satu read per layar hasil, disimpan sampai ujian berikutnya
+    if 'profile' not in st.session_state: st.session_state['profile'] = db.get(profiles.COLL, st.session_state['username'])
+    return st.session_state['profile']
+
+HIST_PAGE = 10
+HIST_FIELDS = ['ts', 'tanggal', 'mapel', 'paket', 'skor', 'topic_analysis']
+
+@metrics.track()
+def fetch_history(h):
+    # Ringkasan saja (tanpa details), terbaru dulu. Cursor aman untuk ts kembar (hasil lama ber-ts per menit).
+    # Firestore butuh composite index results(username ASC, ts DESC).
+    rows, h['cursor'], h['done'] = page_after(db, 'results', [('username', '==', st.session_state['username'])], 'ts',
+                                              h.get('cursor'), HIST_PAGE, desc=True, fields=HIST_FIELDS)
+    for r in rows:
+        r['topic_analysis'] = json.loads(r.get('topic_analysis') or '{}'); h['rows'].append(r)
+
+def history():
+    # Disimpan di session_state: rerun berikutnya tidak membaca database lagi
+    if 'hist' not in st.session_state:
+        st.session_state['hist'] = {'rows': [], 'done': False, 'det': {}}
+        fetch_history(st.session_state['hist'])
+    return st.session_state['hist']
+
+@metrics.track()
+def history_result(h, rid):
+    # Dokumen ringkas di-cache per sesi; pembahasan dirakit ulang dari bank soal (di memori)
+    if rid not in h['det']: h['det'][rid] = db.get('results', rid)
+    return h['det'][rid]
 
 # --- 5. HALAMAN UTAMA ---
 
+@metrics.track(page='login')
 def login_page():
     st.markdown("<br><br>", unsafe_allow_html=True)
     c1, c2, c3 = st.columns([1,2,1])
@@ -256,129 +406,298 @@ def login_page():
                 p = st.text_input("Password", type="password")
                 if st.form_submit_button("Masuk", use_container_width=True, type="primary"):
                     if u=="admin" and p=="admin123":
-                        st.session_state.update({'logged_in':True, 'role':'admin', 'nama':'Admin', 'username':'admin'})
-                        st.query_params["token"]="admin"; st.rerun()
+                        login_as('admin', 'Admin', 'admin'); st.rerun()
                     else:
-                        users = db.collection('users').where('username','==',u).where('password','==',p).stream()
-                        found = False
-                        for user in users:
-                            d = user.to_dict()
-                            st.session_state.update({'logged_in':True, 'role':'siswa', 'nama':d['nama_lengkap'], 'username':d['username']})
-                            st.query_params["token"]=d['username']; found=True; st.rerun()
-                        if not found: st.error("Akun salah")
+                        # Dokumen user ber-ID username: satu lookup langsung, lalu cek hash password
+                        d = db.get('users', u) if u else None
+                        valid, upgrade = verify_password(d.get('password') if d else None, p)
+                        if valid:
+                            if upgrade: db.update('users', u, {'password': hash_password(p)})
+                            login_as(d['username'], d['nama_lengkap'], 'siswa'); st.rerun()
+                        else: st.error("Akun salah")
         with t2:
             with st.form("r"):
                 nu = st.text_input("Username Baru"); nn = st.text_input("Nama Lengkap"); np = st.text_input("Password", type="password")
                 if st.form_submit_button("Daftar"):
                     if nu and nn and np:
-                        if db.collection('users').document(nu).get().exists: st.error("Username dipakai.")
+                        if db.get('users', nu): st.error("Username dipakai.")
                         else:
-                            db.collection('users').document(nu).set({'username':nu,'password':np,'nama_lengkap':nn,'role':'siswa'})
+                            db.set('users', nu, {'username':nu,'password':hash_password(np),'nama_lengkap':nn,'role':'siswa'})
                             st.success("Berhasil! Silakan Login.")
         st.markdown("</div>", unsafe_allow_html=True)
 
+USER_PAGE = 20
+
+@metrics.track()
+def user_page(field, prefix, cursor):
+    # Tanpa field password; Firestore butuh composite index users(role, username) & users(role, nama_lengkap).
+    # Nama bisa kembar: cursor = (nama terakhir, id yang sudah tampil dengan nama itu), lihat storage.page_after
+    where = [('role', '==', 'siswa')]
+    if prefix: where += [(field, '>=', prefix), (field, '<', prefix + '\uf8ff')]
+    rows, nxt, done = page_after(db, 'users', where, field, cursor, USER_PAGE, fields=['username', 'nama_lengkap'])
+    return rows, nxt, not done
+
+@metrics.track(page='admin')
 def admin_dashboard():
+    # pandas hanya dipakai panel admin: diimpor di sini agar start awal & halaman siswa tidak menanggungnya
+    import pandas as pd
     st.markdown(f"<div class='header-bar'><div><h2 style='margin:0'>Admin Panel</h2></div><a href='/?logout=true' style='color:white;text-decoration:none;border:1px solid white;padding:5px 15px;border-radius:10px;'>Keluar</a></div>", unsafe_allow_html=True)
     if st.query_params.get("logout"): st.query_params.clear(); st.session_state.clear(); st.rerun()
     
-    t1, t2, t3, t4, t5 = st.tabs(["📊 Statistik", "📝 Input Soal", "📂 Upload Teks", "🛠️ Edit Soal", "👥 Siswa"])
+    # Tab malas: hanya tab yang sedang dibuka yang dijalankan (dan membaca database)
+    t1, t2, t3, t4, t5, t6, t7 = st.tabs(["📊 Statistik", "📝 Input Soal", "📂 Upload Teks", "🛠️ Edit Soal", "👥 Siswa", "🔬 Analisis Butir", "⚡ Performa"], key="adm_tab", on_change="rerun")
     
-    with t1:
-        st.subheader("Statistik Kelas")
-        results = list(db.collection('results').stream())
-        if results:
-            df = pd.DataFrame([r.to_dict() for r in results])
-            c1, c2, c3, c4 = st.columns(4)
-            c1.metric("Total Ujian", len(df))
-            c2.metric("Rata-Rata", f"{df['skor'].mean():.1f}")
-            c3.metric("Tertinggi", f"{df['skor'].max():.1f}")
-            c4.metric("Siswa Aktif", len(df['username'].unique()))
+    if t1.open:
+        with t1:
+            c_h, c_r = st.columns([4,1])
+            c_h.subheader("Statistik Kelas")
+            if c_r.button("🔄 Hitung Ulang", help="Bangun ulang statistik, papan peringkat & profil siswa dari seluruh hasil ujian (sekaligus melengkapi urutan riwayat hasil lama)"):
+                try:
+                    with st.spinner("Menghitung ulang..."): n, n_prof = class_stats.rebuild(db), profiles.rebuild(db)
+                    if shared: shared.delete(class_stats.SUMMARY_KEY)
+                    st.success(f"{n} paket & {n_prof} profil siswa diperbarui")
+                except class_stats.Busy as e: st.warning(str(e))
+            if c_r.button("🗜️ Ringkas Hasil Lama", help="Ubah hasil format lama (details lengkap) ke format ringkas"):
+                with st.spinner("Memigrasi hasil..."):
+                    info = st.empty(); n = migrate(db, bank, lambda n: info.caption(f"{n} hasil dimigrasi..."))
+                info.empty()
+                st.success(f"{n} hasil dimigrasi")
+            sm = class_stats.cached_summary(db, shared)
+            if sm['count']:
+                c1, c2, c3, c4 = st.columns(4)
+                c1.metric("Total Ujian", sm['count'])
+                c2.metric("Rata-Rata", f"{sm['mean']:.1f}")
+                c3.metric("Tertinggi", f"{sm['max']:.1f}")
+                c4.metric("Siswa Aktif", sm['users'])
             
-            st.divider()
-            c_a, c_b = st.columns([2,1])
-            with c_a:
-                st.write("##### Sebaran Nilai")
-                ch = alt.Chart(df).mark_bar().encode(x=alt.X('skor', bin=True), y='count()', color='mapel').interactive()
-                st.altair_chart(ch, use_container_width=True)
-            with c_b:
-                st.write("##### Top 10 Siswa")
-                st.dataframe(df[['nama','skor']].sort_values('skor',ascending=False).head(10), hide_index=True)
-        else: st.info("Belum ada data.")
+                st.divider()
+                c_a, c_b = st.columns([2,1])
+                with c_a:
+                    st.write("##### Sebaran Nilai")
+                    import altair as alt
+                    w = 100 / class_stats.BINS
+                    hist = pd.DataFrame([{'skor': f"{i*w:.0f}-{(i+1)*w:.0f}", 'jumlah': n, 'mapel': m}
+                                         for m, h in sm['hist'].items() for i, n in enumerate(h)])
+                    ch = alt.Chart(hist).mark_bar().encode(x=alt.X('skor', sort=None), y='jumlah', color='mapel').interactive()
+                    st.altair_chart(ch, use_container_width=True)
+                with c_b:
+                    st.write("##### Top 10 Siswa")
+                    st.dataframe(pd.DataFrame(sm['top'], columns=['nama','skor']), hide_index=True)
+            else: st.info("Belum ada data.")
 
-    with t2:
-        st.subheader("Input Soal")
-        cm, ct = st.columns(2)
-        in_mapel = cm.selectbox("Mapel", ["Matematika", "Bahasa Indonesia"])
-        in_tipe = ct.selectbox("Tipe", ["Pilihan Ganda (PG)", "PG Kompleks", "Benar/Salah"])
-        in_paket = st.text_input("Paket", "Paket 1")
-        in_topik = st.text_input("Topik", "Umum", help="Contoh: Geometri, Bilangan")
+            exp = st.expander("⬇️ Ekspor Hasil", key="ex", on_change="rerun")
+            if exp.open:
+                with exp:
+                    c1, c2, c3 = st.columns(3)
+                    em = c1.selectbox("Mapel", ["", "Matematika", "Bahasa Indonesia"], format_func=lambda m: m or "Semua", key="ex_m")
+                    ep = c2.text_input("Paket", key="ex_p", placeholder="Semua").strip()
+                    rng = c3.date_input("Tanggal", [], key="ex_d")
+                    fmt = st.radio("Format", ["csv", "parquet"] if export.parquet_available() else ["csv"], horizontal=True, key="ex_f")
+                    flt = {'mapel': em or None, 'paket': ep or None,
+                           'start': rng[0] if rng else None, 'end': rng[-1] if rng else None}
+                    def build():
+                        # Dijalankan saat tombol diklik: hasil ditulis per halaman ke file sementara (di disk bila besar)
+                        out = tempfile.SpooledTemporaryFile(max_size=8 << 20)
+                        if fmt == 'csv':
+                            txt = io.TextIOWrapper(out, encoding='utf-8-sig', newline='')
+                            export.write_csv(db, txt, **flt); txt.flush(); txt.detach()
+                        else: export.write_parquet(db, out, **flt)
+                        out.seek(0)
+                        return out
+                    st.download_button("Unduh", build, file_name=f"hasil_{em or 'semua'}.{fmt}", mime=export.FORMATS[fmt], on_click="ignore")
+                    st.caption("Topik per hasil diratakan jadi kolom. Untuk data sangat besar: python export.py hasil.csv")
+
+    if t2.open:
+        with t2:
+            st.subheader("Input Soal")
+            cm, ct = st.columns(2)
+            in_mapel = cm.selectbox("Mapel", ["Matematika", "Bahasa Indonesia"])
+            in_tipe = ct.selectbox("Tipe", ["Pilihan Ganda (PG)", "PG Kompleks", "Benar/Salah"])
+            in_paket = st.text_input("Paket", "Paket 1")
+            in_topik = st.text_input("Topik", "Umum", help="Contoh: Geometri, Bilangan")
         
-        with st.form("add"):
-            tanya = st.text_area("Pertanyaan")
-            img = st.file_uploader("Gambar", type=['png','jpg'])
-            opsi=[]; kunci=None; st.markdown("---")
-            if in_tipe=="Pilihan Ganda (PG)":
-                cols=st.columns(4); opsi=[cols[i].text_input(f"Op {chr(65+i)}") for i in range(4)]
-                k=st.radio("Kunci", ["A","B","C","D"], horizontal=True)
-                if opsi[0]: kunci=opsi[ord(k)-65]; rt='single'
-            elif in_tipe=="PG Kompleks":
-                cols=st.columns(2); kl=[]
-                for i in range(4):
-                    v=cols[i%2].text_input(f"P {i+1}")
-                    if v: opsi.append(v)
-                    if cols[i%2].checkbox("Benar?", key=f"c{i}"): kl.append(v)
-                kunci=kl; rt='complex'
-            elif in_tipe=="Benar/Salah":
-                kunci={}
-                for i in range(3):
-                    c1,c2=st.columns([3,1]); p=c1.text_input(f"Pernyataan {i+1}")
-                    k=c2.radio("K", ["Benar","Salah"], key=f"b{i}", horizontal=True, label_visibility="collapsed")
-                    if p: opsi.append(p); kunci[p]=k
-                rt='category'
-            if st.form_submit_button("Simpan"):
-                imd = process_image(img)
-                db.collection('questions').add({'mapel':in_mapel, 'paket':in_paket, 'tipe':rt, 'topik':in_topik,
-                    'pertanyaan':tanya, 'gambar':imd, 'opsi':json.dumps(opsi), 'kunci_jawaban':json.dumps(kunci)})
-                st.success("Tersimpan!")
-
-    with t3:
-        txt = st.text_area("Paste CSV (|)", height=150)
-        if st.button("Upload"):
-            try:
-                df=pd.read_csv(io.StringIO(txt), sep='|'); cnt=0
-                for _,r in df.iterrows():
-                    o=[str(r[c]) for c in ['pilihan_a','pilihan_b','pilihan_c','pilihan_d'] if pd.notna(r[c])]
-                    rt='single'; rk=str(r['jawaban_benar']); fk=rk
-                    if 'Check' in str(r['tipe']): rt='complex'; fk=[x.strip() for x in rk.split(',')]
-                    elif 'Benar' in str(r['tipe']): rt='category'; ks=[x.strip() for x in rk.split(',')]; fk={o[i]:ks[i] for i in range(len(ks)) if i<len(o)}
-                    db.collection('questions').add({'mapel':r['mapel'],'paket':'Paket 1','topik':str(r.get('topik','Umum')),'tipe':rt,'pertanyaan':r['pertanyaan'],'gambar':None,'opsi':json.dumps(o),'kunci_jawaban':json.dumps(fk)})
-                    cnt+=1
-                st.success(f"{cnt} Sukses")
-            except Exception as e: st.error(str(e))
-
-    with t4:
-        fm=st.selectbox("M", ["Matematika", "Bahasa Indonesia"], key="f"); fp=st.text_input("P", "Paket 1", key="fp")
-        qs=list(db.collection('questions').where('mapel','==',fm).where('paket','==',fp).stream())
-        if qs:
-            qdat=[{'id':q.id, **q.to_dict()} for q in qs]
-            sel=st.selectbox("Pilih Soal", range(len(qdat)), format_func=lambda x: qdat[x]['pertanyaan'][:80])
-            q=qdat[sel]
-            with st.form("eds"):
-                nt=st.text_area("Tanya", q['pertanyaan'])
-                ntop=st.text_input("Topik", q.get('topik','Umum'))
-                if q.get('gambar'): st.image(q['gambar'], width=150)
-                ni=st.file_uploader("Ganti Gambar")
-                c1,c2=st.columns(2)
-                if c1.form_submit_button("Update"):
-                    ud={'pertanyaan':nt, 'topik':ntop}
-                    if ni: ud['gambar']=process_image(ni)
-                    db.collection('questions').document(q['id']).update(ud); st.rerun()
-                if c2.form_submit_button("Hapus"): db.collection('questions').document(q['id']).delete(); st.rerun()
-
-    with t5:
-        us=list(db.collection('users').where('role','!=','admin').stream())
-        st.dataframe(pd.DataFrame([u.to_dict() for u in us])[['username','nama_lengkap']])
+            with st.form("add"):
+                tanya = st.text_area("Pertanyaan")
+                img = st.file_uploader("Gambar", type=['png','jpg','jpeg'])
+                opsi=[]; kunci=None; st.markdown("---")
+                if in_tipe=="Pilihan Ganda (PG)":
+                    cols=st.columns(4); opsi=[cols[i].text_input(f"Op {chr(65+i)}") for i in range(4)]
+                    k=st.radio("Kunci", ["A","B","C","D"], horizontal=True)
+                    if opsi[0]: kunci=opsi[ord(k)-65]; rt='single'
+                elif in_tipe=="PG Kompleks":
+                    cols=st.columns(2); kl=[]
+                    for i in range(4):
+                        v=cols[i%2].text_input(f"P {i+1}")
+                        if v: opsi.append(v)
+                        if cols[i%2].checkbox("Benar?", key=f"c{i}"): kl.append(v)
+                    kunci=kl; rt='complex'
+                elif in_tipe=="Benar/Salah":
+                    kunci={}
+                    for i in range(3):
+                        c1,c2=st.columns([3,1]); p=c1.text_input(f"Pernyataan {i+1}")
+                        k=c2.radio("K", ["Benar","Salah"], key=f"b{i}", horizontal=True, label_visibility="collapsed")
+                        if p: opsi.append(p); kunci[p]=k
+                    rt='category'
+                if st.form_submit_button("Simpan"):
+                    imd = process_image(img)
+                    if imd is not False:
+                        qindex.commit(db, in_mapel, in_paket, sets={new_id(): {'mapel':in_mapel, 'paket':in_paket, 'tipe':rt, 'topik':in_topik,
+                            'pertanyaan':tanya, 'gambar':imd, 'opsi':json.dumps(opsi), 'kunci_jawaban':json.dumps(kunci)}})
+                        bank.bump(in_mapel, in_paket)
+                        st.success("Tersimpan!")
 
+    if t3.open:
+        with t3:
+            st.caption("Format: template_soal.csv (opsi & kunci JSON) atau template_mudah.csv (pilihan_a..d). Pemisah | ; , dideteksi otomatis.")
+            up = st.file_uploader("File CSV", type=['csv','txt'], key="up_csv")
+            txt = st.text_area("Atau paste CSV", height=150)
+            up_paket = st.text_input("Paket (jika tidak ada kolom paket)", "Paket 1", key="up_paket")
+            skip_bad = st.checkbox("Lewati baris bermasalah", help="Tanpa ini, upload dibatalkan bila ada baris yang tidak valid")
+            if st.button("Upload"):
+                src = up.getvalue().decode('utf-8-sig') if up else txt
+                try:
+                    ok, errors, pakets = validate(src, up_paket)
+                except ValueError as e: st.error(str(e)); ok, errors, pakets = 0, [], set()
+                if errors:
+                    st.warning(f"{len(errors)} baris bermasalah, {ok} baris valid")
+                    st.dataframe(pd.DataFrame(errors, columns=['baris','masalah']), hide_index=True)
+                if ok and (not errors or skip_bad):
+                    bar = st.progress(0.0, text="Mengunggah...")
+                    def progress(n, sec): bar.progress(n/ok, text=f"{n}/{ok} soal • {n/max(sec,1e-6):.0f} soal/detik")
+                    try:
+                        n, sec = import_questions(db, src, up_paket, progress)
+                        st.success(f"{n} soal tersimpan dalam {sec:.1f} detik ({n/max(sec,1e-6):.0f} soal/detik)")
+                    except Exception as e: st.error(str(e))
+                    finally:
+                        for m,pk in pakets: bank.bump(m,pk)
+
+    if t4.open:
+        with t4:
+            fm=st.selectbox("M", ["Matematika", "Bahasa Indonesia"], key="f"); fp=st.text_input("P", "Paket 1", key="fp")
+            # Daftar & pencarian dari indeks ringkas; soal lengkap hanya dibaca untuk yang dipilih
+            idx=qindex.load(db, fm, fp) or qindex.rebuild(db, fm, fp); items=idx['items']
+            cari=st.text_input("Cari", key="fq", placeholder="Teks soal / topik").lower()
+            ids=sorted((k for k,it in items.items() if cari in f"{it['t']} {it['topik']}".lower()), key=lambda k: items[k]['t'])
+            st.caption(f"{len(ids)} dari {len(items)} soal")
+            sel=st.selectbox("Pilih Soal", ids, format_func=lambda k: f"{'🖼️ ' if items[k]['img'] else ''}[{items[k]['topik']}] {items[k]['t']}") if ids else None
+            q=db.get('questions', sel) if sel else None
+            if sel and not q:
+                # Soal sudah dihapus di luar editor: segarkan indeks
+                qindex.rebuild(db, fm, fp); st.rerun()
+            if q:
+                with st.form("eds"):
+                    nt=st.text_area("Tanya", q['pertanyaan'])
+                    ntop=st.text_input("Topik", q.get('topik','Umum'))
+                    thumb = image_src(q.get('gambar'), 'thumb')
+                    if thumb: st.image(thumb, width=150)
+                    ni=st.file_uploader("Ganti Gambar", type=['png','jpg','jpeg'])
+                    c1,c2=st.columns(2)
+                    if c1.form_submit_button("Update"):
+                        ud={'pertanyaan':nt, 'topik':ntop}
+                        if ni: ud['gambar']=process_image(ni)
+                        if ud.get('gambar') is not False: qindex.commit(db, fm, fp, updates={sel: ud}); bank.bump(fm,fp); st.rerun()
+                    if c2.form_submit_button("Hapus"): qindex.commit(db, fm, fp, deletes=[sel]); bank.bump(fm,fp); st.rerun()
+
+            exp=st.expander("📐 Kisi-kisi Ujian", key="bp", on_change="rerun")
+            if exp.open:
+                with exp:
+                    # Ketersediaan soal per topik & tipe dari indeks ringkas (tanpa membaca soal lengkap)
+                    avail=pd.DataFrame([(it['topik'], it['tipe']) for it in items.values()], columns=['topik','tipe'])
+                    if len(avail): st.dataframe(pd.crosstab(avail['topik'], avail['tipe'].map(blueprint.TIPE)), use_container_width=True)
+                    plan=blueprint.load(db, fm, fp) or {'durasi': blueprint.DURASI, 'strata': []}
+                    st.caption("Tiap baris = n soal acak dari topik & tipe tersebut (kosong = semua). Tanpa baris: semua soal paket dipakai.")
+                    with st.form("bpf"):
+                        rows=st.data_editor(pd.DataFrame(plan['strata'], columns=['topik','tipe','n']), num_rows="dynamic", hide_index=True,
+                            column_config={'topik': st.column_config.SelectboxColumn("Topik", options=[blueprint.ANY]+sorted(set(avail.get('topik', []))), format_func=lambda t: t or "Semua"),
+                                           'tipe': st.column_config.SelectboxColumn("Tipe", options=list(blueprint.TIPE), format_func=blueprint.TIPE.get),
+                                           'n': st.column_config.NumberColumn("Jumlah", min_value=0, step=1)})
+                        cd, cm, cn = st.columns(3)
+                        durasi=cd.number_input("Durasi (menit)", 5, 300, int(plan['durasi']))
+                        pol=policy_of(plan); modes=list(POLICIES)
+                        mode=cm.selectbox("Penilaian", modes, modes.index(pol['mode']), format_func=POLICIES.get, help="Nilai parsial: PG kompleks & Benar/Salah dinilai per pilihan/pernyataan")
+                        pen=cn.number_input("Pengurangan per jawaban salah", 0.0, 1.0, float(pol['penalty']), 0.05, help="Hanya untuk kebijakan Pengurangan nilai")
+                        if st.form_submit_button("Simpan Kisi-kisi"):
+                            blueprint.save(db, fm, fp, rows.fillna({'topik': blueprint.ANY, 'tipe': blueprint.ANY, 'n': 0}).to_dict('records'), durasi,
+                                           {'mode': mode, 'penalty': pen})
+                            bank.bump(fm,fp); st.success("Kisi-kisi tersimpan")
+                    if st.button("♻️ Nilai Ulang Paket", help="Hitung ulang skor semua hasil paket ini dengan kunci & kebijakan penilaian saat ini"):
+                        try:
+                            with st.spinner("Menilai ulang..."): n = rescore(db, fm, fp, bank)
+                            st.success(f"{n} hasil berubah skor")
+                        except class_stats.Busy as e: st.warning(str(e))
+
+    if t5.open:
+        with t5:
+            cf, cq = st.columns([1,3])
+            field = cf.selectbox("Cari", ["username", "nama_lengkap"], format_func=lambda f: "Username" if f=="username" else "Nama", key="us_f")
+            prefix = cq.text_input("Awalan", key="us_q", placeholder="Awalan username / nama (peka huruf besar)").strip()
+            # Cursor per halaman; ganti pencarian = kembali ke halaman 1
+            nav = st.session_state.setdefault('us_nav', {'q': None, 'cursors': [None]})
+            if nav['q'] != (field, prefix): nav.update({'q': (field, prefix), 'cursors': [None]})
+            rows, nxt, more = user_page(field, prefix, nav['cursors'][-1])
+            st.dataframe(pd.DataFrame(rows, columns=['username','nama_lengkap']), hide_index=True)
+            cp, ci, cn = st.columns([1,2,1])
+            ci.caption(f"Halaman {len(nav['cursors'])}")
+            if len(nav['cursors']) > 1 and cp.button("⬅️ Sebelumnya", key="us_prev"): nav['cursors'].pop(); st.rerun()
+            if more and cn.button("Berikutnya ➡️", key="us_next"): nav['cursors'].append(nxt); st.rerun()
+
+    if t6.open:
+        with t6:
+            cm, cp, cr = st.columns([2,2,1])
+            am = cm.selectbox("Mapel", ["Matematika", "Bahasa Indonesia"], key="an_m"); ap = cp.text_input("Paket", "Paket 1", key="an_p")
+            # Tiap kali dibuka hanya hasil baru sejak pembaruan terakhir yang dihitung
+            if cr.button("🔄 Hitung Ulang", key="an_rb", help="Hitung dari nol (mis. setelah kunci jawaban dikoreksi)"):
+                with st.spinner("Menghitung ulang..."): state = analysis.rebuild(db, am, ap)
+            else: state = analysis.refresh(db, am, ap)
+            rep = analysis.report(state)
+            if rep['attempts']:
+                c1, c2, c3 = st.columns(3)
+                c1.metric("Percobaan", rep['attempts']); c2.metric("Butir", len(rep['items']))
+                c3.metric("Reliabilitas KR-20", "-" if rep['kr20'] != rep['kr20'] else f"{rep['kr20']:.2f}")
+                def sebaran(qid):
+                    o = rep['options'].get(qid)
+                    if not o: return ""
+                    tot = sum(o.values())
+                    return " · ".join(f"{k} {v/tot:.0%}" for k, v in sorted(o.items(), key=lambda kv: -kv[1]))
+                # Teks soal dari indeks paket (butir tanpa qid di hasil lama memakai teks soal sebagai id)
+                names = (qindex.load(db, am, ap) or {}).get('items', {})
+                df = pd.DataFrame({
+                    'Soal': [names.get(q, {}).get('t') or q[:80] for q in rep['items']], 'n': rep['n'].astype(int),
+                    'p': rep['p'].round(2), 'Kesukaran': [analysis.difficulty_label(x) for x in rep['p']],
+                    'Daya Beda (r_pb)': rep['rpb'].round(2), 'Keterangan': [analysis.discrimination_label(x) for x in rep['rpb']],
+                    'Sebaran Pilihan': [sebaran(q) for q in rep['items']],
+                })
+                st.dataframe(df.sort_values('Daya Beda (r_pb)'), hide_index=True)
+                st.caption("p: proporsi siswa yang menjawab benar. r_pb: korelasi butir dengan skor sisa; < 0.2 perlu direvisi.")
+            else: st.info("Belum ada data (hasil baru dihitung ±2 menit setelah ujian selesai).")
+
+    if t7.open:
+        with t7:
+            # Angka per proses sejak start / reset; tiap proses server punya hitungan sendiri
+            reg = metrics.REGISTRY; tot = reg.totals()
+            st.caption(f"Sejak {datetime.fromtimestamp(reg.started).strftime('%Y-%m-%d %H:%M')} (proses ini)")
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("Read", f"{tot['reads']:,}"); c2.metric("Write", f"{tot['writes']:,}")
+            c3.metric("KB Dibaca", f"{tot['bytes_in']/1024:,.0f}"); c4.metric("KB Ditulis", f"{tot['bytes_out']/1024:,.0f}")
+            # secrets [metrics.budget]: exam = 2 (read per klik ujian), "exam.calculate_score" = 10, ...
+            try: budgets = dict(st.secrets.get("metrics", {}).get("budget", {}))
+            except: budgets = {}
+            for name, val, limit in reg.over_budget(budgets): st.warning(f"{name}: {val:.1f} read/panggilan (anggaran {limit})")
+            rows = reg.rows()
+            if rows:
+                df = pd.DataFrame(rows)
+                df['fn'] = df['fn'].replace(metrics.PAGE, '(total)')
+                df[['bytes_in','bytes_out']] = (df[['bytes_in','bytes_out']] / 1024).round(1)
+                st.dataframe(df.rename(columns={'page':'Halaman', 'fn':'Fungsi', 'calls':'Panggilan', 'p50_ms':'p50 ms', 'p95_ms':'p95 ms',
+                    'mean_ms':'Rata-rata ms', 'reads':'Read', 'writes':'Write', 'bytes_in':'KB Baca', 'bytes_out':'KB Tulis',
+                    'reads_per_call':'Read/Panggilan'}).round(2), hide_index=True)
+                st.caption("p50/p95: batas atas bucket histogram. Read dihitung seperti tagihan Firestore (dokumen dikembalikan, minimal 1 per query).")
+            else: st.info("Belum ada data.")
+            cd, cr = st.columns([3,1])
+            cd.download_button("Unduh (format Prometheus)", reg.prometheus(), file_name="metrics.prom", mime="text/plain")
+            if cr.button("Reset", key="mx_reset"): reg.reset(); st.rerun()
+
+@metrics.track(page='dashboard')
 def student_dashboard():
     st.markdown(f"<div class='header-bar'><div>Halo, <b>{st.session_state['nama']}</b></div><a href='/?logout=true' style='color:white;text-decoration:none;border:1px solid white;padding:5px 15px;border-radius:20px;font-size:14px;'>Keluar</a></div>", unsafe_allow_html=True)
     if st.query_params.get("logout"): st.query_params.clear(); st.session_state.clear(); st.rerun()
@@ -391,7 +710,9 @@ def student_dashboard():
         with c1:
             with st.container(border=True):
                 st.markdown("### 📐 Matematika")
-                st.caption("30 Soal | 75 Menit")
+                plan = paket_plan(db, bank, "Matematika", "Paket 1")
+                n = blueprint.total(plan) if plan and plan['strata'] else len(bank.get_paket("Matematika", "Paket 1", load_paket))
+                st.caption(f"{n} Soal | {(plan or {}).get('durasi', blueprint.DURASI)} Menit")
                 if st.button("Mulai Paket 1", key="m1", type="primary", use_container_width=True):
                     if init_exam("Matematika", "Paket 1"): st.rerun()
         with c2:
@@ -402,20 +723,134 @@ def student_dashboard():
     
     with t2:
         st.subheader("Riwayat Nilai")
-        # Fix query error by client-side filtering
-        res = db.collection('results').where('username', '==', st.session_state['username']).stream()
-        hist = sorted([r.to_dict() for r in res], key=lambda x: x['tanggal'], reverse=True)
+        hist = history()
         
-        if hist:
-            for h in hist:
-                with st.expander(f"{h['tanggal']} | {h['mapel']} | Skor: {h['skor']:.1f}"):
-                    if 'topic_analysis' in h:
-                        stats = json.loads(h['topic_analysis'])
-                        st.write("**Analisis Topik:**")
-                        for k, v in stats.items():
-                            st.progress(v['correct']/v['total'] if v['total']>0 else 0, text=f"{k}: {v['correct']}/{v['total']} Benar")
+        if hist['rows']:
+            for h in hist['rows']:
+                exp = st.expander(f"{h['tanggal']} | {h['mapel']} | Skor: {h['skor']:.1f}", key=f"h_{h['id']}", on_change="rerun")
+                with exp:
+                    st.write("**Analisis Topik:**")
+                    for k, v in h['topic_analysis'].items():
+                        st.progress(v['correct']/v['total'] if v['total']>0 else 0, text=f"{k}: {v['correct']}/{v['total']} Benar")
+                    # Pembahasan (details) baru dibaca saat percobaan ini dibuka
+                    if exp.open:
+                        st.write("**Pembahasan:**")
+                        res = history_result(hist, h['id'])
+                        if res: show_details(result_details(res))
+            if not hist['done'] and st.button("Muat lebih banyak", use_container_width=True):
+                fetch_history(hist); st.rerun()
         else: st.info("Belum ada riwayat.")
 
+def countdown(end_time):
+    # Timer jalan di browser dari end_time (tanpa rerun server tiap detik); selisih jam klien-server dikoreksi
+    now = datetime.now().timestamp()
+    st.html(f"""
+    <div id="cat-timer" class="timer-badge">⏱️ --:--</div>
+    <script>
+        const end = {end_time * 1000:.0f}, skew = Date.now() - {now * 1000:.0f};
+        clearInterval(window.catTimer);
+        function tick() {{
+            const el = document.getElementById('cat-timer');
+            if (!el) return clearInterval(window.catTimer);
+            const rem = Math.max(0, Math.floor((end - (Date.now() - skew)) / 1000));
+            el.textContent = '⏱️ ' + Math.floor(rem / 60) + ':' + String(rem % 60).padStart(2, '0');
+            if (rem <= 300) {{ el.style.background = '#FEE2E2'; el.style.color = '#991B1B'; el.style.borderColor = '#FCA5A5'; }}
+        }}
+        tick(); window.catTimer = setInterval(tick, 1000);
+    </script>""", unsafe_allow_javascript=True)
+
+@st.fragment(run_every=20)
+@metrics.track(page='exam')
+def expiry_watch():
+    # Fragmen kosong yang hanya mengecek waktu habis -> auto-submit walau siswa diam
+    if st.session_state.get('exam_mode') and st.session_state['exam_data']['end_time'] <= datetime.now().timestamp():
+        finish_exam()
+
+@st.fragment
+@metrics.track(page='exam')
+def question_panel():
+    # Menjawab / ragu hanya me-rerun fragmen ini; pindah soal me-rerun seluruh halaman
+    data = st.session_state['exam_data']; order = st.session_state['q_order']; idx = st.session_state['curr_idx']
+    if data['end_time'] <= datetime.now().timestamp(): finish_exam()
+    qid = order[idx]
+    q = get_question(qid)
+    if q:
+        st.markdown(f"<div class='soal-box'>", unsafe_allow_html=True)
+        st.write(q['pertanyaan'])
+        img = image_src(q.get('gambar'), 'md')
+        if img: st.image(img)
+        st.markdown("<hr>", unsafe_allow_html=True)
+        
+        # Render Jawaban
+        opsi = json.loads(q['opsi']); ans = st.session_state['answers'].get(qid)
+        
+        if q['tipe'] == 'single':
+            sel = st.radio("Jawab:", opsi, key=qid, index=opsi.index(ans) if ans in opsi else None)
+            if sel: set_answer(qid, sel)
+        elif q['tipe'] == 'complex':
+            st.caption("Pilih lebih dari satu:")
+            sel = ans if isinstance(ans, list) else []; new_sel = []
+            for o in opsi:
+                if st.checkbox(o, o in sel, key=f"{qid}_{o}"): new_sel.append(o)
+            set_answer(qid, new_sel)
+        elif q['tipe'] == 'category':
+            st.caption("Tentukan Benar/Salah:")
+            sel = ans if isinstance(ans, dict) else {}; new_sel = {}
+            for o in opsi:
+                ca, cb = st.columns([3,1]); ca.write(o)
+                v = cb.radio("pilih", ["Benar","Salah"], key=f"{qid}_{o}", horizontal=True, label_visibility="collapsed", index=0 if sel.get(o)=="Benar" else 1 if sel.get(o)=="Salah" else None)
+                if v: new_sel[o] = v
+            set_answer(qid, new_sel)
+        st.markdown("</div>", unsafe_allow_html=True)
+    
+    # NAVIGASI BAWAH SOAL
+    st.markdown("<div class='nav-buttons'>", unsafe_allow_html=True)
+    c_prev, c_ragu, c_next = st.columns([1,1,1])
+    
+    if idx > 0:
+        if c_prev.button("⬅️ Sebelumnya", use_container_width=True):
+            st.session_state['curr_idx'] -= 1; save_realtime(); st.rerun()
+    
+    is_r = qid in st.session_state['ragu']
+    # on_click: ragu sudah tercatat sebelum fragmen digambar ulang, label tombol langsung berganti
+    c_ragu.button(f"{'🟨 Batal Ragu' if is_r else '🟨 Ragu'}", use_container_width=True, on_click=lambda: (toggle_ragu(qid), save_realtime()))
+        
+    if idx < len(order)-1:
+        if c_next.button("Selanjutnya ➡️", type="primary", use_container_width=True):
+            st.session_state['curr_idx'] += 1; save_realtime(); st.rerun()
+    else:
+        if c_next.button("✅ Selesai", type="primary", use_container_width=True):
+            finish_exam()
+    st.markdown("</div>", unsafe_allow_html=True)
+
+@st.fragment
+@metrics.track(page='exam')
+def nav_grid():
+    # Soal aktif selalu 🔵, jadi grid tidak perlu digambar ulang saat menjawab / ragu di soal ini
+    order = st.session_state['q_order']; idx = st.session_state['curr_idx']
+    st.markdown("**Navigasi Soal**")
+    st.markdown("<div class='grid-container'>", unsafe_allow_html=True)
+    
+    # Loop 5 kolom
+    total_q = len(order)
+    rows = (total_q + 4) // 5
+    for r in range(rows):
+        cols = st.columns(5)
+        for c in range(5):
+            q_idx = r * 5 + c
+            if q_idx < total_q:
+                qid_real = order[q_idx]
+                label = str(q_idx+1)
+                if q_idx == idx: label = f"🔵" # Aktif
+                elif qid_real in st.session_state['ragu']: label = f"🟨" # Ragu
+                elif qid_real in st.session_state['answers'] and st.session_state['answers'][qid_real]: label = f"✅" # Done
+                
+                if cols[c].button(label, key=f"g_{q_idx}", help=f"No {q_idx+1}"):
+                    st.session_state['curr_idx'] = q_idx; save_realtime(); st.rerun()
+    st.markdown("</div>", unsafe_allow_html=True)
+    st.caption("🔵: Aktif | ✅: Dijawab | 🟨: Ragu")
+
+@metrics.track(page='exam')
 def exam_interface():
     data = st.session_state['exam_data']; order = st.session_state['q_order']; idx = st.session_state['curr_idx']
     rem = data['end_time'] - datetime.now().timestamp()
@@ -424,102 +859,31 @@ def exam_interface():
     # 1. HEADER TIMER & FONT
     c1,c2,c3 = st.columns([6,2,2])
     with c1: st.markdown(f"**{data['mapel']}** | No. {idx+1} dari {len(order)}")
-    with c2: st.markdown(f"<div class='timer-badge'>⏱️ {int(rem//60)}:{int(rem%60):02d}</div>", unsafe_allow_html=True)
+    with c2: countdown(data['end_time'])
     with c3: 
         f = st.columns(3)
         if f[0].button("A-"): st.session_state['font_size']=14; st.rerun()
         if f[1].button("A"): st.session_state['font_size']=18; st.rerun()
         if f[2].button("A+"): st.session_state['font_size']=24; st.rerun()
+    expiry_watch()
     
     # LAYOUT RESPONSIVE
     # Di HP akan otomatis menumpuk: Kolom Soal dulu, baru Kolom Grid di bawahnya
     col_soal, col_nav = st.columns([3, 1])
     
     # --- KOLOM 1: SOAL ---
-    with col_soal:
-        qid = order[idx]
-        q_doc = db.collection('questions').document(qid).get()
-        if q_doc.exists:
-            q = q_doc.to_dict()
-            st.markdown(f"<div class='soal-box'>", unsafe_allow_html=True)
-            st.write(q['pertanyaan'])
-            if q.get('gambar'): st.image(q['gambar'])
-            st.markdown("<hr>", unsafe_allow_html=True)
-            
-            # Render Jawaban
-            opsi = json.loads(q['opsi']); ans = st.session_state['answers'].get(qid)
-            
-            if q['tipe'] == 'single':
-                sel = st.radio("Jawab:", opsi, key=qid, index=opsi.index(ans) if ans in opsi else None)
-                if sel: st.session_state['answers'][qid] = sel
-            elif q['tipe'] == 'complex':
-                st.caption("Pilih lebih dari satu:")
-                sel = ans if isinstance(ans, list) else []; new_sel = []
-                for o in opsi:
-                    if st.checkbox(o, o in sel, key=f"{qid}_{o}"): new_sel.append(o)
-                st.session_state['answers'][qid] = new_sel
-            elif q['tipe'] == 'category':
-                st.caption("Tentukan Benar/Salah:")
-                sel = ans if isinstance(ans, dict) else {}; new_sel = {}
-                for o in opsi:
-                    ca, cb = st.columns([3,1]); ca.write(o)
-                    v = cb.radio("pilih", ["Benar","Salah"], key=f"{qid}_{o}", horizontal=True, label_visibility="collapsed", index=0 if sel.get(o)=="Benar" else 1 if sel.get(o)=="Salah" else None)
-                    if v: new_sel[o] = v
-                st.session_state['answers'][qid] = new_sel
-            st.markdown("</div>", unsafe_allow_html=True)
-        
-        # NAVIGASI BAWAH SOAL
-        st.markdown("<div class='nav-buttons'>", unsafe_allow_html=True)
-        c_prev, c_ragu, c_next = st.columns([1,1,1])
-        
-        if idx > 0:
-            if c_prev.button("⬅️ Sebelumnya", use_container_width=True):
-                st.session_state['curr_idx'] -= 1; save_realtime(); st.rerun()
-        
-        is_r = qid in st.session_state['ragu']
-        if c_ragu.button(f"{'🟨 Batal Ragu' if is_r else '🟨 Ragu'}", use_container_width=True):
-            if is_r: st.session_state['ragu'].remove(qid)
-            else: st.session_state['ragu'].append(qid)
-            save_realtime(); st.rerun()
-            
-        if idx < len(order)-1:
-            if c_next.button("Selanjutnya ➡️", type="primary", use_container_width=True):
-                st.session_state['curr_idx'] += 1; save_realtime(); st.rerun()
-        else:
-            if c_next.button("✅ Selesai", type="primary", use_container_width=True):
-                finish_exam()
-        st.markdown("</div>", unsafe_allow_html=True)
+    with col_soal: question_panel()
 
     # --- KOLOM 2: GRID NOMOR RAPI ---
-    with col_nav:
-        st.markdown("**Navigasi Soal**")
-        st.markdown("<div class='grid-container'>", unsafe_allow_html=True)
-        
-        # Loop 5 kolom
-        total_q = len(order)
-        rows = (total_q + 4) // 5
-        for r in range(rows):
-            cols = st.columns(5)
-            for c in range(5):
-                q_idx = r * 5 + c
-                if q_idx < total_q:
-                    qid_real = order[q_idx]
-                    label = str(q_idx+1)
-                    if q_idx == idx: label = f"🔵" # Aktif
-                    elif qid_real in st.session_state['ragu']: label = f"🟨" # Ragu
-                    elif qid_real in st.session_state['answers'] and st.session_state['answers'][qid_real]: label = f"✅" # Done
-                    
-                    if cols[c].button(label, key=f"g_{q_idx}", help=f"No {q_idx+1}"):
-                        st.session_state['curr_idx'] = q_idx; save_realtime(); st.rerun()
-        st.markdown("</div>", unsafe_allow_html=True)
-        st.caption("🔵: Aktif | ✅: Dijawab | 🟨: Ragu")
+    with col_nav: nav_grid()
 
 def finish_exam():
-    save_realtime()
-    sc, det, stats = calculate_score()
-    st.session_state.update({'exam_mode':False, 'result_mode':True, 'last_score':sc, 'last_det':det, 'last_stats':stats})
+    # calculate_score() ikut menulis semua jawaban yang masih tertunda (force flush)
+    res, stats = calculate_score()
+    st.session_state.update({'exam_mode':False, 'result_mode':True, 'last_score':res['skor'], 'last_res':res, 'last_stats':stats})
     st.rerun()
 
+@metrics.track(page='result')
 def result_interface():
     st.balloons()
     score = st.session_state['last_score']
@@ -554,22 +918,51 @@ def result_interface():
                 found=True
         if not found: st.write("Kerja bagus! Pertahankan.")
 
+    # PERKEMBANGAN: akurasi topik beberapa ujian terakhir & skor terbaik dari profil siswa
+    res = st.session_state['last_res']
+    prof = progress_profile()
+    if prof:
+        st.subheader("📈 Perkembangan")
+        pk = prof['pakets'].get(profiles.paket_key(res['mapel'], res['paket']), {})
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Total Ujian", prof['attempts'])
+        c2.metric("Percobaan Paket Ini", pk.get('attempts', 1))
+        c3.metric("Skor Terbaik Paket Ini", f"{pk.get('best', score):.1f}")
+        weak = [t for t in profiles.topic_accuracy(prof) if t[1] < profiles.GOOD]
+        st.write(f"**Topik yang masih lemah** ({profiles.ROLL} ujian terakhir):")
+        for k, acc, c, n in weak:
+            st.markdown(f"<div class='analysis-box box-bad'><b>{k}</b> ({c}/{n} Benar, {acc:.0%})</div>", unsafe_allow_html=True)
+        if not weak: st.write("Tidak ada. Pertahankan!")
+
+    exp = st.expander("🏆 Peringkat Paket", key="peringkat", on_change="rerun")
+    with exp:
+        # Shard statistik paket dibaca hanya saat dibuka
+        if exp.open:
+            board = class_stats.leaderboard(db, res['mapel'], res['paket'])
+            rank = next((i for i, e in enumerate(board, 1) if e['username'] == st.session_state['username']), None)
+            st.write(f"Peringkat kamu: **#{rank}** (skor terbaik)" if rank else f"Kamu belum masuk {class_stats.BOARD_N} besar. Ayo coba lagi!")
+            st.markdown("\n".join(f"{i}. {e['nama']} — {e['skor']:.1f}" for i, e in enumerate(board[:class_stats.TOP_N], 1)))
+
     if st.button("Kembali ke Beranda", use_container_width=True):
         st.session_state['result_mode']=False; st.rerun()
         
-    with st.expander("Lihat Pembahasan Lengkap"):
-        for d in st.session_state['last_det']:
-            bg = "#dcfce7" if d['benar'] else "#fee2e2"
-            icon = "✅" if d['benar'] else "❌"
-            st.markdown(f"""
-            <div style='background:{bg}; padding:15px; border-radius:10px; margin-bottom:10px; color:black;'>
-                <small>{d.get('topik','Umum')}</small><br>
-                <strong>{icon} {d['tanya']}</strong><br>
-                <div style='margin-top:5px; font-size:0.9em; color:#333;'>
-                    Jawabanmu: <b>{d['jawab']}</b> | Kunci: <b>{d['kunci']}</b>
-                </div>
+    exp = st.expander("Lihat Pembahasan Lengkap", key="pembahasan", on_change="rerun")
+    with exp:
+        if exp.open: show_details(result_details(st.session_state['last_res']))
+
+def show_details(det):
+    for d in det:
+        bg = "#dcfce7" if d['benar'] else "#fee2e2"
+        icon = "✅" if d['benar'] else "❌"
+        st.markdown(f"""
+        <div style='background:{bg}; padding:15px; border-radius:10px; margin-bottom:10px; color:black;'>
+            <small>{d.get('topik','Umum')}</small><br>
+            <strong>{icon} {d['tanya']}</strong><br>
+            <div style='margin-top:5px; font-size:0.9em; color:#333;'>
+                Jawabanmu: <b>{d['jawab']}</b> | Kunci: <b>{d['kunci']}</b>
             </div>
-            """, unsafe_allow_html=True)
+        </div>
+        """, unsafe_allow_html=True)
 
 # Main Loop
 if not st.session_state.get('logged_in'): login_page()
@@ -0,0 +1,58 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+# Token sesi bertanda tangan (HMAC-SHA256) dan hash password.
+# Token = base64url(payload).base64url(signature), payload {u, n, r, exp}. Sambung ulang
+# (reload / Wi-Fi putus) cukup memverifikasi token tanpa membaca database, dan username
+# di URL tidak bisa diganti tanpa merusak tanda tangan.
+
+TOKEN_TTL = 12 * 3600
+PBKDF2_ITER = 100_000
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _unb64(s):
+    return base64.urlsafe_b64decode(s + '=' * (-len(s) % 4))
+
+
+def make_token(secret, username, nama, role, ttl=TOKEN_TTL):
+    payload = _b64(json.dumps({'u': username, 'n': nama, 'r': role, 'exp': int(time.time() + ttl)},
+                              separators=(',', ':')).encode())
+    sig = hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest()
+    return f"{payload}.{_b64(sig)}"
+
+
+def verify_token(secret, token):
+    """Kembalikan {'username', 'nama', 'role'} bila token sah dan belum kedaluwarsa, selain itu None."""
+    try:
+        payload, sig = token.split('.')
+        expected = hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _unb64(sig)): return None
+        claims = json.loads(_unb64(payload))
+        if claims['exp'] < time.time(): return None
+        return {'username': claims['u'], 'nama': claims['n'], 'role': claims['r']}
+    except Exception:
+        return None
+
+
+def hash_password(password, iterations=PBKDF2_ITER):
+    salt = os.urandom(16)
+    dk = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${_b64(salt)}${_b64(dk)}"
+
+
+def verify_password(stored, password):
+    """(cocok, perlu_upgrade). Password lama yang masih plaintext tetap diterima lalu di-upgrade."""
+    if not stored: return False, False
+    if not stored.startswith('pbkdf2_sha256$'):
+        return hmac.compare_digest(stored.encode(), password.encode()), True
+    _, iterations, salt, dk = stored.split('$')
+    test = hashlib.pbkdf2_hmac('sha256', password.encode(), _unb64(salt), int(iterations))
+    return hmac.compare_digest(test, _unb64(dk)), int(iterations) < PBKDF2_ITER
@@ -0,0 +1,44 @@
+import copy
+import time
+
+# Write-behind autosave untuk jawaban ujian. Perubahan dicatat per soal (dirty) dan baru
+# ditulis ke exam_sessions setiap `interval` detik atau setelah `max_dirty` soal berubah;
+# yang ditulis hanya field jawaban yang berubah sejak flush terakhir.
+
+
+INTERVAL = 15
+MAX_DIRTY = 5
+
+
+class AnswerBuffer:
+    def __init__(self, answers=None, ragu=None, interval=INTERVAL, max_dirty=MAX_DIRTY):
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self.dirty = set()
+        self.ragu_dirty = False
+        self.last_flush = time.time()
+        self._saved = copy.deepcopy(answers or {})
+        self._saved_ragu = list(ragu or [])
+
+    def mark(self, qid): self.dirty.add(qid)
+
+    def mark_ragu(self): self.ragu_dirty = True
+
+    def due(self, now=None):
+        if not (self.dirty or self.ragu_dirty): return False
+        now = now or time.time()
+        return len(self.dirty) >= self.max_dirty or now - self.last_flush >= self.interval
+
+    def changes(self, answers, ragu):
+        """(jawaban yang berubah {qid: nilai}, ragu baru atau None) dibanding flush terakhir."""
+        ans = {qid: answers.get(qid) for qid in self.dirty if answers.get(qid) != self._saved.get(qid)}
+        new_ragu = list(ragu) if self.ragu_dirty and list(ragu) != self._saved_ragu else None
+        return ans, new_ragu
+
+    def committed(self, answers, ragu):
+        for qid in self.dirty:
+            if qid in answers: self._saved[qid] = copy.deepcopy(answers[qid])
+        if self.ragu_dirty: self._saved_ragu = list(ragu)
+        self.dirty.clear()
+        self.ragu_dirty = False
+        self.last_flush = time.time()
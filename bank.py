@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Cache bank soal per (mapel, paket), dipakai bersama oleh semua sesi dalam satu proses.
+# Setiap paket punya version stamp; admin menaikkan versi saat soal berubah sehingga
+# entri lama tidak dipakai lagi. Paket yang lama tidak diakses dibuang (LRU + idle TTL).
+#
+# Dengan tier cache bersama (cache.py, argumen shared) beberapa proses / replika berbagi satu
+# penghitung versi per paket dan payload-nya: soal paket dan data turunan (kunci terkompilasi,
+# indeks strata, ...) disimpan dengan key yang memuat versi, jadi paket hanya dimuat dari database
+# sekali untuk semua replika. Versi bersama dibaca ulang paling sering sekali per `sync` detik;
+# perubahan admin di replika lain terlihat paling lambat setelah selang itu.
+
+
+class QuestionBank:
+    def __init__(self, max_pakets=16, idle_ttl=3 * 3600, shared=None, sync=2.0):
+        self.max_pakets = max_pakets
+        self.idle_ttl = idle_ttl
+        self.shared = shared
+        self.sync = sync
+        self._synced = {}   # (mapel, paket) -> waktu terakhir versi bersama dibaca
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (mapel, paket) -> {'version', 'questions', 'last_used'}
+        self._versions = {}
+        self._loading = {}  # (mapel, paket) -> Lock, agar satu paket hanya di-load sekali
+
+    @staticmethod
+    def _skey(kind, key, version):
+        return f"{kind}:{key[0]}__{key[1]}:{version}"
+
+    def _sync(self, key):
+        if not self.shared: return
+        now = time.time()
+        with self._lock:
+            if now - self._synced.get(key, 0) < self.sync: return
+            self._synced[key] = now
+        shared = self.shared.counter(self._skey('v', key, ''))
+        # Cache bersama tidak tersedia: tetap pakai versi lokal
+        if shared is None: return
+        with self._lock:
+            if shared > self._versions.get(key, 0): self._versions[key] = shared
+
+    def version(self, mapel, paket):
+        self._sync((mapel, paket))
+        with self._lock:
+            return self._versions.get((mapel, paket), 0)
+
+    def bump(self, mapel, paket):
+        key = (mapel, paket)
+        shared = self.shared.incr(self._skey('v', key, '')) if self.shared else None
+        with self._lock:
+            self._versions[key] = max(shared or 0, self._versions.get(key, 0) + 1)
+            self._synced[key] = time.time()
+            self._entries.pop(key, None)
+            return self._versions[key]
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry and entry['version'] == self._versions.get(key, 0):
+            entry['last_used'] = now
+            self._entries.move_to_end(key)
+            return entry['questions']
+        return None
+
+    def _evict(self, now):
+        for key in [k for k, e in self._entries.items() if now - e['last_used'] > self.idle_ttl]:
+            del self._entries[key]
+        while len(self._entries) > self.max_pakets:
+            self._entries.popitem(last=False)
+
+    def get_paket(self, mapel, paket, loader):
+        """Kembalikan {qid: soal} untuk paket; loader(mapel, paket) hanya dipanggil saat cache miss."""
+        key = (mapel, paket)
+        self._sync(key)
+        with self._lock:
+            questions = self._lookup(key, time.time())
+            if questions is not None: return questions
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Sesi lain mungkin sudah selesai me-load paket yang sama
+            with self._lock:
+                questions = self._lookup(key, time.time())
+                if questions is not None: return questions
+                version = self._versions.get(key, 0)
+
+            skey = self._skey('q', key, version)
+            questions = self.shared.get(skey) if self.shared else None
+            if questions is None:
+                questions = {q['id']: q for q in loader(mapel, paket)}
+                if self.shared and questions: self.shared.set(skey, questions)
+
+            with self._lock:
+                now = time.time()
+                # Jangan simpan hasil load kalau admin mengubah paket selama load berjalan
+                if self._versions.get(key, 0) == version and questions:
+                    self._entries[key] = {'version': version, 'questions': questions, 'last_used': now, 'derived': {}}
+                    self._entries.move_to_end(key)
+                self._evict(now)
+                self._loading.pop(key, None)
+            return questions
+
+    def get(self, mapel, paket, qid, loader):
+        return self.get_paket(mapel, paket, loader).get(qid)
+
+    def get_derived(self, mapel, paket, name, build, loader):
+        """Data turunan paket (mis. tabel kunci jawaban), dihitung sekali per versi paket."""
+        questions = self.get_paket(mapel, paket, loader)
+        with self._lock:
+            entry = self._entries.get((mapel, paket))
+            if entry and entry['questions'] is questions and name in entry['derived']:
+                return entry['derived'][name]
+            version = entry['version'] if entry and entry['questions'] is questions else None
+        if self.shared and version is not None:
+            value = self.shared.cached(self._skey(f"d:{name}", (mapel, paket), version), lambda: build(questions))
+        else: value = build(questions)
+        with self._lock:
+            entry = self._entries.get((mapel, paket))
+            if entry and entry['questions'] is questions: entry['derived'][name] = value
+        return value
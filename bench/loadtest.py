@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import pickle
+import random
+import statistics
+import subprocess
+import sys
+import time
+from unittest import mock
+
+# Load test: N siswa (sesi Streamlit headless via AppTest) login, mulai ujian Matematika/Paket 1,
+# menjawab + navigasi semua soal lalu selesai. Backend = SQLite in-memory; operasi dihitung oleh
+# instrumentasi aplikasi sendiri (metrics.MeteredStorage: read = dokumen yang dikembalikan, minimal
+# 1 per query, seperti tagihan Firestore), jadi angka bench = angka tab Performa.
+# Semua sesi hidup bersamaan dan dijalankan bergiliran satu rerun per langkah (AppTest tidak
+# thread-safe; rerun Streamlit yang CPU-bound juga praktis serial karena GIL). Kapasitas kelas
+# diperkirakan dari throughput rerun x jeda antar klik siswa (--think-time).
+#
+#   python bench/loadtest.py --students 20 --questions 30           # bandingkan dengan baseline
+#   python bench/loadtest.py --students 20 --questions 30 --save    # simpan sebagai baseline baru
+#
+# Start awal diukur terpisah di proses baru (--startup-runs kali, diambil median): render pertama halaman
+# login (impor modul aplikasi + CSS + koneksi), render pertama sesi kedua (proses sudah hangat), selisihnya
+# sebagai biaya impor, dan modul berat (HEAVY) yang ikut termuat sepanjang alur siswa.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+import storage  # noqa: E402
+from auth import hash_password  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+APP = os.path.join(ROOT, 'app.py')
+PASSWORD = 'rahasia'
+HEAVY = ('pandas', 'altair', 'pyarrow')  # hanya boleh dimuat oleh panel admin / ekspor
+
+
+def new_app(timeout):
+    """AppTest app.py. Autosave hanya flush karena max_dirty / eksplisit (secrets [autosave] interval = inf,
+    tanpa flush tiap `interval` detik), agar jumlah write tidak bergantung pada kecepatan mesin."""
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.secrets['autosave'] = {'interval': float('inf')}
+    return at
+
+
+def patched(db):
+    """Storage aplikasi = db."""
+    return mock.patch.object(storage, 'open_storage', lambda *a, **k: db)
+
+
+def seed(db, students, questions):
+    for i in range(questions):
+        tipe = ['single', 'single', 'complex', 'category'][i % 4]
+        opsi = {'single': ['A1', 'B2', 'C3', 'D4'], 'complex': ['P', 'Q', 'R', 'S'], 'category': ['S1', 'S2', 'S3']}[tipe]
+        key = {'single': 'B2', 'complex': ['P', 'R'], 'category': {'S1': 'Benar', 'S2': 'Salah', 'S3': 'Benar'}}[tipe]
+        db.set('questions', f"bq{i:04d}", {'mapel': 'Matematika', 'paket': 'Paket 1', 'tipe': tipe,
+               'topik': ['Bilangan', 'Geometri', 'Pengukuran'][i % 3], 'pertanyaan': f"Soal benchmark {i}",
+               'gambar': None, 'opsi': json.dumps(opsi), 'kunci_jawaban': json.dumps(key)})
+    hashed = hash_password(PASSWORD)
+    for s in range(students):
+        u = f"siswa{s:04d}"
+        db.set('users', u, {'username': u, 'password': hashed, 'nama_lengkap': f"Siswa {s}", 'role': 'siswa'})
+
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def _timed(at, phase, samples):
+    t0 = time.perf_counter()
+    at.run()
+    samples.append((phase, (time.perf_counter() - t0) * 1000))
+    if at.exception: raise RuntimeError(f"{phase}: {at.exception[0].message}")
+    return at
+
+
+def _answer(at, db, qid, rnd):
+    q = db.get('questions', qid)
+    opsi = json.loads(q['opsi'])
+    if q['tipe'] == 'single': at.radio(key=qid).set_value(rnd.choice(opsi))
+    elif q['tipe'] == 'complex':
+        for o in rnd.sample(opsi, 2): at.checkbox(key=f"{qid}_{o}").check()
+    else:
+        for o in opsi: at.radio(key=f"{qid}_{o}").set_value(rnd.choice(['Benar', 'Salah']))
+
+
+def student(n, db, timeout, samples):
+    """Generator: satu langkah (rerun) per next(); hasil akhir = ukuran session_state."""
+    rnd = random.Random(n)
+    at = new_app(timeout)
+    _timed(at, 'open', samples)
+    yield
+    next(t for t in at.text_input if t.label == 'Username').set_value(f"siswa{n:04d}")
+    next(t for t in at.text_input if t.label == 'Password').set_value(PASSWORD)
+    _button(at, 'Masuk').click()
+    _timed(at, 'login', samples)
+    yield
+    _button(at, 'Mulai Paket 1').click()
+    _timed(at, 'start', samples)
+    yield
+
+    order = at.session_state['q_order']
+    for i, qid in enumerate(order):
+        _answer(at, db, qid, rnd)
+        _timed(at, 'answer', samples)
+        yield
+        if i % 5 == 4:
+            _button(at, '🟨 Ragu').click()
+            _timed(at, 'ragu', samples)
+            yield
+        _button(at, 'Selanjutnya ➡️' if i < len(order) - 1 else '✅ Selesai').click()
+        _timed(at, 'nav' if i < len(order) - 1 else 'finish', samples)
+        yield
+
+    state = at.session_state.to_dict()
+    size = 0
+    for v in state.values():
+        try: size += len(pickle.dumps(v))
+        except Exception: pass
+    return size
+
+
+def probe(timeout):
+    """Dijalankan di proses baru (--startup-probe): cetak waktu render pertama dingin / hangat (ms) dan modul
+    berat yang termuat setelah alur siswa login -> mulai ujian -> jawab -> selesai."""
+    db = storage.SQLiteStorage(':memory:')
+    seed(db, 1, 8)
+    samples = []
+    with patched(db):
+        _timed(new_app(timeout), 'cold', samples)
+        _timed(new_app(timeout), 'warm', samples)
+        for _ in student(0, db, timeout, samples): pass
+    cold, warm = samples[0][1], samples[1][1]
+    print(json.dumps({'first_render_ms': cold, 'warm_render_ms': warm,
+                      'heavy_modules': sorted(m for m in HEAVY if m in sys.modules)}))
+
+
+def startup(runs, timeout):
+    out = []
+    for _ in range(runs):
+        p = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup-probe', '--timeout', str(timeout)],
+                           capture_output=True, text=True, check=True)
+        out.append(json.loads(p.stdout.strip().splitlines()[-1]))
+    first, warm = (statistics.median(o[k] for o in out) for k in ('first_render_ms', 'warm_render_ms'))
+    return {'first_render_ms': round(first, 1), 'warm_render_ms': round(warm, 1),
+            'import_ms': round(first - warm, 1), 'heavy_modules': sorted({m for o in out for m in o['heavy_modules']})}
+
+
+def run(students, db, timeout):
+    samples, sizes = [], []
+    active = [student(n, db, timeout, samples) for n in range(students)]
+    while active:
+        for gen in list(active):
+            try: next(gen)
+            except StopIteration as done:
+                sizes.append(done.value); active.remove(gen)
+    return samples, sizes
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(samples, sizes, students, think_time):
+    lat = [ms for _, ms in samples]
+    busy = sum(lat) / 1000
+    phases = {}
+    for phase, ms in samples: phases.setdefault(phase, []).append(ms)
+    tot = metrics.REGISTRY.totals()
+    return {
+        'students': students,
+        'reruns': len(samples),
+        'reruns_per_s': round(len(samples) / busy, 1),
+        # siswa yang bisa dilayani satu proses bila tiap siswa klik sekali per think_time detik
+        'capacity_students': int(len(samples) / busy * think_time),
+        'latency_ms': {'p50': round(pct(lat, 50), 2), 'p95': round(pct(lat, 95), 2), 'p99': round(pct(lat, 99), 2)},
+        'phases_p95_ms': {k: round(pct(v, 95), 2) for k, v in sorted(phases.items())},
+        'reads_per_student': round(tot['reads'] / students, 2),
+        'writes_per_student': round(tot['writes'] / students, 2),
+        # read per rerun halaman (rerun penuh atau fragmen), dasar anggaran "read per klik"
+        'reads_per_call': {r['page']: round(r['reads_per_call'], 2) for r in metrics.REGISTRY.rows()
+                           if r['fn'] == metrics.PAGE and r['reads_per_call'] is not None},
+        'session_state_bytes': int(statistics.mean(sizes)),
+    }
+
+
+# (metrik, toleransi relatif) yang dicek terhadap baseline
+CHECKS = [('latency_ms.p50', 0.5), ('latency_ms.p95', 0.5), ('latency_ms.p99', 0.75),
+          ('reads_per_student', 0.1), ('writes_per_student', 0.1), ('session_state_bytes', 0.25),
+          ('startup.first_render_ms', 0.5), ('startup.import_ms', 0.5)]
+
+
+def _lookup(d, path):
+    for p in path.split('.'): d = d.get(p) if isinstance(d, dict) else None
+    return d
+
+
+def compare(cur, base, scale=1.0):
+    regressions = []
+    for path, tol in CHECKS:
+        b, c = _lookup(base, path), _lookup(cur, path)
+        if b is None or c is None: continue  # metrik belum ada di baseline / tidak diukur
+        if c > b * (1 + tol * scale) + 1e-9: regressions.append(f"{path}: {c} > baseline {b} (+{tol * scale:.0%})")
+    heavy = _lookup(cur, 'startup.heavy_modules')
+    if heavy: regressions.append(f"startup.heavy_modules: {', '.join(heavy)} termuat di alur siswa")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test alur ujian siswa")
+    ap.add_argument('--students', type=int, default=20)
+    ap.add_argument('--questions', type=int, default=30)
+    ap.add_argument('--think-time', type=float, default=10, help="rata-rata detik antar klik per siswa")
+    ap.add_argument('--timeout', type=float, default=60)
+    ap.add_argument('--save', action='store_true', help="simpan hasil sebagai baseline")
+    ap.add_argument('--tolerance-scale', type=float, default=1.0, help="pengali toleransi regresi")
+    ap.add_argument('--startup-runs', type=int, default=3, help="jumlah proses baru untuk ukur start awal (0 = lewati)")
+    ap.add_argument('--startup-probe', action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.startup_probe: return probe(args.timeout)
+
+    db = storage.SQLiteStorage(':memory:')
+    seed(db, args.students, args.questions)
+    metrics.REGISTRY.reset()
+
+    with patched(db):
+        samples, sizes = run(args.students, db, args.timeout)
+    result = summarize(samples, sizes, args.students, args.think_time)
+    result['questions'] = args.questions
+    if args.startup_runs: result['startup'] = startup(args.startup_runs, args.timeout)
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        with open(BASELINE, 'w') as f: json.dump(result, f, indent=2)
+        print(f"baseline disimpan: {BASELINE}")
+        return 0
+    if not os.path.exists(BASELINE):
+        print("belum ada baseline (jalankan dengan --save)")
+        return 0
+    with open(BASELINE) as f: base = json.load(f)
+    if (base.get('students'), base.get('questions')) != (args.students, args.questions):
+        print(f"peringatan: baseline memakai {base.get('students')} siswa / {base.get('questions')} soal")
+    regressions = compare(result, base, args.tolerance_scale)
+    for r in regressions: print("REGRESI", r)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
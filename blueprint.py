@@ -0,0 +1,62 @@
+import random
+
+# Kisi-kisi (blueprint) ujian per (mapel, paket): dokumen blueprints/{mapel}__{paket} berisi durasi, kebijakan
+# penilaian (lihat scoring.py), dan daftar strata {topik, tipe, n}; topik/tipe kosong = semua. Paket berfungsi sebagai bank soal; tiap
+# siswa mendapat n soal acak per stratum. Indeks strata {(topik, tipe): [qid]} dibangun sekali per versi
+# paket (data turunan QuestionBank), jadi merakit ujian hanya sebanding dengan jumlah soal di kisi-kisi.
+# Pengacakan memakai seed yang disimpan di sesi: ujian yang sama bisa dirakit ulang dari seed + versi paket.
+
+COLL = 'blueprints'
+DURASI = 75
+ANY = ''
+TIPE = {ANY: 'Semua', 'single': 'PG', 'complex': 'PG Kompleks', 'category': 'Benar/Salah'}
+
+
+def doc_id(mapel, paket):
+    return f"{mapel}__{paket}"
+
+
+def load(db, mapel, paket):
+    return db.get(COLL, doc_id(mapel, paket))
+
+
+def save(db, mapel, paket, strata, durasi=DURASI, penilaian=None):
+    strata = [{'topik': s.get('topik') or ANY, 'tipe': s.get('tipe') or ANY, 'n': int(s['n'])}
+              for s in strata if int(s.get('n') or 0) > 0]
+    doc = {'mapel': mapel, 'paket': paket, 'durasi': int(durasi), 'strata': strata}
+    if penilaian: doc['penilaian'] = penilaian
+    db.set(COLL, doc_id(mapel, paket), doc)
+
+
+def strata_index(questions):
+    """{(topik, tipe): [qid]} termasuk kombinasi wildcard; qid terurut agar sampling dengan seed stabil."""
+    index = {}
+    for qid in sorted(questions):
+        q = questions[qid]
+        topik, tipe = q.get('topik') or 'Umum', q.get('tipe', 'single')
+        for key in ((topik, tipe), (topik, ANY), (ANY, tipe), (ANY, ANY)): index.setdefault(key, []).append(qid)
+    return index
+
+
+def total(bp):
+    return sum(s['n'] for s in bp['strata'])
+
+
+def assemble(index, bp, seed):
+    """Urutan qid ujian. Tanpa kisi-kisi: semua soal paket diacak. ValueError bila stratum kekurangan soal."""
+    rnd = random.Random(seed)
+    if not bp or not bp.get('strata'):
+        order = list(index.get((ANY, ANY), []))
+        rnd.shuffle(order)
+        return order
+    chosen, order, short = set(), [], []
+    for s in bp['strata']:
+        pool = index.get((s['topik'], s['tipe']), [])
+        # Strata bisa tumpang tindih (mis. "Geometri" dan "PG Kompleks"): ambil lebih sebanyak soal
+        # yang sudah terpilih lalu buang duplikatnya
+        picks = [q for q in rnd.sample(pool, min(len(pool), s['n'] + len(chosen))) if q not in chosen][:s['n']]
+        if len(picks) < s['n']: short.append(f"{s['topik'] or 'semua topik'}/{TIPE[s['tipe']]}: {len(picks)} dari {s['n']}")
+        chosen.update(picks); order += picks
+    if short: raise ValueError("Soal tidak cukup untuk kisi-kisi (" + "; ".join(short) + ")")
+    rnd.shuffle(order)
+    return order
@@ -0,0 +1,323 @@
+import argparse
+import logging
+import os
+import pickle
+import socket
+import socketserver
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+# Tier cache bersama lintas proses / replika Streamlit di belakang load balancer. @st.cache_resource dan
+# session_state hanya hidup dalam satu proses; tanpa tier ini tiap replika memuat ulang bank soal, kunci
+# jawaban terkompilasi, dan agregat dashboard sendiri-sendiri. Dua implementasi dengan API yang sama:
+#   - LocalCache : file SQLite (WAL) di /dev/shm bila ada (memori bersama), dipakai semua proses satu mesin
+#   - RedisCache : klien protokol Redis (RESP) minimal tanpa dependensi, untuk replika di banyak mesin
+# `python cache.py serve` menjalankan server RESP lokal pengganti Redis (pengembangan / uji).
+#
+# Nilai diserialisasi dengan pickle, jadi server cache harus tepercaya (jaringan internal). Invalidasi:
+# TTL per entri, dan penghitung versi (incr) yang ikut menjadi bagian key data turunannya; penghitung
+# disimpan sebagai angka biasa agar bisa memakai INCR Redis. Cache yang tidak bisa dihubungi diperlakukan
+# sebagai miss: aplikasi tetap jalan dengan membaca database.
+
+TTL = 6 * 3600
+PURGE_EVERY = 200  # LocalCache: buang entri kedaluwarsa tiap N set
+
+log = logging.getLogger(__name__)
+
+
+class CacheError(Exception):
+    pass
+
+
+class Unavailable(ConnectionError):
+    """Server cache baru saja gagal dihubungi; tidak dicoba lagi untuk sementara."""
+
+
+ERRORS = (OSError, sqlite3.Error, CacheError)
+
+
+class Cache:
+    def _get(self, key): raise NotImplementedError  # bytes atau None
+    def _set(self, key, raw, ttl): raise NotImplementedError
+    def _delete(self, key): raise NotImplementedError
+    def _incr(self, key): raise NotImplementedError
+
+    def _safe(self, op, *a):
+        try: return op(*a)
+        except ERRORS as e:
+            _warn(op.__name__.strip('_'), e)
+            return None
+
+    def get(self, key):
+        raw = self._safe(self._get, key)
+        return None if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=TTL):
+        self._safe(self._set, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+
+    def delete(self, key):
+        self._safe(self._delete, key)
+
+    def incr(self, key):
+        """Naikkan penghitung secara atomik; None bila cache tidak tersedia."""
+        return self._safe(self._incr, key)
+
+    def counter(self, key):
+        """Nilai penghitung (0 bila belum ada); None bila cache tidak tersedia."""
+        try: raw = self._get(key)
+        except ERRORS as e:
+            _warn('get', e)
+            return None
+        return int(raw or 0)
+
+    def cached(self, key, build, ttl=TTL):
+        """Nilai key, atau build() yang lalu disimpan (None juga di-cache)."""
+        hit = self.get(key)
+        if hit is not None: return hit[0]
+        value = build()
+        self.set(key, (value,), ttl)
+        return value
+
+
+def _warn(op, e):
+    log.log(logging.DEBUG if isinstance(e, Unavailable) else logging.WARNING, "cache %s gagal: %s", op, e)
+
+
+# --- LOKAL (SQLITE) ---
+
+def default_path():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'cat_cache.sqlite')
+
+
+class LocalCache(Cache):
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        if os.path.dirname(self.path): os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._lock = threading.Lock()
+        self._sets = 0
+        for pragma in ('journal_mode=WAL', 'synchronous=OFF', 'busy_timeout=5000'):
+            self._conn.execute(f"PRAGMA {pragma}")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v BLOB NOT NULL, exp REAL)")
+
+    def _get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT v FROM kv WHERE k = ? AND (exp IS NULL OR exp > ?)", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, raw, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO kv (k, v, exp) VALUES (?, ?, ?)", (key, raw, now + ttl if ttl else None))
+            self._sets += 1
+            if self._sets % PURGE_EVERY == 0: self._conn.execute("DELETE FROM kv WHERE exp <= ?", (now,))
+
+    def _delete(self, key):
+        with self._lock: self._conn.execute("DELETE FROM kv WHERE k = ?", (key,))
+
+    def _incr(self, key):
+        with self._lock:
+            # BEGIN IMMEDIATE mengunci tulis antar proses, jadi baca-tambah-tulis tetap atomik
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT v FROM kv WHERE k = ? AND (exp IS NULL OR exp > ?)", (key, time.time())).fetchone()
+                n = int(row[0]) + 1 if row else 1
+                self._conn.execute("INSERT OR REPLACE INTO kv (k, v, exp) VALUES (?, ?, NULL)", (key, str(n).encode()))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return n
+
+
+# --- REDIS (RESP) ---
+
+def _bytes(v):
+    return v if isinstance(v, bytes) else str(v).encode()
+
+
+def _pack(*args):
+    args = [_bytes(a) for a in args]
+    return b'*%d\r\n' % len(args) + b''.join(b'$%d\r\n%s\r\n' % (len(a), a) for a in args)
+
+
+def _read(f):
+    line = f.readline()
+    if not line: raise ConnectionError("koneksi cache terputus")
+    kind, body = line[:1], line[1:-2]
+    if kind == b'+': return body
+    if kind == b'-': raise CacheError(body.decode(errors='replace'))
+    if kind == b':': return int(body)
+    if kind == b'$':
+        n = int(body)
+        if n < 0: return None
+        data = f.read(n + 2)
+        if len(data) < n + 2: raise ConnectionError("koneksi cache terputus")
+        return data[:-2]
+    if kind == b'*':
+        n = int(body)
+        return None if n < 0 else [_read(f) for _ in range(n)]
+    raise CacheError(f"balasan RESP tidak dikenal: {line[:20]!r}")
+
+
+def _close(conn):
+    conn[1].close(); conn[0].close()
+
+
+class RedisCache(Cache):
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, prefix='cat:', timeout=2.0, pool=8):
+        self.addr = (host, int(port))
+        self.db, self.password, self.prefix, self.timeout, self.pool = int(db), password, prefix, timeout, pool
+        self._idle = []  # koneksi (socket, file) yang siap dipakai ulang
+        self._lock = threading.Lock()
+        self._fail_until = 0.0
+
+    @classmethod
+    def from_url(cls, url, **kw):
+        """redis://[:password@]host[:port][/db]"""
+        u = urlparse(url)
+        return cls(u.hostname or '127.0.0.1', u.port or 6379, (u.path or '/0').strip('/') or 0, u.password, **kw)
+
+    @property
+    def _down(self):
+        return time.time() < self._fail_until
+
+    def _connect(self):
+        sock = socket.create_connection(self.addr, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile('rb'))
+        if self.password: self._send(conn, 'AUTH', self.password)
+        if self.db: self._send(conn, 'SELECT', self.db)
+        return conn
+
+    def _send(self, conn, *args):
+        conn[0].sendall(_pack(*args))
+        return _read(conn[1])
+
+    def _cmd(self, *args):
+        # Server yang baru gagal tidak dicoba lagi selama beberapa detik agar rerun tidak menunggu timeout
+        if self._down: raise Unavailable("cache tidak tersedia")
+        with self._lock: conn = self._idle.pop() if self._idle else None
+        retry = conn is not None  # koneksi dari pool bisa sudah ditutup server: ulangi sekali dengan koneksi baru
+        while True:
+            try:
+                conn = conn or self._connect()
+                out = self._send(conn, *args)
+                break
+            except CacheError:
+                if conn: self._release(conn)
+                raise
+            except OSError:
+                if conn: _close(conn)
+                conn = None
+                if not retry:
+                    self._fail_until = time.time() + 5
+                    raise
+                retry = False
+        self._release(conn)
+        return out
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool: self._idle.append(conn); return
+        _close(conn)
+
+    def _get(self, key): return self._cmd('GET', self.prefix + key)
+
+    def _set(self, key, raw, ttl):
+        self._cmd('SET', self.prefix + key, raw, *(('PX', int(ttl * 1000)) if ttl else ()))
+
+    def _delete(self, key): self._cmd('DEL', self.prefix + key)
+
+    def _incr(self, key): return self._cmd('INCR', self.prefix + key)
+
+    def ping(self):
+        return self._cmd('PING') == b'PONG'
+
+
+# --- SERVER PENGGANTI REDIS ---
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try: args = _read(self.rfile)
+            except (OSError, CacheError): return
+            try: out = self.server.run(*args) if isinstance(args, list) and args else CacheError("ERR perintah kosong")
+            except (ValueError, TypeError) as e: out = CacheError(f"ERR {e}")
+            self.wfile.write(_reply(out))
+
+
+def _reply(v):
+    if v is None: return b'$-1\r\n'
+    if isinstance(v, CacheError): return b'-%s\r\n' % str(v).encode()
+    if isinstance(v, bool): return b'+OK\r\n'
+    if isinstance(v, int): return b':%d\r\n' % v
+    if isinstance(v, str): return b'+%s\r\n' % v.encode()
+    return b'$%d\r\n%s\r\n' % (len(v), v)
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    """Subset Redis (PING, AUTH, SELECT, GET, SET [EX|PX], DEL, INCR, FLUSHDB) dalam memori."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr=('127.0.0.1', 6379)):
+        super().__init__(addr, _Handler)
+        self.data = {}  # key -> (nilai, kedaluwarsa)
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        v = self.data.get(key)
+        if v and v[1] is not None and v[1] <= time.time(): del self.data[key]; return None
+        return v
+
+    def run(self, cmd, *args):
+        cmd = cmd.upper()
+        with self.lock:
+            if cmd == b'PING': return 'PONG'
+            if cmd in (b'AUTH', b'SELECT'): return True
+            if cmd == b'GET': return (self._live(args[0]) or (None,))[0]
+            if cmd == b'SET':
+                exp = None
+                if len(args) >= 4: exp = time.time() + int(args[3]) / (1000 if args[2].upper() == b'PX' else 1)
+                self.data[args[0]] = (args[1], exp); return True
+            if cmd == b'DEL': return sum(self.data.pop(k, None) is not None for k in args)
+            if cmd == b'INCR':
+                v = self._live(args[0])
+                n = int(v[0]) + 1 if v else 1
+                self.data[args[0]] = (str(n).encode(), v[1] if v else None); return n
+            if cmd == b'FLUSHDB': self.data.clear(); return True
+        return CacheError(f"ERR perintah tidak didukung '{cmd.decode(errors='replace')}'")
+
+
+# --- KONFIGURASI ---
+
+def open_cache(conf):
+    """conf: dict dari secrets [cache] (backend = "local" | "redis", path = ..., url = redis://..., prefix = ...).
+    CAT_CACHE / CAT_CACHE_PATH / CAT_REDIS_URL di environment menimpa nilai secrets. Tanpa backend: None."""
+    backend = os.environ.get('CAT_CACHE') or conf.get('backend')
+    if not backend or backend == 'none': return None
+    if backend == 'local': return LocalCache(os.environ.get('CAT_CACHE_PATH') or conf.get('path'))
+    if backend == 'redis':
+        return RedisCache.from_url(os.environ.get('CAT_REDIS_URL') or conf.get('url', 'redis://127.0.0.1:6379/0'),
+                                   prefix=conf.get('prefix', 'cat:'))
+    raise ValueError(f"backend cache tidak dikenal: {backend}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Server RESP lokal pengganti Redis untuk tier cache bersama")
+    ap.add_argument('cmd', choices=['serve'])
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=6379)
+    args = ap.parse_args()
+    with StandInServer((args.host, args.port)) as srv:
+        print(f"cache stand-in di {args.host}:{args.port}")
+        srv.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import argparse
+import json
+
+import numpy as np
+
+# Format ringkas dokumen results. Pengganti 'details' (JSON berisi teks soal, kunci, dan jawaban
+# untuk setiap soal): hanya urutan qid, satu kode jawaban per posisi, tipe per posisi, bitmap
+# benar/salah, dan versi indeks paket saat dinilai. Teks soal & kunci diambil lagi dari bank soal
+# saat pembahasan dibuka.
+#
+# Kode jawaban (0 = kosong, RAW = jawaban di luar opsi, disimpan apa adanya di 'raw'):
+#   PG tunggal  : 1 + indeks opsi
+#   PG kompleks : bitmask indeks opsi yang dipilih
+#   Benar/Salah : digit basis 3 per pernyataan (1 = Benar, 2 = Salah)
+#
+#   python compact.py    # migrasi hasil lama (details) ke format ringkas
+
+FORMAT = 1
+RAW = -1
+TIPE = {'single': 's', 'complex': 'c', 'category': 'k'}
+VERDICT = ['Benar', 'Salah']
+GONE = '(soal sudah dihapus)'
+
+
+def pack_bits(flags):
+    return np.packbits(np.asarray(flags, bool), bitorder='little').tobytes().hex()
+
+
+def unpack_bits(hexstr, n):
+    return np.unpackbits(np.frombuffer(bytes.fromhex(hexstr), np.uint8), bitorder='little')[:n].astype(bool)
+
+
+def positions(opsi):
+    """{opsi: indeks} (indeks pertama bila ada opsi kembar); disimpan di kunci terkompilasi sebagai 'pos'."""
+    return {o: i for i, o in reversed(list(enumerate(opsi)))}
+
+
+def encode_answer(tipe, pos, ans):
+    """Kode int jawaban, atau None bila tidak bisa dikodekan dengan opsi yang ada. pos: positions(opsi)."""
+    if not ans: return 0
+    try:
+        if tipe == 'single': return pos[ans] + 1
+        if tipe == 'complex' and isinstance(ans, list): return sum(1 << pos[a] for a in set(ans))
+        if tipe == 'category' and isinstance(ans, dict):
+            return sum((VERDICT.index(v) + 1) * 3 ** pos[o] for o, v in ans.items())
+    except (KeyError, TypeError, ValueError): return None
+    return None
+
+
+def decode_answer(tipe, opsi, code):
+    if tipe == 'single': return opsi[code - 1] if 0 < code <= len(opsi) else None
+    if tipe == 'complex': return [o for i, o in enumerate(opsi) if code >> i & 1]
+    if tipe == 'category':
+        out = {}
+        for o in opsi:
+            code, d = divmod(code, 3)
+            if d: out[o] = VERDICT[d - 1]
+        return out
+    return None
+
+
+def fields(q_ids, codes, benar, raw, keys, paket_version=0):
+    """Field dokumen hasil format ringkas. raw: {posisi: jawaban} untuk kode RAW."""
+    tipe = ''.join(TIPE.get(keys[q]['tipe'], '?') if q in keys else '?' for q in q_ids)
+    return {'enc': FORMAT, 'q_ids': list(q_ids), 'tipe': tipe, 'codes': [int(c) for c in codes],
+            'bits': pack_bits(benar), 'raw': {i: v for i, v in raw.items() if v is not None}, 'paket_version': paket_version}
+
+
+def encode(details, keys, paket_version=0):
+    """Field ringkas dari details format lama; keys = kunci terkompilasi (dengan opsi)."""
+    codes, raw = [], {}
+    for i, d in enumerate(details):
+        k = keys.get(d['qid'])
+        c = encode_answer(k['tipe'], k['pos'], d['jawab']) if k else None
+        if c is None: c = RAW; raw[str(i)] = d['jawab']
+        codes.append(c)
+    return fields([d['qid'] for d in details], codes, [d['benar'] for d in details], raw, keys, paket_version)
+
+
+def decode(res, keys):
+    """Bangun ulang details (qid, tanya, jawab, kunci, benar, topik) dari hasil ringkas + kunci saat ini."""
+    benar = unpack_bits(res['bits'], len(res['q_ids']))
+    raw = res.get('raw') or {}
+    out = []
+    for i, (qid, c) in enumerate(zip(res['q_ids'], res['codes'])):
+        k = keys.get(qid)
+        jawab = raw.get(str(i)) if c == RAW else decode_answer(k['tipe'], k['opsi'], c) if k else None
+        out.append({'qid': qid, 'tanya': k['pertanyaan'] if k else GONE, 'jawab': jawab,
+                    'kunci': k['key'] if k else '-', 'benar': bool(benar[i]), 'topik': k['topik'] if k else '-'})
+    return out
+
+
+def migrate(db, bank=None, on_progress=None):
+    """Ubah semua hasil berformat lama ke format ringkas, satu halaman (urut ts) per batch sehingga
+    memori & durasi tiap baca tidak bergantung pada jumlah hasil. Kembalikan jumlah dokumen yang diubah."""
+    from bank import QuestionBank
+    from export import pages
+    from finalizer import paket_keys, paket_version
+    import stats
+    bank = bank or QuestionBank()
+    # Halaman urut ts: hasil lama tanpa ts (justru yang ber-details) dilengkapi dulu agar ikut terbaca
+    stats.backfill_ts(db)
+    done = 0
+    for rows in pages(db, fields=None):
+        docs = []
+        for res in rows:
+            if 'details' not in res: continue
+            details = json.loads(res['details'] or '[]')
+            # Hasil sangat lama tanpa qid per soal tidak bisa dipetakan ke bank soal: biarkan
+            if any('qid' not in d for d in details): continue
+            keys = paket_keys(db, bank, res['mapel'], res['paket'], [d['qid'] for d in details])
+            doc = {k: v for k, v in res.items() if k not in ('id', 'details')}
+            doc.update(encode(details, keys, paket_version(db, bank, res['mapel'], res['paket'])))
+            docs.append((res['id'], doc))
+        for i in range(0, len(docs), 500):
+            batch = db.batch()
+            for rid, doc in docs[i:i + 500]: batch.set('results', rid, doc)
+            batch.commit()
+        done += len(docs)
+        if on_progress: on_progress(done)
+    return done
+
+
+def main():
+    from finalizer import _secrets
+    from storage import open_storage
+    argparse.ArgumentParser(description="Migrasi details hasil ujian ke format ringkas").parse_args()
+    secrets = _secrets()
+    db = open_storage(secrets.get('storage', {}), lambda: secrets['firebase'])
+    print(f"{migrate(db, on_progress=lambda n: print(f'{n} hasil...'))} hasil dimigrasi")
+
+
+if __name__ == '__main__':
+    main()
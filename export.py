@@ -0,0 +1,132 @@
+import argparse
+import csv
+import json
+from datetime import datetime, timedelta
+
+import qindex
+from storage import page_after
+
+# Ekspor semua hasil ujian (opsional difilter mapel / paket / rentang tanggal) ke CSV atau Parquet.
+# Hasil dibaca per halaman urut ts dan langsung ditulis ke file, jadi memori tidak bergantung pada
+# jumlah hasil. topic_analysis diratakan menjadi kolom "<topik> benar" / "<topik> total"; daftar topik
+# diambil dari indeks soal paket-paket terkait (header harus tetap sebelum baris pertama ditulis).
+# Topik yang sudah tidak ada di bank soal masuk kolom topik_lain (JSON).
+# Filter mapel / paket + urut ts butuh composite index Firestore results(mapel, ts), (paket, ts) dan
+# (mapel, paket, ts); lihat firestore.indexes.json.
+#
+#   python export.py hasil.csv --mapel Matematika --dari 2026-01-01 --sampai 2026-06-30
+#   python export.py hasil.parquet
+
+PAGE = 1000
+BASE = ['id', 'username', 'nama', 'mapel', 'paket', 'tanggal', 'skor']
+FIELDS = BASE[1:] + ['ts', 'topic_analysis']
+OTHER = 'topik_lain'
+FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+
+def _where(mapel=None, paket=None, start=None, end=None):
+    w = [('mapel', '==', mapel)] if mapel else []
+    if paket: w.append(('paket', '==', paket))
+    if start: w.append(('ts', '>=', datetime.combine(start, datetime.min.time()).timestamp()))
+    if end: w.append(('ts', '<', datetime.combine(end + timedelta(days=1), datetime.min.time()).timestamp()))
+    return w
+
+
+def pages(db, mapel=None, paket=None, start=None, end=None, page=PAGE, fields=FIELDS):
+    """Hasil per halaman urut ts. Hasil lama (ts dari tanggal per menit) bisa punya ts kembar di batas
+    halaman, jadi cursor-nya storage.page_after (ts terakhir + ID yang sudah dikirim pada ts itu)."""
+    where, cursor = _where(mapel, paket, start, end), None
+    while True:
+        rows, cursor, done = page_after(db, 'results', where, 'ts', cursor, page, fields=fields)
+        if rows: yield rows
+        if done: return
+
+
+def topics(db, mapel=None, paket=None):
+    where = [(f, '==', v) for f, v in (('mapel', mapel), ('paket', paket)) if v]
+    have = {(d['mapel'], d['paket']) for d in db.query(qindex.COLL, where, fields=['mapel', 'paket'])}
+    pairs = set(have)
+    # Paket yang belum pernah dibuka di editor belum punya indeks: bangun dari koleksi questions
+    # (sekalian disimpan), kalau tidak semua topiknya jatuh ke topik_lain
+    if not (mapel and paket and have):
+        pairs |= {(q['mapel'], q['paket']) for q in db.query('questions', where, fields=['mapel', 'paket'])}
+    idx = [qindex.load(db, m, p) if (m, p) in have else qindex.rebuild(db, m, p) for m, p in pairs]
+    return sorted({it['topik'] for d in idx for it in d['items'].values()})
+
+
+def columns(topik):
+    return BASE + [f"{t} {k}" for t in topik for k in ('benar', 'total')] + [OTHER]
+
+
+def flatten(res, topik):
+    ta = res.get('topic_analysis') or {}
+    if isinstance(ta, str): ta = json.loads(ta)
+    row = [res['id'], *(res.get(k) for k in BASE[1:])]
+    for t in topik:
+        v = ta.get(t)
+        row += [v['correct'], v['total']] if v else [None, None]
+    other = {t: v for t, v in ta.items() if t not in topik}
+    return row + [json.dumps(other) if other else None]
+
+
+def write_csv(db, out, on_progress=None, **flt):
+    """Tulis ke file teks out. Kembalikan jumlah baris."""
+    topik = topics(db, flt.get('mapel'), flt.get('paket'))
+    w = csv.writer(out)
+    w.writerow(columns(topik))
+    n = 0
+    for rows in pages(db, **flt):
+        w.writerows(flatten(r, topik) for r in rows)
+        n += len(rows)
+        if on_progress: on_progress(n)
+    return n
+
+
+def write_parquet(db, out, on_progress=None, **flt):
+    """Tulis ke file biner out, satu row group per halaman. Butuh pyarrow."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    topik = topics(db, flt.get('mapel'), flt.get('paket'))
+    cols = columns(topik)
+    schema = pa.schema([(c, pa.float64() if c == 'skor' else pa.string() if c in BASE or c == OTHER else pa.int32())
+                        for c in cols])
+    n = 0
+    with pq.ParquetWriter(out, schema) as w:
+        for rows in pages(db, **flt):
+            data = list(zip(*(flatten(r, topik) for r in rows)))
+            w.write_table(pa.Table.from_arrays([pa.array(v, type=schema.field(i).type) for i, v in enumerate(data)], schema=schema))
+            n += len(rows)
+            if on_progress: on_progress(n)
+    return n
+
+
+def write(db, fmt, out, on_progress=None, **flt):
+    return (write_parquet if fmt == 'parquet' else write_csv)(db, out, on_progress, **flt)
+
+
+def parquet_available():
+    try: import pyarrow.parquet  # noqa: F401
+    except ImportError: return False
+    return True
+
+
+def main():
+    from finalizer import _secrets
+    from storage import open_storage
+    ap = argparse.ArgumentParser(description="Ekspor hasil ujian ke CSV / Parquet")
+    ap.add_argument('out', help="file tujuan (.csv atau .parquet)")
+    ap.add_argument('--mapel'); ap.add_argument('--paket')
+    ap.add_argument('--dari', type=datetime.fromisoformat, help="YYYY-MM-DD")
+    ap.add_argument('--sampai', type=datetime.fromisoformat, help="YYYY-MM-DD (inklusif)")
+    args = ap.parse_args()
+    secrets = _secrets()
+    db = open_storage(secrets.get('storage', {}), lambda: secrets['firebase'])
+    fmt = 'parquet' if args.out.endswith('.parquet') else 'csv'
+    flt = {'mapel': args.mapel, 'paket': args.paket, 'start': args.dari and args.dari.date(), 'end': args.sampai and args.sampai.date()}
+    with open(args.out, 'wb' if fmt == 'parquet' else 'w', **({} if fmt == 'parquet' else {'newline': '', 'encoding': 'utf-8'})) as f:
+        n = write(db, fmt, f, lambda n: print(f"{n} hasil..."), **flt)
+    print(f"{n} hasil diekspor ke {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import analysis
+import blueprint
+import metrics
+import profiles
+import qindex
+import stats as class_stats
+from bank import QuestionBank
+from cache import open_cache
+from compact import RAW, encode, encode_answer, fields, pack_bits, unpack_bits
+from export import pages
+from scoring import compile_key, compile_keys, final_score, policy_of, score_batch, score_codes, topic_stats
+
+# Penilaian akhir sesi ujian. Satu jalur yang sama dipakai tombol Selesai / waktu habis di browser
+# siswa (app.calculate_score) dan worker latar yang menutup sesi 'ongoing' yang sudah lewat end_time
+# (siswa menutup tab). Transaksi commit_results mengecek ulang status == 'ongoing' dan ID hasil
+# deterministik, jadi sesi yang diselesaikan siswa dan worker bersamaan hanya dinilai sekali.
+#
+#   python finalizer.py              # sekali jalan
+#   python finalizer.py --loop 60    # terus-menerus, tiap 60 detik
+#   python finalizer.py --rescore Matematika "Paket 1"   # nilai ulang paket setelah kunci dikoreksi
+
+BATCH_SIZE = 50   # sesi per transaksi
+WORKERS = 4
+INTERVAL = 60
+GRACE = 60        # detik setelah end_time sebelum worker mengambil alih dari browser siswa
+PAGE = 500
+
+log = logging.getLogger(__name__)
+
+
+def result_id(sid, sess):
+    return f"{sid}_{int(sess.get('start_time', 0))}"
+
+
+def _loader(db):
+    return lambda m, p: db.query('questions', [('mapel', '==', m), ('paket', '==', p)])
+
+
+def paket_keys(db, bank, mapel, paket, q_ids):
+    keys = bank.get_derived(mapel, paket, 'keys', compile_keys, _loader(db))
+    missing = [qid for qid in q_ids if qid not in keys]
+    if missing:
+        # Soal yang sudah pindah paket: ambil sekaligus dalam satu batched read
+        keys = dict(keys)
+        for qid, q in db.get_many('questions', missing).items(): keys[qid] = compile_key(q)
+    return keys
+
+
+def paket_version(db, bank, mapel, paket):
+    # Versi question_index saat paket dimuat ke bank; disimpan di hasil sebagai referensi
+    return bank.get_derived(mapel, paket, 'version',
+                            lambda qs: qindex.version(db, mapel, paket), _loader(db))
+
+
+def paket_plan(db, bank, mapel, paket):
+    # Kisi-kisi (durasi, strata, kebijakan penilaian) ikut di-cache per versi paket; admin bank.bump setelah menyimpan
+    return bank.get_derived(mapel, paket, 'blueprint', lambda qs: blueprint.load(db, mapel, paket), _loader(db))
+
+
+def paket_policy(db, bank, mapel, paket):
+    return policy_of(paket_plan(db, bank, mapel, paket))
+
+
+def _load(v, default):
+    # Sesi format lama menyimpan q_order / answers sebagai JSON string
+    if isinstance(v, str): return json.loads(v)
+    return v if v is not None else default
+
+
+def build_result(sess, answers, keys, nama, now=None, version=0, policy=None, scored=None):
+    """Nilai satu sesi (atau pakai scored dari score_batch). Kembalikan (dokumen hasil format ringkas,
+    jawaban terkode, statistik topik)."""
+    final, coded, topics = scored or score_batch([_load(sess['q_order'], [])], [answers], keys, policy_of({'penilaian': policy}))[0]
+    # tanggal: sesi kedaluwarsa dicatat pada end_time-nya, bukan saat worker menilainya.
+    # ts = waktu penilaian, selalu naik sehingga bisa dipakai sebagai cursor (riwayat, analisis butir).
+    ts = now or time.time()
+    done = min(ts, sess.get('end_time') or float('inf'))
+    result = {
+        'username': sess['username'], 'nama': nama,
+        'mapel': sess['mapel'], 'paket': sess['paket'],
+        'skor': final, 'tanggal': datetime.fromtimestamp(done).strftime("%Y-%m-%d %H:%M"), 'ts': ts,
+        'topic_analysis': json.dumps(topics), 'n_soal': len(_load(sess['q_order'], [])),
+        **fields(coded['q_ids'], coded['codes'], coded['benar'], coded['raw'], keys, version)
+    }
+    return result, coded, topics
+
+
+def commit_results(db, items):
+    """items: [(sid, result_id, update sesi, hasil)]. Semua ditulis dalam satu transaksi bersama
+    statistik kelas (termasuk papan peringkat) dan profil siswa; sesi yang sudah tidak 'ongoing'
+    dilewati. Kembalikan sid yang dinilai."""
+    def run(tx):
+        # Firestore: semua baca sebelum tulis
+        live = [it for it in items if (tx.get('exam_sessions', it[0]) or {}).get('status') == 'ongoing']
+        aggs, profs = {}, {}
+        for _, _, _, res in live:
+            key = (res['mapel'], res['paket'])
+            if key not in aggs:
+                agg_id = class_stats.shard_id(*key)
+                aggs[key] = (agg_id, tx.get('stats', agg_id))
+            if res['username'] not in profs: profs[res['username']] = tx.get(profiles.COLL, res['username'])
+        for sid, rid, upd, res in live:
+            tx.update('exam_sessions', sid, upd)
+            tx.set('results', rid, res)
+            key = (res['mapel'], res['paket'])
+            aggs[key] = (aggs[key][0], class_stats.apply_result(aggs[key][1], res))
+            profs[res['username']] = profiles.apply_result(profs[res['username']], res)
+        for agg_id, agg in aggs.values(): tx.set('stats', agg_id, agg)
+        for username, prof in profs.items(): tx.set(profiles.COLL, username, prof)
+        return [it[0] for it in live]
+    return db.transaction(run)
+
+
+def expired(db, now=None, limit=PAGE):
+    # Firestore butuh composite index exam_sessions(status, end_time): lihat firestore.indexes.json
+    cutoff = (now or time.time()) - GRACE
+    return db.query('exam_sessions', [('status', '==', 'ongoing'), ('end_time', '<=', cutoff)], limit=limit)
+
+
+def score_sessions(db, bank, sessions, names=None, now=None):
+    """Item commit_results [(sid, result_id, update sesi, hasil)] untuk sesi-sesi satu paket (dict sesi
+    dengan 'id'). Kunci & kebijakan sama, jadi semua dinilai sekaligus dalam satu pass vektor."""
+    m, p = sessions[0]['mapel'], sessions[0]['paket']
+    orders, answers = [_load(s['q_order'], []) for s in sessions], [_load(s.get('answers'), {}) for s in sessions]
+    keys = paket_keys(db, bank, m, p, sorted({qid for o in orders for qid in o}))
+    version = paket_version(db, bank, m, p)
+    items = []
+    for s, a, scored in zip(sessions, answers, score_batch(orders, answers, keys, paket_policy(db, bank, m, p))):
+        res, _, _ = build_result(s, a, keys, s.get('nama') or (names or {}).get(s['username'], s['username']), now,
+                                 version, scored=scored)
+        items.append((s['id'], result_id(s['id'], s), {'status': 'completed', 'score': res['skor']}, res))
+    return items
+
+
+def finalize_expired(db, bank=None, workers=WORKERS, batch_size=BATCH_SIZE, now=None):
+    """Nilai semua sesi kedaluwarsa. Kembalikan jumlah sesi yang dinilai."""
+    bank = bank or QuestionBank()
+    done = 0
+    while True:
+        sessions = expired(db, now)
+        if not sessions: return done
+        # Sesi lama belum menyimpan nama: ambil sekali untuk semua user yang perlu
+        need = sorted({s['username'] for s in sessions if not s.get('nama')})
+        names = {u: d.get('nama_lengkap', u) for u, d in db.get_many('users', need).items()} if need else {}
+
+        @metrics.track(page='finalizer')
+        def work(chunk):
+            return len(commit_results(db, score_sessions(db, bank, chunk, names, now)))
+
+        groups = {}
+        for s in sessions: groups.setdefault((s['mapel'], s['paket']), []).append(s)
+        chunks = [g[i:i + batch_size] for g in groups.values() for i in range(0, len(g), batch_size)]
+        with ThreadPoolExecutor(workers) as pool: n = sum(pool.map(work, chunks))
+        done += n
+        # n == 0: semua sudah diselesaikan pihak lain di antara query dan commit
+        if len(sessions) < PAGE or n == 0: return done
+
+
+def _recode(k, code, raw):
+    # Jawaban di luar opsi dicoba dikodekan lagi (opsi mungkin ikut dikoreksi bersama kunci)
+    if code != RAW or raw is None: return code
+    c = encode_answer(k['tipe'], k['pos'], raw)
+    return RAW if c is None else c
+
+
+def rescore(db, mapel, paket, bank=None, on_progress=None):
+    """Nilai ulang semua hasil satu paket dengan kunci & kebijakan saat ini (mis. setelah kunci dikoreksi),
+    lalu bangun ulang statistik kelas dan analisis butir. Hasil format lama sekalian diubah ke format
+    ringkas. Kembalikan jumlah hasil yang skornya berubah."""
+    # Statistik & profil dibangun ulang di akhir: tolak sebelum mengubah apa pun bila ada ujian berlangsung
+    class_stats.ensure_idle(db)
+    bank = bank or QuestionBank()
+    policy, version = paket_policy(db, bank, mapel, paket), paket_version(db, bank, mapel, paket)
+    changed = 0
+    for rows in pages(db, mapel, paket, page=PAGE, fields=None):
+        docs = []
+        for r in rows:
+            if 'q_ids' not in r:
+                details = json.loads(r.get('details') or '[]')
+                # Hasil sangat lama tanpa qid tidak bisa dipetakan ke kunci: dilewati
+                if any('qid' not in d for d in details): continue
+                keys = paket_keys(db, bank, mapel, paket, [d['qid'] for d in details])
+                r = {**{k: v for k, v in r.items() if k != 'details'}, **encode(details, keys, version)}
+            docs.append(r)
+        keys = paket_keys(db, bank, mapel, paket, sorted({q for r in docs for q in r['q_ids']}))
+        # Soal yang sudah dihapus tidak bisa dinilai ulang: putusan lamanya dipertahankan
+        pos = [[i for i, q in enumerate(r['q_ids']) if q in keys] for r in docs]
+        for r, p in zip(docs, pos):
+            for i in p: r['codes'][i] = _recode(keys[r['q_ids'][i]], r['codes'][i], r['raw'].get(str(i)))
+            r['raw'] = {i: v for i, v in r['raw'].items() if r['codes'][int(i)] == RAW}
+        q_ids = [[r['q_ids'][i] for i in p] for r, p in zip(docs, pos)]
+        totals, benar = score_codes(q_ids, [[r['codes'][i] for i in p] for r, p in zip(docs, pos)], keys, policy,
+                                    [{str(j): r['raw'][str(i)] for j, i in enumerate(p) if str(i) in r['raw']} for r, p in zip(docs, pos)])
+        batch = db.batch()
+        for r, p, qs, total, b in zip(docs, pos, q_ids, totals, benar):
+            bits = unpack_bits(r['bits'], len(r['q_ids']))
+            kept = int(bits.sum() - bits[p].sum())
+            bits[p] = b
+            skor = final_score(total + kept, r.get('n_soal', len(r['q_ids'])))
+            if abs(skor - r['skor']) > 1e-9: changed += 1
+            batch.set('results', r.pop('id'), {**r, 'skor': skor, 'bits': pack_bits(bits),
+                                               'topic_analysis': json.dumps(topic_stats(qs, b, keys))})
+        batch.commit()
+        if on_progress: on_progress(changed)
+    class_stats.rebuild(db)
+    profiles.rebuild(db)
+    analysis.rebuild(db, mapel, paket)
+    return changed
+
+
+def start_worker(db, bank=None, interval=INTERVAL):
+    """Thread daemon yang menjalankan finalize_expired tiap interval detik. Kembalikan Event untuk berhenti."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                with metrics.scope('finalizer', 'loop'): n = finalize_expired(db, bank)
+                if n: log.info("finalizer: %d sesi kedaluwarsa dinilai", n)
+            except Exception:
+                log.exception("finalizer gagal")
+
+    threading.Thread(target=loop, name='finalizer', daemon=True).start()
+    return stop
+
+
+def _secrets():
+    path = os.path.join('.streamlit', 'secrets.toml')
+    if not os.path.exists(path): return {}
+    import tomllib
+    with open(path, 'rb') as f: return tomllib.load(f)
+
+
+def main():
+    from storage import open_storage
+    ap = argparse.ArgumentParser(description="Nilai sesi ujian yang sudah lewat waktu")
+    ap.add_argument('--loop', type=float, default=0, help="ulangi tiap N detik (0 = sekali jalan)")
+    ap.add_argument('--workers', type=int, default=WORKERS)
+    ap.add_argument('--rescore', nargs=2, metavar=('MAPEL', 'PAKET'), help="nilai ulang semua hasil satu paket lalu keluar")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    secrets = _secrets()
+    db = open_storage(secrets.get('storage', {}), lambda: secrets['firebase'])
+    bank = QuestionBank(shared=open_cache(secrets.get('cache', {})))
+    if args.rescore:
+        log.info("%d hasil berubah skor", rescore(db, *args.rescore, bank=bank))
+        return
+    while True:
+        log.info("%d sesi dinilai", finalize_expired(db, bank, args.workers))
+        if not args.loop: return
+        time.sleep(args.loop)
+
+
+if __name__ == '__main__':
+    main()
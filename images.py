@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+
+from PIL import Image, UnidentifiedImageError
+
+# Penyimpanan gambar soal berbasis hash konten (sha256). Gambar yang sama hanya disimpan
+# sekali; saat upload dibuat beberapa rendisi (full, md untuk layar ujian, thumb untuk editor)
+# sehingga dokumen soal cukup menyimpan referensi 'img:<hash>'.
+
+REF_PREFIX = 'img:'
+RENDITIONS = {'full': 1280, 'md': 800, 'thumb': 200}
+MAX_BLOB = 900 * 1024  # tetap di bawah batas 1 MiB dokumen Firestore
+
+
+class InvalidImage(ValueError):
+    """Upload bukan gambar yang bisa dibaca PIL (file lain, rusak, atau terlalu besar)."""
+
+
+def is_ref(value):
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+def _encode(img, max_side):
+    img = img.copy()
+    img.thumbnail((max_side, max_side))
+    buf = io.BytesIO()
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img.save(buf, 'PNG', optimize=True)
+        if buf.tell() <= MAX_BLOB: return buf.getvalue()
+        img = img.convert('RGBA')
+        bg = Image.new('RGB', img.size, 'white'); bg.paste(img, mask=img.split()[-1]); img = bg
+        buf = io.BytesIO()
+    quality = 85
+    img.convert('RGB').save(buf, 'JPEG', quality=quality, optimize=True)
+    while buf.tell() > MAX_BLOB and quality > 40:
+        quality -= 15; buf = io.BytesIO()
+        img.convert('RGB').save(buf, 'JPEG', quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def make_renditions(data):
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+    return {name: _encode(img, side) for name, side in RENDITIONS.items()}
+
+
+class ImageStore:
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        if not self._exists(digest):
+            for name, blob in make_renditions(data).items(): self._write(digest, name, blob)
+        return REF_PREFIX + digest
+
+    def get(self, ref, size='md'):
+        if not is_ref(ref): return None
+        return self._read(ref[len(REF_PREFIX):], size if size in RENDITIONS else 'full')
+
+
+class LocalImageStore(ImageStore):
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, digest, name):
+        return os.path.join(self.root, digest[:2], f"{digest}_{name}")
+
+    def _exists(self, digest):
+        return all(os.path.exists(self._path(digest, n)) for n in RENDITIONS)
+
+    def _write(self, digest, name, blob):
+        path = self._path(digest, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f: f.write(blob)
+        os.replace(tmp, path)
+
+    def _read(self, digest, name):
+        try:
+            with open(self._path(digest, name), 'rb') as f: return f.read()
+        except FileNotFoundError: return None
+
+
+class DbImageStore(ImageStore):
+    # Disimpan di koleksi 'images' pada storage utama (Firestore atau SQLite)
+    def __init__(self, db, collection='images'):
+        self.db = db
+        self.collection = collection
+
+    def _exists(self, digest):
+        # 'thumb' ditulis terakhir, jadi keberadaannya menandakan semua rendisi lengkap
+        return self.db.get(self.collection, f"{digest}_thumb") is not None
+
+    def _write(self, digest, name, blob):
+        self.db.set(self.collection, f"{digest}_{name}", {'hash': digest, 'size': name, 'data': blob})
+
+    def _read(self, digest, name):
+        doc = self.db.get(self.collection, f"{digest}_{name}")
+        return doc['data'] if doc else None
@@ -0,0 +1,145 @@
+import csv
+import hashlib
+import io
+import json
+import time
+
+import qindex
+
+# Import bank soal dari CSV. Mendukung dua format:
+#   - template_soal.csv  : mapel,topik,tipe,pertanyaan,opsi(JSON),kunci_jawaban(JSON)
+#   - template_mudah.csv : mapel;topik;tipe;pertanyaan;pilihan_a..d;jawaban_benar
+# Pemisah kolom (| ; , tab) dideteksi dari header. Semua baris divalidasi dulu, baru ditulis
+# per batch (maks 500) bersama indeks paketnya. ID dokumen deterministik sehingga upload ulang =
+# upsert, bukan duplikat.
+
+BATCH_SIZE = 500
+DELIMS = ['|', ';', ',', '\t']
+PILIHAN = ['pilihan_a', 'pilihan_b', 'pilihan_c', 'pilihan_d']
+TIPE = ['single', 'complex', 'category']
+
+
+def question_id(mapel, paket, pertanyaan):
+    norm = ' '.join(pertanyaan.split()).lower()
+    return hashlib.sha1(f"{mapel}|{paket}|{norm}".encode()).hexdigest()[:20]
+
+
+def _split(s):
+    return [x.strip() for x in s.split(',') if x.strip()]
+
+
+def _tipe_mudah(t):
+    if 'Check' in t: return 'complex'
+    if 'Benar' in t: return 'category'
+    return 'single'
+
+
+def _from_mudah(r):
+    opsi = [r.get(c, '') for c in PILIHAN]
+    opsi = [o for o in opsi if o and o != '-']
+    tipe = _tipe_mudah(r.get('tipe', ''))
+    raw = r.get('jawaban_benar', '')
+    if tipe == 'single':
+        key = raw
+        # Boleh juga menulis huruf pilihan (A-D)
+        idx = ord(raw.upper()) - 65 if len(raw) == 1 else -1
+        if raw not in opsi and 0 <= idx < len(opsi): key = opsi[idx]
+    elif tipe == 'complex': key = _split(raw)
+    else:
+        ks = _split(raw)
+        if len(ks) > len(opsi): raise ValueError(f"{len(ks)} kunci untuk {len(opsi)} pernyataan")
+        key = {opsi[i]: ks[i] for i in range(len(ks))}
+    return tipe, opsi, key
+
+
+def _from_soal(r):
+    tipe = r.get('tipe', '')
+    try: opsi = json.loads(r.get('opsi') or '[]')
+    except ValueError: raise ValueError("kolom opsi bukan JSON yang valid")
+    if not isinstance(opsi, list): raise ValueError("kolom opsi harus berupa list JSON")
+    opsi = [str(o) for o in opsi]
+    raw = r.get('kunci_jawaban', '')
+    try: key = json.loads(raw)
+    except ValueError: key = raw
+    if tipe == 'single' and not isinstance(key, str): key = str(key)
+    return tipe, opsi, key
+
+
+def _check(tipe, opsi, key):
+    if tipe not in TIPE: raise ValueError(f"tipe '{tipe}' tidak dikenal")
+    if not opsi: raise ValueError("opsi kosong")
+    if tipe == 'single' and key not in opsi: raise ValueError(f"kunci '{key}' tidak ada di opsi")
+    if tipe == 'complex':
+        if not isinstance(key, list) or not key: raise ValueError("kunci PG kompleks kosong")
+        bad = [k for k in key if k not in opsi]
+        if bad: raise ValueError(f"kunci {bad} tidak ada di opsi")
+    if tipe == 'category':
+        if not isinstance(key, dict) or not key: raise ValueError("kunci Benar/Salah kosong")
+        bad = [v for v in key.values() if v not in ('Benar', 'Salah')]
+        if bad: raise ValueError(f"nilai kunci harus Benar/Salah, bukan {bad}")
+        if any(k not in opsi for k in key): raise ValueError("kunci merujuk pernyataan yang tidak ada")
+
+
+def parse(text, default_paket='Paket 1'):
+    """Yield (baris, id, soal, error) untuk setiap baris data, tanpa memuat seluruh file."""
+    f = io.StringIO(text.lstrip('\ufeff'))
+    header = f.readline()
+    delim = max(DELIMS, key=header.count)
+    cols = [c.strip().lower() for c in next(csv.reader([header], delimiter=delim))]
+    if 'jawaban_benar' in cols: convert = _from_mudah
+    elif 'kunci_jawaban' in cols: convert = _from_soal
+    else: raise ValueError("Header tidak dikenali: butuh kolom jawaban_benar atau kunci_jawaban")
+
+    reader = csv.reader(f, delimiter=delim)
+    for row in reader:
+        line = reader.line_num + 1
+        if not any(c.strip() for c in row): continue
+        r = dict(zip(cols, (c.strip() for c in row)))
+        try:
+            if not r.get('mapel'): raise ValueError("mapel kosong")
+            if not r.get('pertanyaan'): raise ValueError("pertanyaan kosong")
+            tipe, opsi, key = convert(r)
+            _check(tipe, opsi, key)
+            paket = r.get('paket') or default_paket
+            q = {'mapel': r['mapel'], 'paket': paket, 'topik': r.get('topik') or 'Umum', 'tipe': tipe,
+                 'pertanyaan': r['pertanyaan'], 'opsi': json.dumps(opsi), 'kunci_jawaban': json.dumps(key)}
+            yield line, question_id(r['mapel'], paket, r['pertanyaan']), q, None
+        except ValueError as e:
+            yield line, None, None, str(e)
+
+
+def validate(text, default_paket='Paket 1'):
+    """Periksa semua baris; kembalikan (jumlah valid, [(baris, pesan)], set (mapel, paket))."""
+    ok, errors, seen, pakets = 0, [], {}, set()
+    for line, qid, q, err in parse(text, default_paket):
+        if err: errors.append((line, err)); continue
+        if qid in seen: errors.append((line, f"duplikat pertanyaan baris {seen[qid]}")); continue
+        seen[qid] = line; ok += 1
+        pakets.add((q['mapel'], q['paket']))
+    return ok, errors, pakets
+
+
+def _flush(db, pending):
+    # Satu transaksi per paket: soal + dokumen question_index-nya
+    for (mapel, paket), qs in pending.items(): qindex.commit(db, mapel, paket, sets=qs)
+
+
+def import_questions(db, text, default_paket='Paket 1', on_progress=None):
+    """Tulis baris valid per batch (upsert). Kembalikan (jumlah ditulis, detik)."""
+    t0 = time.time()
+    written, seen = 0, set()
+    pending, n = {}, 0
+    for line, qid, q, err in parse(text, default_paket):
+        if err or qid in seen: continue
+        seen.add(qid)
+        # merge: gambar yang sudah dipasang lewat editor tidak ikut terhapus
+        pending.setdefault((q['mapel'], q['paket']), {})[qid] = q
+        n += 1
+        if n == BATCH_SIZE:
+            _flush(db, pending); written += n
+            pending, n = {}, 0
+            if on_progress: on_progress(written, time.time() - t0)
+    if n:
+        _flush(db, pending); written += n
+        if on_progress: on_progress(written, time.time() - t0)
+    return written, time.time() - t0
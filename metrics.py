@@ -0,0 +1,240 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import storage
+
+# Instrumentasi ringan dalam proses: durasi per halaman / fungsi (histogram) dan jumlah operasi
+# storage (read / write / byte) yang diatribusikan ke halaman & fungsi yang sedang berjalan.
+#   - track(page=...) : dekorator halaman (exam_interface, fragmen, ...) dan fungsi (calculate_score, ...)
+#   - MeteredStorage  : proxy Storage; read dihitung seperti tagihan Firestore (dokumen yang dikembalikan,
+#                       minimal 1 per query)
+# Semua angka dikumpulkan di REGISTRY (satu per proses) dan bisa diekspor dalam format teks Prometheus.
+
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+IO = ('reads', 'writes', 'bytes_in', 'bytes_out')
+PAGE = ''  # nama fungsi untuk baris total halaman
+
+_ctx = contextvars.ContextVar('metrics_scope', default=('-', PAGE))
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'n')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.sum = 0.0
+        self.n = 0
+
+    def observe(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.sum += ms
+        self.n += 1
+
+    def quantile(self, q):
+        """Perkiraan kuantil (batas atas bucket)."""
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if c and acc >= q * self.n: return BUCKETS_MS[i] if i < len(BUCKETS_MS) else float('inf')
+        return 0.0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}    # (page, fn) -> Histogram durasi
+            self.io = {}       # (page, fn) -> {reads, writes, bytes_in, bytes_out}
+            self.backend = {}  # op storage -> Histogram durasi
+            self.started = time.time()
+
+    def observe(self, key, ms):
+        with self._lock:
+            h = self.calls.get(key) or self.calls.setdefault(key, Histogram())
+            h.observe(ms)
+
+    def record(self, op, ms=None, **counts):
+        page, fn = _ctx.get()
+        with self._lock:
+            # Operasi di dalam fungsi juga dijumlahkan ke baris total halamannya
+            for key in ({(page, fn), (page, PAGE)} if counts else ()):
+                c = self.io.get(key) or self.io.setdefault(key, dict.fromkeys(IO, 0))
+                for k, v in counts.items(): c[k] += v
+            if ms is not None:
+                h = self.backend.get(op) or self.backend.setdefault(op, Histogram())
+                h.observe(ms)
+
+    def totals(self):
+        with self._lock:
+            return {k: sum(c[k] for (_, fn), c in self.io.items() if fn == PAGE) for k in IO}
+
+    def rows(self):
+        """Satu baris per (halaman, fungsi) untuk tabel admin."""
+        with self._lock:
+            out = []
+            for key in sorted(set(self.calls) | set(self.io)):
+                h, c = self.calls.get(key), self.io.get(key, dict.fromkeys(IO, 0))
+                n = h.n if h else 0
+                out.append({'page': key[0], 'fn': key[1], 'calls': n,
+                            'p50_ms': h.quantile(0.5) if n else None, 'p95_ms': h.quantile(0.95) if n else None,
+                            'mean_ms': h.sum / n if n else None, **c,
+                            'reads_per_call': c['reads'] / n if n else None})
+            return out
+
+    def over_budget(self, budgets):
+        """budgets: {"halaman" atau "halaman.fungsi": maks read per panggilan}. Kembalikan pelanggaran."""
+        out = []
+        for r in self.rows():
+            name = f"{r['page']}.{r['fn']}" if r['fn'] else r['page']
+            limit = budgets.get(name)
+            if limit is not None and r['reads_per_call'] is not None and r['reads_per_call'] > limit:
+                out.append((name, r['reads_per_call'], limit))
+        return out
+
+    def prometheus(self, prefix='cat'):
+        """Teks exposition format Prometheus (durasi dalam detik)."""
+        lines = []
+
+        def hist(name, help_, series):
+            lines.extend([f"# HELP {prefix}_{name} {help_}", f"# TYPE {prefix}_{name} histogram"])
+            for labels, h in series:
+                acc = 0
+                for le, c in zip([f"{b / 1000:g}" for b in BUCKETS_MS] + ["+Inf"], h.counts):
+                    acc += c
+                    lines.append(f'{prefix}_{name}_bucket{{{labels},le="{le}"}} {acc}')
+                lines.append(f"{prefix}_{name}_sum{{{labels}}} {h.sum / 1000:.6f}")
+                lines.append(f"{prefix}_{name}_count{{{labels}}} {h.n}")
+
+        with self._lock:
+            hist('call_duration_seconds', "Durasi halaman / fungsi aplikasi",
+                 [(f'page="{p}",fn="{f}"', h) for (p, f), h in sorted(self.calls.items())])
+            hist('storage_op_duration_seconds', "Durasi operasi storage",
+                 [(f'op="{op}"', h) for op, h in sorted(self.backend.items())])
+            for k, help_ in (('reads', "Dokumen dibaca"), ('writes', "Dokumen ditulis"),
+                             ('bytes_in', "Byte dokumen dibaca"), ('bytes_out', "Byte dokumen ditulis")):
+                lines.extend([f"# HELP {prefix}_storage_{k}_total {help_}", f"# TYPE {prefix}_storage_{k}_total counter"])
+                lines += [f'{prefix}_storage_{k}_total{{page="{p}",fn="{f}"}} {c[k]}' for (p, f), c in sorted(self.io.items())]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def scope(page, fn=PAGE):
+    token = _ctx.set((page, fn))
+    t0 = time.perf_counter()
+    try: yield
+    finally:
+        REGISTRY.observe((page, fn), (time.perf_counter() - t0) * 1000)
+        _ctx.reset(token)
+
+
+def track(page=None):
+    """Dekorator: catat durasi fungsi. Dengan page, fungsi menjadi titik masuk halaman (rerun penuh atau
+    rerun fragmen); bila dipanggil dari dalam halaman yang sama ia dihitung sebagai fungsi biasa."""
+    def deco(f):
+        @functools.wraps(f)
+        def run(*a, **k):
+            cur = _ctx.get()[0]
+            with scope(page, PAGE) if page and page != cur else scope(cur, f.__name__):
+                return f(*a, **k)
+        return run
+    return deco
+
+
+def _size(obj):
+    blobs = []
+
+    def enc(o):
+        if isinstance(o, (bytes, bytearray)): blobs.append(len(o)); return None
+        return str(o)
+    return len(json.dumps(obj, default=enc)) + sum(blobs)
+
+
+class MeteredStorage(storage.Storage):
+    def __init__(self, inner, registry=REGISTRY):
+        self.inner = inner
+        self.reg = registry
+
+    def _timed(self, fn, *a):
+        t0 = time.perf_counter()
+        out = fn(*a)
+        return out, (time.perf_counter() - t0) * 1000
+
+    def get(self, coll, doc_id):
+        d, ms = self._timed(self.inner.get, coll, doc_id)
+        self.reg.record('get', ms, reads=1, bytes_in=_size(d) if d else 0)
+        return d
+
+    def get_many(self, coll, ids):
+        d, ms = self._timed(self.inner.get_many, coll, ids)
+        self.reg.record('get_many', ms, reads=len(ids), bytes_in=_size(d))
+        return d
+
+    def query(self, coll, *a, **k):
+        t0 = time.perf_counter()
+        out = self.inner.query(coll, *a, **k)
+        self.reg.record('query', (time.perf_counter() - t0) * 1000, reads=max(len(out), 1), bytes_in=_size(out))
+        return out
+
+    def add(self, coll, data):
+        out, ms = self._timed(self.inner.add, coll, data)
+        self.reg.record('add', ms, writes=1, bytes_out=_size(data))
+        return out
+
+    def set(self, coll, doc_id, data, merge=False):
+        _, ms = self._timed(self.inner.set, coll, doc_id, data, merge)
+        self.reg.record('set', ms, writes=1, bytes_out=_size(data))
+
+    def update(self, coll, doc_id, fields):
+        _, ms = self._timed(self.inner.update, coll, doc_id, fields)
+        self.reg.record('update', ms, writes=1, bytes_out=_size(list(fields.values())))
+
+    def delete(self, coll, doc_id):
+        _, ms = self._timed(self.inner.delete, coll, doc_id)
+        self.reg.record('delete', ms, writes=1)
+
+    def batch(self): return _MeteredWriter(self.reg, self.inner.batch(), 'batch')
+
+    def transaction(self, fn):
+        t0 = time.perf_counter()
+        out = self.inner.transaction(lambda tx: fn(_MeteredWriter(self.reg, tx, 'tx')))
+        self.reg.record('transaction', (time.perf_counter() - t0) * 1000)
+        return out
+
+
+class _MeteredWriter:
+    # Tulis di batch/transaksi dihitung per dokumen; durasinya masuk ke commit / transaction
+    def __init__(self, reg, inner, kind):
+        self.reg = reg
+        self.inner = inner
+        self.kind = kind
+
+    def get(self, coll, doc_id):
+        t0 = time.perf_counter()
+        d = self.inner.get(coll, doc_id)
+        self.reg.record(f'{self.kind}_get', (time.perf_counter() - t0) * 1000, reads=1, bytes_in=_size(d) if d else 0)
+        return d
+
+    def set(self, coll, doc_id, data, merge=False):
+        self.inner.set(coll, doc_id, data, merge=merge); self.reg.record('set', writes=1, bytes_out=_size(data))
+
+    def update(self, coll, doc_id, fields):
+        self.inner.update(coll, doc_id, fields); self.reg.record('update', writes=1, bytes_out=_size(list(fields.values())))
+
+    def delete(self, coll, doc_id):
+        self.inner.delete(coll, doc_id); self.reg.record('delete', writes=1)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        self.inner.commit()
+        self.reg.record('commit', (time.perf_counter() - t0) * 1000)
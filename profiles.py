@@ -0,0 +1,73 @@
+import json
+
+import stats as class_stats
+from export import pages
+
+# Profil kemajuan per siswa: satu dokumen profiles/{username} yang diperbarui di transaksi yang sama dengan
+# hasil ujiannya (finalizer.commit_results), jadi layar siswa cukup satu read untuk:
+#   - akurasi per topik: kumulatif dan jendela ROLL percobaan terakhir (kelemahan jangka panjang)
+#   - jumlah percobaan, skor terbaik & terakhir per paket
+# Siswa yang sudah punya hasil sebelum profil ada: lengkapi dengan rebuild() (tombol Hitung Ulang).
+
+COLL = 'profiles'
+ROLL = 5
+GOOD = 0.7  # batas akurasi "materi kuat", sama dengan layar hasil
+
+
+def empty(username, nama):
+    return {'username': username, 'nama': nama, 'attempts': 0, 'updated_at': 0.0, 'topics': {}, 'pakets': {}}
+
+
+def paket_key(mapel, paket):
+    return f"{mapel}__{paket}"
+
+
+def apply_result(prof, res):
+    prof = prof or empty(res['username'], res.get('nama', res['username']))
+    ts = res.get('ts', 0.0)
+    prof['nama'] = res.get('nama', prof['nama'])
+    prof['attempts'] += 1
+    prof['updated_at'] = max(prof['updated_at'], ts)
+    ta = res.get('topic_analysis') or {}
+    if isinstance(ta, str): ta = json.loads(ta)
+    for t, v in ta.items():
+        cur = prof['topics'].setdefault(t, {'correct': 0, 'total': 0, 'recent': []})
+        cur['correct'] += v['correct']; cur['total'] += v['total']
+        # Firestore tidak mendukung array di dalam array: jendela disimpan sebagai daftar map
+        cur['recent'] = (cur['recent'] + [{'c': v['correct'], 't': v['total']}])[-ROLL:]
+    pk = prof['pakets'].setdefault(paket_key(res['mapel'], res['paket']),
+                                   {'mapel': res['mapel'], 'paket': res['paket'], 'attempts': 0, 'best': 0.0, 'latest': 0.0, 'latest_ts': 0.0})
+    pk['attempts'] += 1
+    pk['best'] = max(pk['best'], res['skor'])
+    if ts >= pk['latest_ts']: pk['latest'], pk['latest_ts'] = res['skor'], ts
+    return prof
+
+
+def topic_accuracy(prof):
+    """[(topik, akurasi ROLL percobaan terakhir, benar, total)] dari yang terlemah."""
+    out = []
+    for t, v in (prof or {}).get('topics', {}).items():
+        c, n = sum(r['c'] for r in v['recent']), sum(r['t'] for r in v['recent'])
+        if n: out.append((t, c / n, c, n))
+    return sorted(out, key=lambda x: (x[1], x[0]))
+
+
+def rebuild(db):
+    """Hitung ulang semua profil dari koleksi results (urut ts), hanya saat tidak ada ujian berlangsung
+    (stats.quiet_rebuild). Kembalikan jumlah profil."""
+    def build(since):
+        profs, seen = {}, set()
+        for rows in pages(db, fields=['username', 'nama', 'mapel', 'paket', 'skor', 'ts', 'topic_analysis']):
+            for res in rows:
+                profs[res['username']] = apply_result(profs.get(res['username']), res)
+                if res['ts'] >= since: seen.add(res['id'])
+        old = [d['id'] for d in db.query(COLL, fields=[]) if d['id'] not in profs]
+        ops = [('set', u, p) for u, p in profs.items()] + [('delete', u, None) for u in old]
+        for i in range(0, len(ops), 500):
+            batch = db.batch()
+            for op, u, p in ops[i:i + 500]:
+                if op == 'set': batch.set(COLL, u, p)
+                else: batch.delete(COLL, u)
+            batch.commit()
+        return len(profs), seen
+    return class_stats.quiet_rebuild(db, build)
@@ -0,0 +1,105 @@
+import time
+import zlib
+
+# Indeks ringkas per (mapel, paket) untuk editor admin: {qid: {t, topik, tipe, img, u}} tanpa opsi, kunci,
+# maupun gambar. Dokumen kepala question_index/{mapel}__{paket} hanya menyimpan version & updated_at;
+# item dibagi ke SHARDS dokumen question_index_items/{mapel}__{paket}__{k} menurut hash qid supaya paket
+# besar tidak menabrak batas 1 MiB per dokumen Firestore (~150 byte per item -> ribuan soal per shard).
+# Setiap perubahan soal ditulis bersama shard yang tersentuh dan kepalanya dalam satu transaksi (version
+# ikut naik), jadi daftar & pencarian soal cukup membaca kepala + shard; soal lengkap hanya dibaca untuk
+# item yang sedang diedit. Indeks format lama (item di dokumen kepala) dipindah ke shard saat commit/rebuild.
+
+COLL = 'question_index'
+ITEMS = 'question_index_items'
+SHARDS = 8
+TEXT_LEN = 80
+
+
+def index_id(mapel, paket):
+    return f"{mapel}__{paket}"
+
+
+def shard_id(mapel, paket, shard):
+    return f"{mapel}__{paket}__{shard}"
+
+
+def shard_of(qid):
+    return zlib.crc32(qid.encode()) % SHARDS
+
+
+def empty(mapel, paket):
+    return {'mapel': mapel, 'paket': paket, 'version': 0, 'updated_at': 0.0, 'items': {}}
+
+
+def _shard(mapel, paket, shard):
+    return {'mapel': mapel, 'paket': paket, 'shard': shard, 'items': {}}
+
+
+def _item(q, old, now):
+    it = dict(old or {'t': '', 'topik': 'Umum', 'tipe': 'single', 'img': False})
+    if 'pertanyaan' in q: it['t'] = ' '.join(str(q['pertanyaan']).split())[:TEXT_LEN]
+    if 'topik' in q: it['topik'] = q['topik']
+    if 'tipe' in q: it['tipe'] = q['tipe']
+    # Import CSV (merge) tidak membawa field gambar: flag lama dipertahankan
+    if 'gambar' in q: it['img'] = bool(q['gambar'])
+    it['u'] = now
+    return it
+
+
+def version(db, mapel, paket):
+    return (db.get(COLL, index_id(mapel, paket)) or {}).get('version', 0)
+
+
+def load(db, mapel, paket):
+    """Kepala + semua item paket ({..., 'items': {qid: item}}), atau None bila belum ada indeks."""
+    head = db.get(COLL, index_id(mapel, paket))
+    if head is None or 'items' in head: return head
+    items = {}
+    for d in db.get_many(ITEMS, [shard_id(mapel, paket, k) for k in range(SHARDS)]).values(): items.update(d['items'])
+    return {**head, 'items': items}
+
+
+def commit(db, mapel, paket, sets=None, updates=None, deletes=()):
+    """Tulis perubahan soal satu paket beserta indeksnya secara atomik. sets: {qid: soal} (merge),
+    updates: {qid: field}, deletes: [qid]. Kembalikan versi indeks yang baru."""
+    sets, updates = sets or {}, updates or {}
+
+    def run(tx):
+        # Semua read dulu (syarat transaksi Firestore): kepala lalu shard yang tersentuh
+        head = tx.get(COLL, index_id(mapel, paket)) or empty(mapel, paket)
+        legacy = head.pop('items', None)
+        touched = range(SHARDS) if legacy else sorted({shard_of(q) for q in [*sets, *updates, *deletes]})
+        shards = {k: tx.get(ITEMS, shard_id(mapel, paket, k)) or _shard(mapel, paket, k) for k in touched}
+        for qid, it in (legacy or {}).items(): shards[shard_of(qid)]['items'][qid] = it
+        now = time.time()
+        for qid, q in sets.items():
+            tx.set('questions', qid, q, merge=True)
+            items = shards[shard_of(qid)]['items']; items[qid] = _item(q, items.get(qid), now)
+        for qid, fields in updates.items():
+            tx.update('questions', qid, fields)
+            items = shards[shard_of(qid)]['items']; items[qid] = _item(fields, items.get(qid), now)
+        for qid in deletes:
+            tx.delete('questions', qid)
+            shards[shard_of(qid)]['items'].pop(qid, None)
+        for k, sh in shards.items(): tx.set(ITEMS, shard_id(mapel, paket, k), sh)
+        head['version'] += 1
+        head['updated_at'] = now
+        tx.set(COLL, index_id(mapel, paket), head)
+        return head['version']
+    return db.transaction(run)
+
+
+def rebuild(db, mapel, paket):
+    """Bangun ulang indeks dari koleksi questions (paket lama yang belum punya indeks)."""
+    now = time.time()
+    idx = empty(mapel, paket)
+    idx['version'] = version(db, mapel, paket) + 1
+    idx['updated_at'] = now
+    shards = [_shard(mapel, paket, k) for k in range(SHARDS)]
+    for q in db.query('questions', [('mapel', '==', mapel), ('paket', '==', paket)]):
+        idx['items'][q['id']] = shards[shard_of(q['id'])]['items'][q['id']] = _item(q, None, now)
+    batch = db.batch()
+    for k, sh in enumerate(shards): batch.set(ITEMS, shard_id(mapel, paket, k), sh)
+    batch.set(COLL, index_id(mapel, paket), {k: v for k, v in idx.items() if k != 'items'})
+    batch.commit()
+    return idx
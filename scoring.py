@@ -0,0 +1,131 @@
+import json
+
+import numpy as np
+
+from compact import RAW, TIPE, decode_answer, encode_answer, positions
+
+# Aturan penilaian ujian. Kunci jawaban dikompilasi sekali per paket lalu disimpan di bank soal:
+# bentuk hashable untuk perbandingan (frozenset untuk PG kompleks, tuple terurut untuk Benar/Salah)
+# dan kode int format ringkas (compact) untuk penilaian vektor. Semua percobaan dinilai lewat
+# points(): satu operasi numpy atas kode jawaban vs kode kunci, dipakai penilaian langsung,
+# finalizer (per batch sesi), dan penilaian ulang paket setelah kunci dikoreksi.
+#
+# Kebijakan (field 'penilaian' di kisi-kisi paket):
+#   all      : poin 1 hanya bila jawaban sama persis dengan kunci
+#   partial  : PG kompleks (pilihan benar - pilihan salah) / jumlah kunci; Benar/Salah per pernyataan
+#   negative : seperti all, jawaban salah (tidak kosong) dikurangi 'penalty'; skor akhir minimal 0
+
+POLICIES = {'all': 'Benar semua', 'partial': 'Nilai parsial', 'negative': 'Pengurangan nilai'}
+DEFAULT = {'mode': 'all', 'penalty': 0.25}
+NO_CODE = -2  # kunci yang tidak bisa dikodekan (tidak ada di opsi): dinilai dengan perbandingan biasa
+
+
+def parse_key(raw):
+    try: return json.loads(raw)
+    except: return raw
+
+
+def policy_of(plan):
+    return {**DEFAULT, **((plan or {}).get('penilaian') or {})}
+
+
+def normalize(tipe, ans):
+    """Bentuk hashable jawaban/kunci; None untuk jawaban kosong."""
+    if not ans: return None
+    if tipe == 'complex' and isinstance(ans, list): return frozenset(ans)
+    if tipe == 'category' and isinstance(ans, dict): return tuple(sorted(ans.items()))
+    return ans
+
+
+def compile_key(q):
+    key, opsi = parse_key(q['kunci_jawaban']), parse_key(q.get('opsi') or '[]')
+    opsi = opsi if isinstance(opsi, list) else []
+    pos = positions(opsi)
+    code = encode_answer(q['tipe'], pos, key) if key else None
+    return {'tipe': q['tipe'], 'key': key, 'match': normalize(q['tipe'], key), 'opsi': opsi, 'pos': pos,
+            'code': code if code else NO_CODE, 'topik': q.get('topik', 'Umum'), 'pertanyaan': q['pertanyaan']}
+
+
+def compile_keys(questions):
+    return {qid: compile_key(q) for qid, q in questions.items()}
+
+
+def is_correct(k, user_ans):
+    ans = normalize(k['tipe'], user_ans)
+    return ans is not None and ans == k['match']
+
+
+def points(tipe, ans, key, n_opsi, policy=DEFAULT):
+    """Vektor poin & benar per butir. tipe: kode huruf (TIPE), ans/key: kode jawaban/kunci format ringkas
+    (0 = kosong, RAW = di luar opsi), n_opsi: jumlah opsi / pernyataan."""
+    tipe = np.asarray(tipe)
+    a, k, n = (np.asarray(x, np.int64) for x in (ans, key, n_opsi))
+    answered = a != 0
+    benar = answered & (a == k)
+    pts = benar.astype(float)
+    if policy['mode'] == 'partial':
+        valid = answered & (a > 0) & (k > 0)
+        cx, ct = valid & (tipe == 'c'), valid & (tipe == 'k')
+        ac, kc = np.where(cx, a, 0), np.where(cx, k, 0)
+        ad, kd = np.where(ct, a, 0), np.where(ct, k, 0)
+        hit, wrong, n_key, same = (np.zeros(len(a)) for _ in range(4))
+        for i in range(int(n.max(initial=0))):
+            ab, kb = ac >> i & 1, kc >> i & 1
+            hit += ab & kb; wrong += ab & (1 - kb); n_key += kb
+            same += (ad % 3 == kd % 3) & (ad % 3 > 0); ad //= 3; kd //= 3
+        pts = np.where(cx, np.clip((hit - wrong) / np.maximum(n_key, 1), 0, 1), pts)
+        pts = np.where(ct, same / np.maximum(n, 1), pts)
+    elif policy['mode'] == 'negative':
+        pts = np.where(benar, 1.0, np.where(answered, -policy['penalty'], 0.0))
+    return pts, benar
+
+
+def score_codes(q_ids, codes, keys, policy=DEFAULT, raw=None):
+    """Nilai banyak percobaan sekaligus. q_ids/codes: list per percobaan (hanya soal yang punya kunci),
+    raw: {posisi: jawaban} per percobaan untuk kode RAW. Kembalikan (poin per percobaan, benar per percobaan)."""
+    if not q_ids: return [], []
+    lens = [len(q) for q in q_ids]
+    flat = [keys[qid] for qs in q_ids for qid in qs]
+    key = [k['code'] for k in flat]
+    a = [c for cs in codes for c in cs]
+    pts, benar = points([TIPE.get(k['tipe'], '?') for k in flat], a, key, [len(k['opsi']) for k in flat], policy)
+    # Kunci tanpa kode (data lama di luar opsi): bandingkan bentuk hashable seperti biasa
+    starts = np.cumsum([0] + lens)
+    for j in np.flatnonzero(np.asarray(key) == NO_CODE).tolist():
+        r = int(np.searchsorted(starts, j, 'right')) - 1
+        k, c = flat[j], a[j]
+        ans = (raw[r] if raw else {}).get(str(j - starts[r])) if c == RAW else decode_answer(k['tipe'], k['opsi'], c)
+        benar[j] = is_correct(k, ans)
+        pts[j] = 1.0 if benar[j] else -policy['penalty'] if policy['mode'] == 'negative' and c else 0.0
+    return [p.sum() for p in np.split(pts, starts[1:-1])], np.split(benar, starts[1:-1])
+
+
+def topic_stats(q_ids, benar, keys):
+    out = {}  # {topik: {correct:0, total:0}}
+    for qid, b in zip(q_ids, benar):
+        t = out.setdefault(keys[qid]['topik'], {'correct': 0, 'total': 0})
+        t['total'] += 1; t['correct'] += int(b)
+    return out
+
+
+def final_score(total_points, n_soal):
+    return max(0.0, float(total_points)) / n_soal * 100 if n_soal else 0
+
+
+def score_batch(q_orders, answers, keys, policy=DEFAULT):
+    """[(skor, jawaban terkode, statistik topik)] untuk tiap (q_order, answers); jawaban terkode =
+    {q_ids, codes, raw, benar} siap disimpan format ringkas. Soal tanpa kunci dilewati tetapi tetap
+    dihitung dalam pembagi."""
+    q_ids, codes, raws = [], [], []
+    for order, ans in zip(q_orders, answers):
+        qs = [qid for qid in order if qid in keys]
+        cs = [encode_answer(keys[qid]['tipe'], keys[qid]['pos'], ans.get(qid)) for qid in qs]
+        raws.append({str(i): ans.get(qid) for i, (qid, c) in enumerate(zip(qs, cs)) if c is None})
+        q_ids.append(qs); codes.append([RAW if c is None else c for c in cs])
+    totals, benar = score_codes(q_ids, codes, keys, policy, raws)
+    return [(final_score(t, len(order)), {'q_ids': qs, 'codes': cs, 'raw': raw, 'benar': b}, topic_stats(qs, b, keys))
+            for order, qs, cs, raw, t, b in zip(q_orders, q_ids, codes, raws, totals, benar)]
+
+
+def score_exam(q_order, answers, keys, policy=DEFAULT):
+    return score_batch([q_order], [answers], keys, policy)[0]
@@ -0,0 +1,179 @@
+import random
+import time
+import zlib
+from bisect import bisect_right
+from datetime import datetime
+
+from export import pages
+
+# Statistik kelas yang dimaterialisasi per (mapel, paket). Setiap hasil ujian menambah counter
+# di salah satu shard dokumen 'stats' (agar satu kelas yang selesai bersamaan tidak berebut satu
+# dokumen); dashboard cukup membaca semua shard dan menggabungkannya.
+# Papan peringkat paket ('board') disimpan di shard yang sama: daftar terurut (skor turun, lebih dulu
+# menang) berisi skor terbaik tiap siswa, maksimal BOARD_N. Siswa yang masuk BOARD_N besar paket pasti
+# masuk BOARD_N besar shard tempat skor terbaiknya ditulis, jadi gabungan semua shard tetap tepat.
+
+SHARDS = 8
+BINS = 10
+TOP_N = 10
+BOARD_N = 50
+SUMMARY_KEY = 'stats:summary'
+TS_MARKER = ('meta', 'results_ts')  # tanda backfill ts hasil lama sudah dijalankan
+SUMMARY_TTL = 30  # detik; ringkasan di tier cache bersama (cache.py) dipakai semua replika
+LATE = 60  # detik; ts hasil = waktu penilaian, commit-nya bisa sedikit sesudahnya
+REBUILD_TRIES = 3
+
+
+class Busy(RuntimeError):
+    """Rebuild ditolak / tidak bisa selesai karena ada ujian yang sedang berjalan."""
+
+
+def shard_id(mapel, paket, shard=None):
+    if shard is None: shard = random.randrange(SHARDS)
+    return f"{mapel}__{paket}__{shard}"
+
+
+def empty(mapel, paket):
+    return {'mapel': mapel, 'paket': paket, 'count': 0, 'sum': 0.0, 'max': 0.0,
+            'hist': [0] * BINS, 'board': [], 'users': {}}
+
+
+def bin_of(skor):
+    return min(int(skor // (100 / BINS)), BINS - 1)
+
+
+def apply_result(agg, res):
+    agg = agg or empty(res['mapel'], res['paket'])
+    agg['count'] += 1
+    agg['sum'] += res['skor']
+    agg['max'] = max(agg['max'], res['skor'])
+    agg['hist'][bin_of(res['skor'])] += 1
+    agg['users'][res['username']] = agg['users'].get(res['username'], 0) + 1
+    # Shard lama menyimpan 'top' (10 percobaan terbaik): jadi awal papan peringkat
+    if 'board' not in agg: agg['board'] = merge_boards([agg.pop('top', [])])
+    board_add(agg['board'], {'username': res['username'], 'nama': res['nama'], 'skor': res['skor'], 'ts': res.get('ts', 0.0)})
+    return agg
+
+
+def _rank(e):
+    return (-e['skor'], e.get('ts', 0.0))
+
+
+def board_add(board, entry, n=BOARD_N):
+    """Masukkan entry ke board terurut (di tempat). Satu entri per siswa: hanya skor yang lebih baik menggantikan."""
+    old = next((e for e in board if e['username'] == entry['username']), None)
+    if old:
+        if old['skor'] >= entry['skor']: return board
+        board.remove(old)
+    board.insert(bisect_right([_rank(e) for e in board], _rank(entry)), entry)
+    del board[n:]
+    return board
+
+
+def merge_boards(boards, n=BOARD_N):
+    best = {}
+    for e in (e for b in boards for e in b):
+        if e['username'] not in best or _rank(e) < _rank(best[e['username']]): best[e['username']] = e
+    return sorted(best.values(), key=_rank)[:n]
+
+
+def summarize(shards):
+    """Gabungkan dokumen shard menjadi ringkasan dashboard."""
+    count = sum(s['count'] for s in shards)
+    users = set()
+    hist = {}  # mapel -> [bin counts]
+    for s in shards:
+        users.update(s['users'])
+        h = hist.setdefault(s['mapel'], [0] * BINS)
+        for i, n in enumerate(s['hist']): h[i] += n
+    return {
+        'count': count,
+        'mean': sum(s['sum'] for s in shards) / count if count else 0,
+        'max': max((s['max'] for s in shards), default=0),
+        'users': len(users),
+        'hist': hist,
+        # Skor terbaik per siswa dari semua paket
+        'top': merge_boards([s.get('board', s.get('top', [])) for s in shards], TOP_N),
+    }
+
+
+def load(db):
+    return db.query('stats')
+
+
+def leaderboard(db, mapel, paket, n=BOARD_N):
+    """Papan peringkat satu paket: satu query shard-shard-nya."""
+    shards = db.query('stats', [('mapel', '==', mapel), ('paket', '==', paket)])
+    return merge_boards([s.get('board', s.get('top', [])) for s in shards], n)
+
+
+def cached_summary(db, shared=None):
+    """summarize(load(db)); dengan tier cache bersama dihitung paling sering sekali per SUMMARY_TTL."""
+    if not shared: return summarize(load(db))
+    return shared.cached(SUMMARY_KEY, lambda: summarize(load(db)), SUMMARY_TTL)
+
+
+def _ts(tanggal):
+    try: return datetime.strptime(tanggal, "%Y-%m-%d %H:%M").timestamp()
+    except (TypeError, ValueError): return 0.0
+
+
+def _write_ts(db, no_ts):
+    for i in range(0, len(no_ts), 500):
+        batch = db.batch()
+        for doc_id, ts in no_ts[i:i + 500]: batch.update('results', doc_id, {'ts': ts})
+        batch.commit()
+
+
+def backfill_ts(db):
+    """Sekali untuk seluruh database: hasil lama tanpa ts (tidak ikut query riwayat yang urut ts) dilengkapi
+    dari string tanggal. Setelah selesai ditandai meta/results_ts, jadi proses berikutnya cukup satu read."""
+    if db.get(*TS_MARKER): return 0
+    no_ts = [(r['id'], _ts(r.get('tanggal'))) for r in db.query('results', fields=['tanggal', 'ts']) if 'ts' not in r]
+    _write_ts(db, no_ts)
+    db.set(*TS_MARKER, {'count': len(no_ts), 'done_at': time.time()})
+    return len(no_ts)
+
+
+def ensure_idle(db):
+    # Rebuild menimpa dokumen yang juga ditambah finalizer.commit_results tanpa koordinasi: hasil yang
+    # di-commit di antara baca dan tulis ulang akan hilang, jadi hanya dijalankan saat tidak ada sesi 'ongoing'
+    if db.query('exam_sessions', [('status', '==', 'ongoing')], limit=1, fields=[]):
+        raise Busy("Masih ada ujian yang berlangsung / belum dinilai; hitung ulang setelah semuanya selesai")
+
+
+def quiet_rebuild(db, build):
+    """Jalankan build(since) -> (hasil, ID hasil ber-ts >= since yang ikut terhitung) saat tidak ada ujian
+    berlangsung. Bila sesi baru sempat dimulai & dinilai selama build berjalan (hasil ber-ts >= since yang
+    tidak terhitung), build diulang; menyerah dengan Busy setelah REBUILD_TRIES kali."""
+    ensure_idle(db)
+    for _ in range(REBUILD_TRIES):
+        since = time.time() - LATE
+        out, seen = build(since)
+        if not {d['id'] for d in db.query('results', [('ts', '>=', since)], fields=[])} - seen: return out
+    raise Busy("Hasil ujian baru terus masuk selama hitung ulang; coba lagi setelah ujian selesai")
+
+
+def rebuild(db):
+    """Hitung ulang semua agregat dari koleksi results (per halaman), tersebar ke SHARDS shard per paket
+    menurut username. Hanya saat tidak ada ujian berlangsung (lihat quiet_rebuild). Hasil lama yang belum
+    punya field ts dilengkapi dulu (backfill_ts) agar ikut halaman urut ts. Kembalikan jumlah paket."""
+    backfill_ts(db)
+
+    def build(since):
+        aggs, seen = {}, set()
+        for rows in pages(db, fields=['username', 'nama', 'mapel', 'paket', 'skor', 'ts']):
+            for res in rows:
+                key = shard_id(res['mapel'], res['paket'], zlib.crc32(res['username'].encode()) % SHARDS)
+                aggs[key] = apply_result(aggs.get(key), res)
+                if res['ts'] >= since: seen.add(res['id'])
+        old = [d['id'] for d in db.query('stats', fields=[]) if d['id'] not in aggs]
+        ops = [('set', k, a) for k, a in aggs.items()] + [('delete', k, None) for k in old]
+        for i in range(0, len(ops), 500):
+            batch = db.batch()
+            for op, k, a in ops[i:i + 500]:
+                if op == 'set': batch.set('stats', k, a)
+                else: batch.delete('stats', k)
+            batch.commit()
+        return len({(a['mapel'], a['paket']) for a in aggs.values()}), seen
+    return quiet_rebuild(db, build)
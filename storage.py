@@ -0,0 +1,340 @@
+import base64
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+# Lapisan penyimpanan dokumen untuk users, questions, exam_sessions, results (dan koleksi
+# turunan seperti stats/images). Ada dua implementasi dengan API yang sama:
+#   - FirestoreStorage : Firebase/Firestore (default, butuh secrets [firebase])
+#   - SQLiteStorage    : file SQLite lokal (WAL) untuk server sekolah / offline / benchmark
+#
+# Dokumen selalu berupa dict. Hasil query menyertakan key 'id'. Key field pada update() boleh
+# berupa tuple path, mis. ('answers', qid), untuk mengubah satu field di dalam map.
+# Composite index Firestore yang dibutuhkan query aplikasi ada di firestore.indexes.json
+# (firebase deploy --only firestore:indexes).
+
+
+class Storage:
+    def get(self, coll, doc_id): raise NotImplementedError
+    def get_many(self, coll, ids): raise NotImplementedError
+    def query(self, coll, where=(), order_by=None, desc=False, limit=None, start_after=None, fields=None):
+        raise NotImplementedError
+    def add(self, coll, data): raise NotImplementedError
+    def set(self, coll, doc_id, data, merge=False): raise NotImplementedError
+    def update(self, coll, doc_id, fields): raise NotImplementedError
+    def delete(self, coll, doc_id): raise NotImplementedError
+    def batch(self): raise NotImplementedError
+    def transaction(self, fn):
+        """Jalankan fn(tx) secara atomik; tx punya get/set/update/delete seperti batch."""
+        raise NotImplementedError
+
+
+def new_id():
+    return uuid.uuid4().hex[:20]
+
+
+def page_after(db, coll, where=(), order_by='ts', cursor=None, limit=100, desc=False, fields=None):
+    """Satu halaman urut order_by yang aman untuk nilai kembar (ts per menit, nama sama, ...). start_after
+    biasa (> nilai terakhir) melewatkan dokumen lain bernilai sama di batas halaman; di sini cursor =
+    (nilai terakhir, [ID dokumen bernilai itu yang sudah dikirim]) dan query memakai >= / <=.
+    Kembalikan (baris, cursor berikutnya, habis?)."""
+    last, seen = cursor or (None, [])
+    seen = set(seen)
+    cond = [(order_by, '<=' if desc else '>=', last)] if last is not None else []
+    if fields is not None and order_by not in fields: fields = [*fields, order_by]
+    # Dokumen yang sudah dikirim semuanya bernilai `last`, jadi ada di awal hasil: ambil lebih sebanyak itu,
+    # plus satu untuk tahu apakah masih ada halaman berikutnya
+    rows = db.query(coll, [*where, *cond], order_by=order_by, desc=desc, limit=limit + len(seen) + 1, fields=fields)
+    new = [r for r in rows if r['id'] not in seen]
+    done = len(new) <= limit
+    new = new[:limit]
+    if not new: return [], cursor, True
+    v = new[-1][order_by]
+    ids = [r['id'] for r in new if r[order_by] == v]
+    return new, (v, sorted(seen | set(ids)) if v == last else ids), done
+
+
+def _path(key):
+    return list(key) if isinstance(key, tuple) else key.split('.')
+
+
+def apply_fields(data, fields):
+    for key, value in fields.items():
+        *parents, last = _path(key)
+        d = data
+        for p in parents:
+            if not isinstance(d.get(p), dict): d[p] = {}
+            d = d[p]
+        d[last] = value
+    return data
+
+
+def merge_into(base, data):
+    for k, v in data.items():
+        if isinstance(v, dict) and isinstance(base.get(k), dict): merge_into(base[k], v)
+        else: base[k] = v
+    return base
+
+
+# --- FIRESTORE ---
+
+class FirestoreStorage(Storage):
+    def __init__(self, client):
+        from firebase_admin import firestore
+        self.client = client
+        self._fs = firestore
+
+    def _ref(self, coll, doc_id):
+        return self.client.collection(coll).document(doc_id)
+
+    def _fields(self, fields):
+        return {self.client.field_path(*k) if isinstance(k, tuple) else k: v for k, v in fields.items()}
+
+    def get(self, coll, doc_id):
+        d = self._ref(coll, doc_id).get()
+        return d.to_dict() if d.exists else None
+
+    def get_many(self, coll, ids):
+        if not ids: return {}
+        return {d.id: d.to_dict() for d in self.client.get_all([self._ref(coll, i) for i in ids]) if d.exists}
+
+    def query(self, coll, where=(), order_by=None, desc=False, limit=None, start_after=None, fields=None):
+        q = self.client.collection(coll)
+        for f, op, v in where: q = q.where(filter=self._fs.FieldFilter(f, op, v))
+        if order_by: q = q.order_by(order_by, direction=self._fs.Query.DESCENDING if desc else self._fs.Query.ASCENDING)
+        if start_after is not None: q = q.start_after({order_by: start_after})
+        if fields is not None: q = q.select(fields)
+        if limit: q = q.limit(limit)
+        return [{'id': d.id, **(d.to_dict() or {})} for d in q.stream()]
+
+    def add(self, coll, data):
+        return self.client.collection(coll).add(data)[1].id
+
+    def set(self, coll, doc_id, data, merge=False): self._ref(coll, doc_id).set(data, merge=merge)
+
+    def update(self, coll, doc_id, fields): self._ref(coll, doc_id).update(self._fields(fields))
+
+    def delete(self, coll, doc_id): self._ref(coll, doc_id).delete()
+
+    def batch(self): return _FirestoreBatch(self, self.client.batch())
+
+    def transaction(self, fn):
+        @self._fs.transactional
+        def run(t): return fn(_FirestoreTx(self, t))
+        return run(self.client.transaction())
+
+
+class _FirestoreWriter:
+    def __init__(self, storage, writer):
+        self._s = storage
+        self._w = writer
+
+    def set(self, coll, doc_id, data, merge=False): self._w.set(self._s._ref(coll, doc_id), data, merge=merge)
+
+    def update(self, coll, doc_id, fields): self._w.update(self._s._ref(coll, doc_id), self._s._fields(fields))
+
+    def delete(self, coll, doc_id): self._w.delete(self._s._ref(coll, doc_id))
+
+
+class _FirestoreBatch(_FirestoreWriter):
+    def commit(self): self._w.commit()
+
+
+class _FirestoreTx(_FirestoreWriter):
+    def get(self, coll, doc_id):
+        d = self._s._ref(coll, doc_id).get(transaction=self._w)
+        return d.to_dict() if d.exists else None
+
+
+# --- SQLITE ---
+
+def _enc(o):
+    if isinstance(o, (bytes, bytearray)): return {'$b': base64.b64encode(o).decode()}
+    raise TypeError(f"{type(o).__name__} tidak bisa disimpan")
+
+
+def _dec(d):
+    return base64.b64decode(d['$b']) if len(d) == 1 and '$b' in d else d
+
+
+class SQLiteStorage(Storage):
+    # Index ekspresi untuk field yang dipakai di query aplikasi
+    INDEXES = {
+        'users': [('role', 'username'), ('role', 'nama_lengkap')],
+        'questions': [('mapel', 'paket')],
+        'exam_sessions': [('username',), ('status', 'end_time')],
+        'results': [('username', 'ts'), ('mapel', 'ts'), ('mapel', 'paket', 'ts')],
+    }
+    OPS = {'==': '=', '!=': '<>', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+    def __init__(self, path):
+        if path != ':memory:' and os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._tables = set()
+        for pragma in ('journal_mode=WAL', 'synchronous=NORMAL', 'busy_timeout=5000'):
+            self._conn.execute(f"PRAGMA {pragma}")
+
+    @staticmethod
+    def _expr(field):
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', field): raise ValueError(f"nama field tidak valid: {field}")
+        return f"json_extract(data, '$.{field}')"
+
+    def _table(self, coll):
+        if coll not in self._tables:
+            if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', coll): raise ValueError(f"nama koleksi tidak valid: {coll}")
+            with self._lock:
+                self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{coll}" (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+                for cols in self.INDEXES.get(coll, []):
+                    self._conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{coll}_{"_".join(cols)}" ON "{coll}" '
+                                       f'({", ".join(self._expr(c) for c in cols)})')
+                self._tables.add(coll)
+        return f'"{coll}"'
+
+    @contextmanager
+    def _txn(self):
+        with self._lock:
+            outer = self._depth == 0
+            if outer: self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if outer: self._conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if outer: self._conn.execute("COMMIT")
+
+    def _load(self, raw):
+        return json.loads(raw, object_hook=_dec)
+
+    def get(self, coll, doc_id):
+        t = self._table(coll)
+        with self._lock:
+            row = self._conn.execute(f"SELECT data FROM {t} WHERE id = ?", (doc_id,)).fetchone()
+        return self._load(row[0]) if row else None
+
+    def get_many(self, coll, ids):
+        t, ids, out = self._table(coll), list(ids), {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                sql = f"SELECT id, data FROM {t} WHERE id IN ({','.join('?' * len(chunk))})"
+                out.update((r[0], self._load(r[1])) for r in self._conn.execute(sql, chunk))
+        return out
+
+    def query(self, coll, where=(), order_by=None, desc=False, limit=None, start_after=None, fields=None):
+        t = self._table(coll)
+        conds, params = [], []
+        for f, op, v in where:
+            if op == 'in':
+                conds.append(f"{self._expr(f)} IN ({','.join('?' * len(v))})"); params += list(v)
+            else:
+                conds.append(f"{self._expr(f)} {self.OPS[op]} ?"); params.append(v)
+        if order_by:
+            # Seperti Firestore: dokumen tanpa field urutan tidak ikut
+            conds.append(f"{self._expr(order_by)} IS NOT NULL")
+            if start_after is not None:
+                conds.append(f"{self._expr(order_by)} {'<' if desc else '>'} ?"); params.append(start_after)
+        sql = f"SELECT id, data FROM {t}"
+        if conds: sql += " WHERE " + " AND ".join(conds)
+        if order_by: sql += f" ORDER BY {self._expr(order_by)} {'DESC' if desc else 'ASC'}, id"
+        if limit: sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        out = []
+        for doc_id, raw in rows:
+            d = self._load(raw)
+            if fields is not None: d = {k: d[k] for k in fields if k in d}
+            out.append({'id': doc_id, **d})
+        return out
+
+    def _put(self, coll, doc_id, data):
+        self._conn.execute(f"INSERT OR REPLACE INTO {self._table(coll)} (id, data) VALUES (?, ?)",
+                           (doc_id, json.dumps(data, default=_enc)))
+
+    def _set(self, coll, doc_id, data, merge=False):
+        if merge:
+            cur = self.get(coll, doc_id)
+            if cur is not None: data = merge_into(cur, data)
+        self._put(coll, doc_id, data)
+
+    def _update(self, coll, doc_id, fields):
+        cur = self.get(coll, doc_id)
+        if cur is None: raise KeyError(f"{coll}/{doc_id} tidak ditemukan")
+        self._put(coll, doc_id, apply_fields(cur, fields))
+
+    def _delete(self, coll, doc_id):
+        self._conn.execute(f"DELETE FROM {self._table(coll)} WHERE id = ?", (doc_id,))
+
+    def add(self, coll, data):
+        doc_id = new_id()
+        with self._txn(): self._put(coll, doc_id, data)
+        return doc_id
+
+    def set(self, coll, doc_id, data, merge=False):
+        with self._txn(): self._set(coll, doc_id, data, merge)
+
+    def update(self, coll, doc_id, fields):
+        with self._txn(): self._update(coll, doc_id, fields)
+
+    def delete(self, coll, doc_id):
+        with self._txn(): self._delete(coll, doc_id)
+
+    def batch(self): return _SQLiteBatch(self)
+
+    def transaction(self, fn):
+        with self._txn(): return fn(_SQLiteTx(self))
+
+
+class _SQLiteBatch:
+    def __init__(self, storage):
+        self._s = storage
+        self._ops = []
+
+    def set(self, coll, doc_id, data, merge=False): self._ops.append((self._s._set, (coll, doc_id, data, merge)))
+
+    def update(self, coll, doc_id, fields): self._ops.append((self._s._update, (coll, doc_id, fields)))
+
+    def delete(self, coll, doc_id): self._ops.append((self._s._delete, (coll, doc_id)))
+
+    def commit(self):
+        with self._s._txn():
+            for op, args in self._ops: op(*args)
+        self._ops = []
+
+
+class _SQLiteTx:
+    def __init__(self, storage):
+        self._s = storage
+
+    def get(self, coll, doc_id): return self._s.get(coll, doc_id)
+
+    def set(self, coll, doc_id, data, merge=False): self._s._set(coll, doc_id, data, merge)
+
+    def update(self, coll, doc_id, fields): self._s._update(coll, doc_id, fields)
+
+    def delete(self, coll, doc_id): self._s._delete(coll, doc_id)
+
+
+# --- KONFIGURASI ---
+
+def open_storage(conf, firebase_conf=None):
+    """conf: dict dari secrets [storage] (backend = "firestore" | "sqlite", path = ...).
+    CAT_STORAGE / CAT_SQLITE_PATH di environment menimpa nilai secrets."""
+    backend = os.environ.get('CAT_STORAGE') or conf.get('backend', 'firestore')
+    if backend == 'sqlite':
+        return SQLiteStorage(os.environ.get('CAT_SQLITE_PATH') or conf.get('path', 'data/cat.db'))
+    if backend == 'firestore':
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(firebase_conf()))
+        return FirestoreStorage(firestore.client())
+    raise ValueError(f"backend storage tidak dikenal: {backend}")
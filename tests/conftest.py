@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage import SQLiteStorage  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'cat.db')
+
+
+@pytest.fixture
+def db(db_path):
+    return SQLiteStorage(db_path)
+
+
+def question(mapel, paket, tipe, topik, opsi, kunci, teks='Soal'):
+    return {'mapel': mapel, 'paket': paket, 'tipe': tipe, 'topik': topik, 'pertanyaan': teks, 'gambar': None,
+            'opsi': json.dumps(opsi), 'kunci_jawaban': json.dumps(kunci)}
+
+
+@pytest.fixture
+def app(db_path):
+    """AppTest app.py di atas storage SQLite yang sama dengan fixture db; login(user, role) mengisi sesi."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    def make(user, role='siswa'):
+        # cache_resource hidup sepanjang proses: kosongkan agar storage & bank dibuka ulang per tes
+        st.cache_resource.clear(); st.cache_data.clear()
+        at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=60)
+        at.secrets['storage'] = {'backend': 'sqlite', 'path': db_path}
+        at.secrets['finalizer'] = {'interval': 0}
+        for k, v in {'logged_in': True, 'role': role, 'nama': user.title(), 'username': user}.items(): at.session_state[k] = v
+        return at
+    return make
@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+import analysis
+from compact import pack_bits, unpack_bits
+
+
+def test_absorb_sums_sparse_pool():
+    # Ujian kisi-kisi: tiap hasil hanya memakai sebagian kecil bank soal paket
+    rnd = random.Random(3)
+    pool = [f'q{i:03d}' for i in range(200)]
+    rows = []
+    for _ in range(60):
+        qs = rnd.sample(pool, 10)
+        rows.append({'q_ids': qs, 'codes': [1] * 10, 'tipe': 's' * 10, 'bits': pack_bits([rnd.random() < 0.6 for _ in qs])})
+    state = analysis.empty('M', 'P')
+    analysis._absorb(state, rows[:25]); analysis._absorb(state, rows[25:])
+
+    # Acuan: jumlah per butir dihitung langsung per hasil
+    ref = {}
+    for r in rows:
+        b = dict(zip(r['q_ids'], unpack_bits(r['bits'], 10).astype(int)))
+        t = sum(b.values())
+        for q, x in b.items():
+            acc = ref.setdefault(q, dict.fromkeys(analysis.SUMS, 0.0))
+            acc['n'] += 1; acc['sx'] += x; acc['st'] += t; acc['st2'] += t * t; acc['sxt'] += x * t
+    assert state['attempts'] == 60
+    assert sorted(state['items']) == sorted(ref)
+    for i, q in enumerate(state['items']):
+        for k in analysis.SUMS: assert state[k][i] == pytest.approx(ref[q][k])
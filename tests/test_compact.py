@@ -0,0 +1,22 @@
+import json
+
+import compact
+import export
+from conftest import question
+
+
+def test_migrate_pages(db):
+    db.set('questions', 'q0', question('Matematika', 'Paket 1', 'single', 'Bilangan', ['1', '2'], '2'))
+    det = json.dumps([{'qid': 'q0', 'tanya': 'Soal', 'jawab': '2', 'kunci': '2', 'benar': True, 'topik': 'Bilangan'}])
+    for i in range(2100):
+        r = {'username': 'budi', 'nama': 'Budi', 'mapel': 'Matematika', 'paket': 'Paket 1', 'skor': 100.0,
+             'tanggal': '2026-01-01 10:00', 'details': det, 'topic_analysis': '{}'}
+        if i % 3: r['ts'] = 1.7e9 + i // 70  # sepertiga hasil lama belum punya ts
+        db.set('results', f'r{i:03d}', r)
+    seen = []
+    assert compact.migrate(db, on_progress=seen.append) == 2100
+    assert seen == [export.PAGE, 2 * export.PAGE, 2100]
+    rows = db.query('results')
+    assert not any('details' in r for r in rows)
+    assert all(r['codes'] == [2] and r['enc'] == compact.FORMAT for r in rows)
+    assert compact.migrate(db) == 0
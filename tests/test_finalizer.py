@@ -0,0 +1,45 @@
+import json
+import time
+
+import finalizer
+import stats as class_stats
+from bank import QuestionBank
+from conftest import question
+
+
+def seed(db, n_sessions=3, end_time=None):
+    for i in range(4):
+        db.set('questions', f'q{i}', question('Matematika', 'Paket 1', 'single', 'Bilangan', ['1', '2', '3'], '2', f'Soal {i}'))
+    end_time = end_time or time.time() - finalizer.GRACE - 10
+    for i in range(n_sessions):
+        db.set('exam_sessions', f's{i}', {'username': f'u{i}', 'nama': f'U{i}', 'mapel': 'Matematika', 'paket': 'Paket 1',
+                                          'start_time': end_time - 600, 'end_time': end_time, 'status': 'ongoing', 'score': 0,
+                                          'q_order': json.dumps(['q0', 'q1', 'q2', 'q3']), 'answers': {'q0': '2', 'q1': '2'}, 'ragu': []})
+
+
+def test_finalize_expired_once(db):
+    seed(db)
+    # sesi yang belum lewat masa tenggang tidak disentuh
+    db.set('exam_sessions', 'live', {**db.get('exam_sessions', 's0'), 'username': 'live', 'end_time': time.time() + 600})
+    bank = QuestionBank()
+    assert finalizer.finalize_expired(db, bank, workers=2, batch_size=2) == 3
+    results = db.query('results')
+    assert sorted(r['username'] for r in results) == ['u0', 'u1', 'u2']
+    assert all(r['skor'] == 50 for r in results)
+    assert db.get('exam_sessions', 'live')['status'] == 'ongoing'
+    assert class_stats.summarize(db.query('stats'))['count'] == 3
+
+    assert finalizer.finalize_expired(db, bank) == 0
+    assert len(db.query('results')) == 3
+    assert class_stats.summarize(db.query('stats'))['count'] == 3
+
+
+def test_commit_results_skips_scored_session(db):
+    seed(db, 1)
+    bank = QuestionBank()
+    items = finalizer.score_sessions(db, bank, [{**db.get('exam_sessions', 's0'), 'id': 's0'}])
+    assert finalizer.commit_results(db, items) == ['s0']
+    # penilai kedua (mis. browser siswa bersamaan dengan worker) tidak menulis hasil kedua
+    assert finalizer.commit_results(db, items) == []
+    assert len(db.query('results')) == 1
+    assert db.get('profiles', 'u0')['attempts'] == 1
@@ -0,0 +1,35 @@
+import hashlib
+import io
+
+import pytest
+from PIL import Image
+
+from images import RENDITIONS, DbImageStore, InvalidImage, LocalImageStore
+
+
+def png(size=(1600, 900), color='red'):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+@pytest.fixture(params=['local', 'db'])
+def store(request, tmp_path, db):
+    return LocalImageStore(str(tmp_path / 'img')) if request.param == 'local' else DbImageStore(db)
+
+
+def test_put_same_bytes_same_ref(store):
+    data = png()
+    ref = store.put(data)
+    assert store.put(data) == ref
+    assert store.put(png(color='blue')) != ref
+    for name, side in RENDITIONS.items():
+        img = Image.open(io.BytesIO(store.get(ref, name)))
+        assert max(img.size) == min(side, 1600)
+
+
+@pytest.mark.parametrize('data', [b'%PDF-1.4 bukan gambar', png()[:200], b''])
+def test_put_rejects_invalid(store, data):
+    with pytest.raises(InvalidImage):
+        store.put(data)
+    assert store.get('img:' + hashlib.sha256(data).hexdigest(), 'thumb') is None
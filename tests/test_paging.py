@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import analysis
+from storage import page_after
+
+# Cursor halaman pada field yang tidak unik (ts hasil lama per menit, nama siswa): baris dengan nilai
+# kembar di batas halaman tidak boleh terlewat maupun terulang.
+
+
+def drain(db, coll, where, order_by, limit, desc=False):
+    out, cursor = [], None
+    while True:
+        rows, cursor, done = page_after(db, coll, where, order_by, cursor, limit, desc=desc)
+        out += rows
+        if done: return out
+
+
+@pytest.mark.parametrize('desc', [False, True])
+@pytest.mark.parametrize('limit', [1, 3, 4, 10, 100])
+def test_page_after_ties(db, limit, desc):
+    for i in range(23): db.set('results', f'r{i:02d}', {'username': 'budi', 'ts': float(i // 5)})
+    db.set('results', 'other', {'username': 'ani', 'ts': 2.0})
+    rows = drain(db, 'results', [('username', '==', 'budi')], 'ts', limit, desc)
+    assert sorted(r['id'] for r in rows) == [f'r{i:02d}' for i in range(23)]
+    ts = [r['ts'] for r in rows]
+    assert ts == sorted(ts, reverse=desc)
+
+
+def test_analysis_refresh_ties(db, monkeypatch):
+    monkeypatch.setattr(analysis, 'PAGE', 4)
+    det = json.dumps([{'qid': 'q0', 'tanya': 'Soal 0', 'jawab': '2', 'kunci': '2', 'benar': True, 'topik': 'B'}])
+    res = {'username': 'u', 'mapel': 'M', 'paket': 'P', 'skor': 0.0, 'details': det}
+    for i in range(10): db.set('results', f'r{i}', {**res, 'ts': 1000.0 + 60 * (i // 4)})
+    assert analysis.rebuild(db, 'M', 'P')['attempts'] == 10
+    assert analysis.refresh(db, 'M', 'P')['attempts'] == 10
+    # hasil baru dengan ts yang sama dengan cursor tetap dihitung, sekali
+    for i in range(10, 13): db.set('results', f'r{i}', {**res, 'ts': 1120.0})
+    assert analysis.refresh(db, 'M', 'P')['attempts'] == 13
+    assert analysis.refresh(db, 'M', 'P')['attempts'] == 13
+
+
+def test_history_ties(db, app):
+    # 25 hasil dengan ts kembar per 3 (halaman riwayat 10), ditambah hasil lama tanpa ts (diisi migrasi saat app dibuka)
+    for i in range(25):
+        r = {'username': 'budi', 'nama': 'Budi', 'mapel': 'Matematika', 'paket': 'Paket 1', 'skor': float(i), 'topic_analysis': '{}',
+             'tanggal': f'2026-01-0{1 + i // 10} 10:00'}
+        if i < 20: r['ts'] = 1.7e9 + i // 3
+        db.set('results', f'r{i:02d}', r)
+    at = app('budi').run()
+    while True:
+        more = [b for b in at.button if b.label == 'Muat lebih banyak']
+        if not more: break
+        at = more[0].click().run()
+    skor = sorted(float(e.label.split('Skor: ')[1]) for e in at.expander if 'Skor: ' in e.label)
+    assert skor == [float(i) for i in range(25)]
+
+
+def test_user_list_ties(db, app):
+    for i in range(45):
+        db.set('users', f'siswa{i:03d}', {'username': f'siswa{i:03d}', 'password': 'x', 'nama_lengkap': ['Budi', 'Ani', 'Cici'][i % 3], 'role': 'siswa'})
+    at = app('admin', 'admin')
+    at.session_state['adm_tab'] = '👥 Siswa'
+    at = at.run()
+    at.selectbox(key='us_f').set_value('nama_lengkap')
+    at = at.run()
+    seen = []
+    while True:
+        seen += at.dataframe[0].value['username'].tolist()
+        nxt = [b for b in at.button if b.label == 'Berikutnya ➡️']
+        if not nxt: break
+        at = nxt[0].click().run()
+    assert sorted(seen) == [f'siswa{i:03d}' for i in range(45)]
@@ -0,0 +1,106 @@
+import json
+import random
+
+import pytest
+
+from scoring import compile_keys, score_exam
+
+OPSI = ['A', 'B', 'C', 'D']
+PERNYATAAN = ['p1', 'p2', 'p3']
+
+
+def legacy_correct(tipe, key, ans):
+    # Aturan lama (sebelum format ringkas & kebijakan penilaian)
+    if tipe == 'single': return ans == key
+    if tipe == 'complex': return bool(ans) and set(ans) == set(key)
+    if tipe == 'category': return ans == key
+    return False
+
+
+def legacy_score(q_order, answers, questions):
+    score, topics, benar = 0, {}, []
+    for qid in q_order:
+        q = questions.get(qid)
+        if not q: continue
+        key = json.loads(q['kunci_jawaban'])
+        b = legacy_correct(q['tipe'], key, answers.get(qid))
+        score += b; benar.append(b)
+        t = topics.setdefault(q['topik'], {'correct': 0, 'total': 0})
+        t['total'] += 1; t['correct'] += b
+    return (score / len(q_order)) * 100 if q_order else 0, benar, topics
+
+
+def q(tipe, kunci, opsi, topik='Umum'):
+    return {'tipe': tipe, 'topik': topik, 'pertanyaan': 'Soal', 'opsi': json.dumps(opsi), 'kunci_jawaban': json.dumps(kunci)}
+
+
+def random_question(rnd):
+    tipe = rnd.choice(['single', 'complex', 'category'])
+    topik = rnd.choice(['Bilangan', 'Geometri'])
+    if tipe == 'single':
+        # sesekali kunci di luar opsi (data lama)
+        return q(tipe, rnd.choice(OPSI + ['Z']), OPSI, topik)
+    if tipe == 'complex':
+        return q(tipe, rnd.sample(OPSI, rnd.randint(1, 3)), OPSI, topik)
+    return q(tipe, {p: rnd.choice(['Benar', 'Salah']) for p in PERNYATAAN}, PERNYATAAN, topik)
+
+
+def random_answer(rnd, qd):
+    key = json.loads(qd['kunci_jawaban'])
+    r = rnd.random()
+    if r < 0.3: return key
+    if r < 0.4: return None
+    if qd['tipe'] == 'single': return rnd.choice(OPSI + ['lain', ''])
+    if qd['tipe'] == 'complex':
+        return rnd.choice([[], list(reversed(key)), key + key[:1], rnd.sample(OPSI, rnd.randint(1, 4)), ['X']])
+    ans = {p: rnd.choice(['Benar', 'Salah']) for p in rnd.sample(PERNYATAAN, rnd.randint(0, 3))}
+    return rnd.choice([ans, {**key, 'lain': 'Benar'}, {}])
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_all_or_nothing_matches_legacy(seed):
+    rnd = random.Random(seed)
+    questions = {f'q{i}': random_question(rnd) for i in range(12)}
+    keys = compile_keys({k: v for k, v in questions.items() if k != 'q11'})  # q11: soal sudah dihapus
+    q_order = list(questions)
+    rnd.shuffle(q_order)
+    answers = {qid: a for qid, qd in questions.items() if (a := random_answer(rnd, qd)) is not None}
+    skor, coded, topics = score_exam(q_order, answers, keys)
+    old_skor, old_benar, old_topics = legacy_score(q_order, answers, {k: questions[k] for k in keys})
+    assert skor == pytest.approx(old_skor)
+    assert [bool(b) for b in coded['benar']] == old_benar
+    assert topics == old_topics
+
+
+def test_partial_complex_and_category():
+    keys = compile_keys({'c': q('complex', ['A', 'C'], OPSI), 'k': q('category', {'p1': 'Benar', 'p2': 'Salah', 'p3': 'Benar'}, PERNYATAAN),
+                         's': q('single', 'B', OPSI)})
+    policy = {'mode': 'partial', 'penalty': 0.25}
+    order = ['c', 'k', 's']
+
+    def skor(answers): return score_exam(order, answers, keys, policy)[0]
+    assert skor({'c': ['A', 'C'], 'k': {'p1': 'Benar', 'p2': 'Salah', 'p3': 'Benar'}, 's': 'B'}) == pytest.approx(100)
+    # PG kompleks: (benar - salah) / jumlah kunci, minimal 0
+    assert skor({'c': ['A']}) == pytest.approx(0.5 / 3 * 100)
+    assert skor({'c': ['A', 'B', 'C']}) == pytest.approx(0.5 / 3 * 100)
+    assert skor({'c': ['B', 'D']}) == 0
+    # Benar/Salah: per pernyataan; PG tunggal tetap benar semua
+    assert skor({'k': {'p1': 'Benar', 'p2': 'Benar'}}) == pytest.approx(1 / 3 / 3 * 100)
+    assert skor({'s': 'C'}) == 0
+    # bit benar tetap "sama persis dengan kunci"
+    assert list(score_exam(order, {'c': ['A']}, keys, policy)[1]['benar']) == [False, False, False]
+
+
+def test_negative_penalty_and_floor():
+    keys = compile_keys({f's{i}': q('single', 'A', OPSI) for i in range(4)})
+    policy = {'mode': 'negative', 'penalty': 0.25}
+    order = list(keys)
+
+    def skor(answers): return score_exam(order, answers, keys, policy)[0]
+    assert skor({'s0': 'A', 's1': 'A', 's2': 'B'}) == pytest.approx((2 - 0.25) / 4 * 100)
+    # kosong tidak dikurangi
+    assert skor({'s0': 'A'}) == pytest.approx(25)
+    # jawaban di luar opsi tetap dihitung salah
+    assert skor({'s0': 'A', 's1': 'lain'}) == pytest.approx((1 - 0.25) / 4 * 100)
+    # skor akhir tidak negatif
+    assert skor({'s0': 'B', 's1': 'C'}) == 0
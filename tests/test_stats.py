@@ -0,0 +1,68 @@
+import json
+import time
+
+import pytest
+
+import finalizer
+import profiles
+import stats as class_stats
+from bank import QuestionBank
+from conftest import question
+
+
+def seed(db):
+    for i in range(4):
+        db.set('questions', f'q{i}', question('Matematika', 'Paket 1', 'single', 'Bilangan', ['1', '2', '3'], '2', f'Soal {i}'))
+
+
+def finish(db, sid, username, answers, end_time=None):
+    """Sesi ongoing yang langsung dinilai lewat jalur finalizer."""
+    db.set('exam_sessions', sid, {'username': username, 'nama': username.title(), 'mapel': 'Matematika', 'paket': 'Paket 1',
+                                  'start_time': time.time() - 600, 'end_time': end_time or time.time() + 600, 'status': 'ongoing',
+                                  'score': 0, 'q_order': json.dumps(['q0', 'q1', 'q2', 'q3']), 'answers': answers, 'ragu': []})
+    items = finalizer.score_sessions(db, QuestionBank(), [{**db.get('exam_sessions', sid), 'id': sid}])
+    return finalizer.commit_results(db, items)
+
+
+def snapshot(db):
+    sm = class_stats.summarize(class_stats.load(db))
+    return sm['count'], sm['mean'], sm['max'], sm['users'], sm['hist'], class_stats.leaderboard(db, 'Matematika', 'Paket 1')
+
+
+def test_rebuild_matches_incremental(db):
+    seed(db)
+    for i in range(30): finish(db, f's{i}', f'u{i % 12}', {f'q{j}': '2' for j in range(i % 5)})
+    before = snapshot(db)
+    assert class_stats.rebuild(db) == 1
+    assert snapshot(db) == before
+    # tersebar ke beberapa shard, bukan semua di shard 0
+    shards = class_stats.load(db)
+    assert len(shards) > 1 and all(len(s['users']) < 12 for s in shards)
+
+
+def test_rebuild_refused_while_exam_running(db):
+    seed(db)
+    finish(db, 's0', 'u0', {'q0': '2'})
+    db.set('exam_sessions', 'live', {**db.get('exam_sessions', 's0'), 'status': 'ongoing'})
+    with pytest.raises(class_stats.Busy):
+        class_stats.rebuild(db)
+    with pytest.raises(class_stats.Busy):
+        finalizer.rescore(db, 'Matematika', 'Paket 1')
+
+
+def test_rebuild_redoes_when_result_arrives(db, monkeypatch):
+    # Sesi yang dimulai setelah pengecekan & dinilai di tengah rebuild tidak boleh hilang dari hitungan
+    seed(db)
+    for i in range(3): finish(db, f's{i}', f'u{i}', {'q0': '2'})
+    real, calls = class_stats.pages, []
+
+    def pages(db_, **kw):
+        calls.append(1)
+        for rows in real(db_, **kw):
+            yield rows
+            if len(calls) == 1: finish(db, 'late', 'late', {'q0': '2', 'q1': '2'})
+    monkeypatch.setattr(class_stats, 'pages', pages)
+    class_stats.rebuild(db)
+    assert len(calls) == 2
+    assert snapshot(db)[0] == 4
+    assert profiles.rebuild(db) == 4